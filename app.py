@@ -1,17 +1,19 @@
 import os
 import threading
+import tempfile
 import logging
 from dotenv import load_dotenv
 import sys
-from flask import Flask, render_template_string, request, redirect, url_for, flash, session, send_from_directory, jsonify
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, session, send_from_directory, jsonify
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 import smtplib
 import base64
 import json
+import hashlib
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
 from flask_migrate import Migrate
@@ -22,7 +24,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import re
 from random import randint
 # from flask_mail import Mail, Message
-from models import db, User, LicenseKey, Note, VerificationCode
+from models import db, User, LicenseKey, Note, VerificationCode, SavedAudience
 from cryptography.fernet import Fernet
 from werkzeug.exceptions import RequestEntityTooLarge
 import magic  # Upewnij się, że ta biblioteka jest zainstalowana
@@ -33,12 +35,19 @@ import mimetypes
 import ssl
 from models import PASTEL_COLORS
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
-from collections import defaultdict
+from sheet_cache import SnapshotCache, RedisSnapshotStore, SnapshotFile, RedisEmailLanguageIndex, RedisFragmentStore
+from sheets_client import SheetsClientFactory
+from sheet_columns import ColumnarSheet, projected_ranges
+from sheet_schema import SchemaTracker, header_names_from_env
+from sheet_index import build_aggregates, build_ordering, highlight_label
+from audience_index import AudienceIndex, is_empty_selection, is_valid_selection
+from http_cache import conditional_response
 
 # ------------------------------
 # KONFIGURACJA CELERY W TYM SAMYM PLIKU
 # ------------------------------
 from celery import Celery
+import redis
 
 # Wczytanie zmiennych środowiskowych (lokalnie z .env, na Heroku z Config Vars)
 load_dotenv()
@@ -54,6 +63,8 @@ if redis_url.startswith("rediss://"):
         redis_url = urlunparse((parsed.scheme, parsed.netloc, parsed.path, parsed.params, new_query, parsed.fragment))
 
 celery_app = Celery("app", broker=redis_url, backend=redis_url)
+# Klient Redis dla danych aplikacji (m.in. wspólny cache arkusza)
+redis_client = redis.Redis.from_url(redis_url, socket_connect_timeout=2, socket_timeout=2)
 if redis_url.startswith("rediss://"):
     celery_app.conf.update(
         broker_transport_options={'visibility_timeout': 3600, 'ssl_cert_reqs': 'CERT_NONE'},
@@ -69,6 +80,16 @@ app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Szablony z katalogu templates/ są kompilowane raz na proces; skompilowany kod
+# trafia też do cache na dysku, więc kolejne procesy (gunicorn, restarty) nie
+# parsują ich od nowa. Cache można wypełnić przy budowaniu:
+# `flask --app app precompile-templates` (klucz uwzględnia treść szablonu)
+JINJA_BYTECODE_CACHE_DIR = os.getenv(
+    'JINJA_BYTECODE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ranges_jinja_bytecode')
+)
+os.makedirs(JINJA_BYTECODE_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_BYTECODE_CACHE_DIR)
+
 # Konfiguracja bazy danych (Heroku/Postgres lub SQLite)
 database_url = os.getenv("DATABASE_URL")
 if database_url:
@@ -144,11 +165,36 @@ app.config['MAX_ATTACHMENTS'] = 5
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 SPREADSHEET_ID = os.getenv('SPREADSHEET_ID', '')
+# Klient Sheets API współdzielony w procesie (te same dane konta serwisowego co GCS)
+sheets_client = SheetsClientFactory(creds_info, SCOPES)
+# Czas (w sekundach), po którym zrzut arkusza jest odświeżany w tle
+SHEET_CACHE_TTL = int(os.getenv('SHEET_CACHE_TTL', 300))
+# Tryb pobierania arkusza: 'projected' (tylko używane kolumny przez batchGet)
+# lub 'full' (cały zakres A1:AX)
+SHEET_FETCH_MODE = os.getenv('SHEET_FETCH_MODE', 'projected')
+# Aktualizacja przyrostowa agregatów (tylko zmienione wiersze) zamiast pełnego przeliczenia
+SHEET_INCREMENTAL_SYNC = os.getenv('SHEET_INCREMENTAL_SYNC', '1') == '1'
+# Nazwy nagłówków (wiersz 1) dla pól arkusza, np. SHEET_HEADER_SEGMENT="Segment",
+# SHEET_HEADER_POSSIBILITIES="Możliwość"; pola bez nazwy są czytane z domyślnych
+# kolumn (Q, R, U, X, Z..AH, AT, AU, AV, AX)
+SHEET_HEADER_RANGE = 'A1:ZZ1'
+sheet_schema = SchemaTracker(header_names_from_env(os.environ))
+# Okresowe odświeżanie arkusza przez Celery beat (proces "sheets" w Procfile);
+# procesy web wtedy tylko czytają opublikowane zrzuty
+SHEET_BEAT_REFRESH = os.getenv('SHEET_BEAT_REFRESH', '1') == '1'
+SHEET_REFRESH_INTERVAL = int(os.getenv('SHEET_REFRESH_INTERVAL', 300))
+# Plik zrzutu mapowany (mmap) przez wszystkie procesy na maszynie; pusta wartość wyłącza
+SHEET_SNAPSHOT_PATH = os.getenv(
+    'SHEET_SNAPSHOT_PATH',
+    os.path.join(tempfile.gettempdir(), f"sheet_snapshot_{SPREADSHEET_ID}.bin")
+)
+# Rozmiar strony adresów listy ładowanej po rozwinięciu (/audience/members)
+AUDIENCE_PAGE_SIZE = int(os.getenv('AUDIENCE_PAGE_SIZE', 200))
+AUDIENCE_PAGE_MAX = 1000
 
 def highlight_triple_brackets(text):
-    pattern = r"\[\[\[(.*?)\]\]\]"
-    replacement = r'<span style="color: orange; white-space: nowrap; margin: 0 3px;">\1</span>'
-    return re.sub(pattern, replacement, text)
+    # Wynik jest zapamiętywany dla każdej unikalnej etykiety (sheet_index.highlight_label)
+    return highlight_label(text)
 
 def is_allowed_file(file):
     if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in ALLOWED_EXTENSIONS:
@@ -239,34 +285,327 @@ EMAIL_SIGNATURE_TEMPLATE = """
 </table>
 """
 
-# Przykładowa funkcja pobierająca dane z Google Sheet (jeśli potrzebne)
-def get_data_from_sheet():
-    credentials_b64 = os.getenv('GOOGLE_CREDENTIALS_BASE64')
-    if credentials_b64:
-        credentials_json = base64.b64decode(credentials_b64).decode('utf-8')
-        credentials_info = json.loads(credentials_json)
-        credentials = service_account.Credentials.from_service_account_info(credentials_info, scopes=SCOPES)
-    else:
-        raise ValueError("GOOGLE_CREDENTIALS_BASE64 not set in environment variables.")
-    
-    service = build('sheets', 'v4', credentials=credentials)
-    sheet = service.spreadsheets()
-    RANGE_NAME = 'A1:AX'  # 50 kolumn
-    
-    result = sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME).execute()
-    data = result.get('values', [])
+# Pobranie danych bezpośrednio z Google Sheet (zawsze zapytanie do API)
+def fetch_data_from_sheet():
+    # Klient wypożyczony ze wspólnej puli procesu na czas pobrania
+    with sheets_client.spreadsheets() as sheet:
+        if SHEET_FETCH_MODE == 'projected':
+            return fetch_projected_columns(sheet)
+
+        RANGE_NAME = 'A1:AX'  # 50 kolumn
 
-    # Uzupełnianie brakujących kolumn do 50
-    for i, row in enumerate(data):
-        if len(row) < 50:
-            row.extend([''] * (50 - len(row)))
-        print(f"Wiersz {i+1} ma {len(row)} kolumn")
+        result = sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME).execute()
+    data = result.get('values', [])
 
-    # Pomijamy pierwszy wiersz (nagłówek), aby zignorować m.in. komórki Z1..AH1
+    # Pierwszy wiersz to nagłówek: wyznacza mapowanie kolumn (schemat), a same
+    # dane zaczynają się od drugiego wiersza
     if data:
+        sheet_schema.update(data[0])
         data = data[1:]
-    
-    return data
+
+    # Zapamiętujemy tylko używane kolumny, w postaci kolumnowej (zamiast
+    # uzupełniania każdego wiersza do 50 napisów)
+    return ColumnarSheet.from_rows(data, schema=sheet_schema.schema)
+
+
+def batch_get_columns(sheet, schema, with_header=False):
+    """
+    Jedno zapytanie batchGet o kolumny schematu (kolumnami i bez formatowania),
+    opcjonalnie razem z wierszem nagłówka. Zwraca (nagłówek lub None,
+    {kolumna arkusza: wartości od wiersza 2}).
+    """
+    ranges = projected_ranges(schema.source_columns)
+    a1_ranges = [a1_range for a1_range, _ in ranges]
+    if with_header:
+        a1_ranges.insert(0, SHEET_HEADER_RANGE)
+    result = sheet.values().batchGet(
+        spreadsheetId=SPREADSHEET_ID,
+        ranges=a1_ranges,
+        majorDimension='COLUMNS',
+        valueRenderOption='UNFORMATTED_VALUE',
+        dateTimeRenderOption='FORMATTED_STRING',
+        fields='valueRanges/values'
+    ).execute()
+
+    value_ranges = result.get('valueRanges', [])
+    header = None
+    if with_header:
+        header = [column[0] if column else '' for column in (value_ranges[0].get('values', []) if value_ranges else [])]
+        value_ranges = value_ranges[1:]
+
+    column_values = {}
+    for (_, first_column), value_range in zip(ranges, value_ranges):
+        for offset, values in enumerate(value_range.get('values', [])):
+            column_values[first_column + offset] = values
+    return header, column_values
+
+
+def fetch_projected_columns(sheet):
+    """
+    Pobiera wyłącznie używane kolumny (domyślnie Q:R, U, X, Z:AH, AT:AV, AX)
+    jednym zapytaniem batchGet i skleja je w ColumnarSheet. Nagłówek (wiersz 1)
+    jest pomijany już w zakresach; gdy skonfigurowano nazwy nagłówków, jest
+    pobierany w tym samym zapytaniu i przy zmianie układu kolumn dane są
+    pobierane ponownie według nowego schematu.
+    """
+    schema = sheet_schema.schema
+    header, column_values = batch_get_columns(sheet, schema, with_header=sheet_schema.uses_header)
+    if header is not None and sheet_schema.update(header):
+        schema = sheet_schema.schema
+        _, column_values = batch_get_columns(sheet, schema)
+    return ColumnarSheet.from_columns(schema.remap_columns(column_values))
+
+
+# Cache zrzutu arkusza współdzielony przez wszystkie żądania w procesie
+# (L1), przed którym stoi wspólny dla wszystkich procesów magazyn w Redisie (L2)
+sheet_store = RedisSnapshotStore(redis_client, namespace=f"sheet_snapshot:{SPREADSHEET_ID}")
+# Przy odświeżaniu przez beat procesy pobierają dane same dopiero, gdy opublikowany
+# zrzut jest wyraźnie starszy niż interwał odświeżania (np. proces "sheets" nie działa)
+sheet_cache = SnapshotCache(
+    fetch_data_from_sheet,
+    ttl=SHEET_CACHE_TTL,
+    store=sheet_store,
+    store_max_age=3 * SHEET_REFRESH_INTERVAL if SHEET_BEAT_REFRESH else None,
+    snapshot_file=SnapshotFile(SHEET_SNAPSHOT_PATH) if SHEET_SNAPSHOT_PATH else None,
+    # Zapisane grupy odbiorców nadążają za arkuszem także bez Celery beat
+    on_new_version=lambda snapshot: refresh_saved_audiences_once(snapshot)
+)
+email_language_index = RedisEmailLanguageIndex(redis_client, namespace=f"email_language:{SPREADSHEET_ID}")
+# Fragmenty HTML zależne tylko od zrzutu (listy panelu bocznego), wspólne dla procesów
+fragment_store = RedisFragmentStore(redis_client, namespace=f"fragments:{SPREADSHEET_ID}")
+SIDEBAR_LISTS_TEMPLATE = '_sidebar_lists.html'
+
+
+def get_data_from_sheet():
+    """
+    Zwraca wiersze arkusza z cache (ColumnarSheet – iteracja daje wiersze,
+    w których row[i] działa jak dawniej). Po rozgrzaniu cache żądanie nigdy
+    nie czeka na Google – przeterminowane dane są odświeżane w tle.
+    """
+    return sheet_cache.get().rows
+
+
+def get_sheet_snapshot():
+    """
+    Zwraca bieżący zrzut arkusza (SheetSnapshot) z cache – wiersze wraz
+    z wersją i strukturami pochodnymi wyliczanymi raz na wersję.
+    """
+    return sheet_cache.get()
+
+
+def get_sheet_aggregates(snapshot):
+    """
+    Zwraca agregaty arkusza (segmenty, możliwości, potencjalni klienci,
+    mapa e-mail -> język, indeks segmentów) wyliczone w jednym przebiegu
+    i zapamiętane dla wersji zrzutu.
+    """
+    return snapshot.derive(
+        'aggregates',
+        lambda s: build_aggregates(s, get_segments(), incremental=SHEET_INCREMENTAL_SYNC)
+    )
+
+
+def get_email_languages(emails):
+    """
+    Zwraca {email: język} dla podanych adresów bez pobierania arkusza:
+      1. z agregatów zrzutu, jeśli proces już je ma w pamięci,
+      2. z indeksu w Redisie (jedno HMGET), utrzymywanego przez refresh_sheet_snapshot,
+      3. w ostateczności z agregatów bieżącego zrzutu (może wymagać pobrania).
+    """
+    snapshot = sheet_cache.peek()
+    aggregates = snapshot.peek('aggregates') if snapshot is not None else None
+    if aggregates is None:
+        try:
+            languages = email_language_index.languages(emails)
+            if languages is not None:
+                return languages
+        except Exception as e:
+            app.logger.warning(f"Indeks e-mail -> język w Redisie niedostępny: {e}")
+        aggregates = get_sheet_aggregates(get_sheet_snapshot())
+
+    email_language = aggregates.email_language
+    return {email: email_language[email] for email in emails if email in email_language}
+
+
+def get_audience_index(snapshot):
+    """
+    Zwraca bitmapowy indeks odbiorców (AudienceIndex) zapamiętany dla wersji zrzutu.
+    """
+    return snapshot.derive('audience', lambda s: AudienceIndex(get_sheet_aggregates(s)))
+
+
+def resolve_recipients(selection, language, snapshot=None):
+    """
+    Zamienia deskryptor zaznaczenia (segmenty, możliwości, grupy, wykluczenia,
+    pojedyncze adresy) na zbiór unikalnych adresów w wybranym języku.
+    Adresy spoza indeksu odbiorców (np. użytkownicy z notatek) są filtrowane
+    po mapie e-mail -> język, tak jak dotąd.
+
+    Bez `snapshot` korzysta z bieżącego zrzutu.
+    """
+    audience = get_audience_index(snapshot or get_sheet_snapshot())
+    bits, unknown = audience.resolve(selection)
+    return audience.recipients(bits, language, unknown, get_unknown_languages(unknown, snapshot))
+
+
+def get_unknown_languages(unknown, snapshot=None):
+    """
+    {email: język} dla adresów spoza indeksu odbiorców – z agregatów podanego
+    zrzutu, a bez niego tak jak przy wysyłce (get_email_languages). Wspólne
+    dla wysyłki i licznika odbiorców, więc licznik pokazuje to, co zostanie wysłane.
+    """
+    if not unknown:
+        return {}
+    if snapshot is not None:
+        email_language = get_sheet_aggregates(snapshot).email_language
+        return {email: email_language[email] for email in unknown if email in email_language}
+    return get_email_languages(unknown)
+
+
+def saved_audience_to_dict(audience):
+    return {
+        'id': audience.id,
+        'name': audience.name,
+        'language': audience.language,
+        'recipient_count': audience.recipient_count,
+        'new_since_send': audience.new_since_send,
+        'last_sent_at': audience.last_sent_at.isoformat() if audience.last_sent_at else None,
+        'snapshot_version': audience.snapshot_version
+    }
+
+
+def refresh_saved_audiences(snapshot):
+    """
+    Odświeża zmaterializowane zbiory zapisanych grup odbiorców dla nowej
+    wersji zrzutu. Grupy już policzone dla tej wersji albo z nowszego zrzutu
+    (proces może zainstalować starszy zrzut z pliku lub Redisa) są pomijane,
+    a kolumny z adresami są zapisywane tylko wtedy, gdy zbiór faktycznie się
+    zmienił. Wymaga kontekstu aplikacji.
+    """
+    audiences = SavedAudience.query.filter(
+        (SavedAudience.snapshot_version.is_(None)) | (SavedAudience.snapshot_version != snapshot.version),
+        (SavedAudience.snapshot_fetched_at.is_(None)) | (SavedAudience.snapshot_fetched_at < snapshot.fetched_at)
+    ).all()
+    changed = 0
+    for audience in audiences:
+        try:
+            selection = json.loads(audience.selection)
+        except ValueError:
+            selection = None
+        if not is_valid_selection(selection):
+            app.logger.warning(f"Nieprawidłowa definicja grupy odbiorców {audience.id}.")
+            continue
+        added, removed = audience.set_recipients(
+            resolve_recipients(selection, audience.language, snapshot), snapshot.version, snapshot.fetched_at
+        )
+        if added or removed:
+            changed += 1
+            audience.updated_at = datetime.utcnow()
+    db.session.commit()
+    return {'checked': len(audiences), 'changed': changed}
+
+
+def refresh_saved_audiences_once(snapshot):
+    """
+    refresh_saved_audiences() dla nowej wersji zrzutu, wykonywane w jednym
+    procesie naraz (blokada w Redisie na wersję) – wywoływane przez zadanie
+    odświeżania i przez sheet_cache przy każdej nowej wersji danych, więc
+    grupy są aktualne także tam, gdzie beat nie działa. Zwraca wynik
+    odświeżenia albo None, jeśli tę wersję odświeża już inny proces.
+    """
+    lock = None
+    try:
+        lock = redis_client.lock(f"saved_audiences_refresh:{SPREADSHEET_ID}:{snapshot.version}", timeout=300)
+        if not lock.acquire(blocking=False):
+            return None
+    except Exception as e:
+        # Bez Redisa odświeżamy i tak – grupy już policzone dla tej wersji są pomijane
+        app.logger.warning(f"Blokada odświeżania grup odbiorców niedostępna: {e}")
+        lock = None
+    try:
+        with app.app_context():
+            try:
+                return refresh_saved_audiences(snapshot)
+            except Exception:
+                db.session.rollback()
+                raise
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except Exception as e:
+                app.logger.warning(f"Nie udało się zwolnić blokady odświeżania grup odbiorców: {e}")
+
+
+def get_sheet_ordering(snapshot):
+    """
+    Zwraca kolejność segmentów i możliwości na stronie głównej, wyliczoną raz
+    dla wersji zrzutu (po aktualizacji przyrostowej sortowane są ponownie
+    tylko zmienione grupy możliwości).
+    """
+    return snapshot.derive('ordering', lambda s: build_ordering(get_sheet_aggregates(s)))
+
+
+_template_versions = {}
+
+
+def template_source_version(*names):
+    """
+    Skrót źródeł szablonów (do kluczy cache i ETagów) – zmienia się przy
+    wdrożeniu nowej wersji szablonu. Liczony raz na proces, chyba że Jinja
+    przeładowuje zmienione szablony (tryb debug).
+    """
+    version = _template_versions.get(names)
+    if version is None or app.jinja_env.auto_reload:
+        digest = hashlib.sha1()
+        for name in names:
+            source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+            digest.update(source.encode('utf-8'))
+        version = _template_versions[names] = digest.hexdigest()[:12]
+    return version
+
+
+def get_sidebar_lists_html(snapshot):
+    """
+    HTML list panelu bocznego (segmenty, możliwości, potencjalni klienci).
+    Jest taki sam dla wszystkich użytkowników aż do zmiany arkusza, więc
+    renderuje się go raz na wersję zrzutu: w procesie (derive) i we wspólnym
+    cache w Redisie, z którego korzystają pozostałe procesy. Wymaga
+    kontekstu aplikacji.
+    """
+    return snapshot.derive('sidebar_lists', _build_sidebar_lists_html)
+
+
+def _build_sidebar_lists_html(snapshot):
+    # Zmiana szablonu (wdrożenie) daje nowy klucz przy tej samej wersji danych
+    version = f"{snapshot.version}:{template_source_version(SIDEBAR_LISTS_TEMPLATE)}"
+    try:
+        html = fragment_store.get('sidebar_lists', version)
+        if html is not None:
+            return html
+    except Exception as e:
+        app.logger.warning(f"Cache fragmentów HTML w Redisie niedostępny: {e}")
+
+    ordering = get_sheet_ordering(snapshot)
+    html = render_template(
+        SIDEBAR_LISTS_TEMPLATE,
+        segments=ordering.segments,
+        possibilities=ordering.possibilities,
+        potential_clients=get_sheet_aggregates(snapshot).potential_clients,
+        highlight_triple_brackets=highlight_triple_brackets
+    )
+    try:
+        fragment_store.put('sidebar_lists', version, html)
+    except Exception as e:
+        app.logger.warning(f"Nie udało się zapisać fragmentu HTML w Redisie: {e}")
+    return html
+
+
+def get_segment_index(snapshot):
+    """
+    Zwraca indeks segment -> podsegment -> kontakty dla danego zrzutu.
+    """
+    return get_sheet_aggregates(snapshot).segment_index
 
 
 # Funkcja zwracająca listę segmentów
@@ -302,266 +641,19 @@ def get_segments():
         "NEW2","NEW3","NEW2025_1", "NEW2025_2", "NEW2025_3", "NEW2025_4", "NEW2025_5"
     ]
 
-# Funkcja licząca unikalne segmenty
-def get_unique_segments_with_counts(data):
-    """
-    Pobiera unikalne segmenty i liczy wystąpienia dla 'Polski' i 'Zagraniczny'.
-    """
-    ordered_segments = get_segments()
-    segments = {segment: {"Polski": 0, "Zagraniczny": 0} for segment in ordered_segments}
-
-    for row in data:
-        if len(row) > 16 and row[16]:
-            segment = row[16]
-            subsegment = row[23] if len(row) > 23 else ""
-            if segment in segments:
-                if subsegment == "Polski":
-                    segments[segment]["Polski"] += 1
-                elif subsegment == "Zagraniczny":
-                    segments[segment]["Zagraniczny"] += 1
-    return segments
-
 # Funkcja pobierająca e-maile dla segmentu
-def get_emails_for_segment(data, segment, subsegment):
-    """
-    Pobiera adresy e-mail dla danego segmentu i podsegmentu.
-    """
-    emails = []
-    for row in data:
-        if len(row) > 23 and row[16] == segment and row[23] == subsegment:
-            email = row[17].strip() if len(row) > 17 else ""
-            if email:
-                emails.append(email)
-    return emails
-
-def get_email_company_pairs_for_segment(data, segment, subsegment):
-    """
-    Pobiera pary adres e-mail i nazwa firmy dla danego segmentu i podsegmentu.
-    """
-    pairs = []
-    for row in data:
-        if len(row) > 23 and row[16] == segment and row[23] == subsegment:
-            email = row[17].strip() if len(row) > 17 else ""
-            company = row[20].strip() if len(row) > 20 else ""
-            if email and company:
-                pairs.append({'email': email, 'company': company})
-    return pairs
-
-def extract_prefix(possibility_str):
-    """
-    Rozdziela przekazany ciąg possibility_str na:
-      - prefix: tekst przed pierwszym [[[ ... ]]] (bez zbędnych spacji)
-      - full_str: oryginalny ciąg possibility_str
-
-    Jeśli possibility_str nie zawiera [[[ ... ]]], prefix = possibility_str (całość).
-    """
-    brackets_regex = re.compile(r'^(.*?)\s*\[\[\[(.*)\]\]\](.*)$')
-    match = brackets_regex.match(possibility_str)
-    if match:
-        prefix = match.group(1).strip()
-        return prefix, possibility_str
-    else:
-        return possibility_str.strip(), possibility_str
-
-
-def get_unique_possibilities_with_counts(data):
-    """
-    Tworzy 2-poziomową strukturę słownika:
-
-      {
-        prefix: {
-            "Polski": liczba wystąpień,
-            "Zagraniczny": liczba wystąpień,
-            "subitems": {
-                full_string: {
-                    "Polski": liczba wystąpień,
-                    "Zagraniczny": liczba wystąpień,
-                    "entries": [
-                        {
-                            'email': ...,
-                            'company': ...,
-                            'subsegment': ...
-                        },
-                        ...
-                    ]
-                },
-                ...
-            }
-        },
-        ...
-      }
-
-    Przykład:
-      {
-        "FCL Road": {
-          "Polski": 3,
-          "Zagraniczny": 5,
-          "subitems": {
-            "FCL Road [[[ West Europe Premium ]]]": {
-               "Polski": 2,
-               "Zagraniczny": 1,
-               "entries": [...],
-            },
-            "FCL Road [[[ Gdańsk - all PL ]]]": {
-               "Polski": 1,
-               "Zagraniczny": 3,
-               "entries": [...],
-            }
-          }
-        },
-        ...
-      }
-    """
-
-    possibilities = {}
-
-    for row in data:
-        # subsegment -> "Polski" / "Zagraniczny"
-        subsegment = row[23].strip() if len(row) > 23 and row[23] else ""
-        email = row[17].strip() if len(row) > 17 else ""
-        company = row[20].strip() if len(row) > 20 else "Nieznana Firma"
-
-        # Kolumny 25..33 = możliwości
-        for i in range(25, 34):
-            raw_possibility = row[i].strip() if len(row) > i and row[i] else ''
-            if raw_possibility:
-                # Wyodrębnij prefix + pełen napis
-                prefix, full_str = extract_prefix(raw_possibility)
-
-                # ---------------------------
-                # 1. Dodaj prefix do słownika
-                # ---------------------------
-                if prefix not in possibilities:
-                    possibilities[prefix] = {
-                        'Polski': 0,
-                        'Zagraniczny': 0,
-                        'subitems': {}
-                    }
-
-                # Zwiększ globalny licznik (prefix)
-                if subsegment == "Polski":
-                    possibilities[prefix]['Polski'] += 1
-                elif subsegment == "Zagraniczny":
-                    possibilities[prefix]['Zagraniczny'] += 1
-
-                # ---------------------------
-                # 2. Dodaj subitem (full_str) do prefixu
-                # ---------------------------
-                if full_str not in possibilities[prefix]['subitems']:
-                    possibilities[prefix]['subitems'][full_str] = {
-                        'Polski': 0,
-                        'Zagraniczny': 0,
-                        'entries': []
-                    }
-
-                # Zwiększ licznik dla subitemu
-                if subsegment == "Polski":
-                    possibilities[prefix]['subitems'][full_str]['Polski'] += 1
-                elif subsegment == "Zagraniczny":
-                    possibilities[prefix]['subitems'][full_str]['Zagraniczny'] += 1
-
-                # Dodaj do entries
-                possibilities[prefix]['subitems'][full_str]['entries'].append({
-                    'email': email,
-                    'company': company,
-                    'subsegment': subsegment
-                })
-
-    return possibilities
-
-def sort_possibilities_by_first_word_and_sum(possibilities_dict):
+def get_emails_for_segment(segment_index, segment, subsegment):
     """
-    Sortowanie możliwości według pierwszego słowa w prefixie.
-    Każda grupa (o tym samym pierwszym słowie) jest trzymana razem,
-    a kolejność grup jest ustalana według najwyższej sumy (Polski+Zagraniczny) w grupie (malejąco).
-    Wewnątrz grupy poszczególne prefixy także sortujemy malejąco po sumie.
+    Pobiera adresy e-mail dla danego segmentu i podsegmentu (z indeksu zrzutu).
     """
-    # 1) Zamień słownik na listę (prefix, data)
-    possibilities_list = list(possibilities_dict.items())
-
-    # 2) Pogrupuj po pierwszym słowie
-    groups = defaultdict(list)
-    for prefix, data in possibilities_list:
-        # Bezpieczne wczytanie pierwszego słowa; jeśli prefix pusty, to first_word = ''
-        prefix_stripped = prefix.strip()
-        if prefix_stripped:
-            first_word = prefix_stripped.split()[0]
-        else:
-            first_word = ''
-        groups[first_word].append((prefix, data))
-
-    # 3) Dla każdej grupy wyznacz maksymalną sumę (Polski + Zagraniczny),
-    #    aby posortować grupy względem siebie.
-    grouped_list = []
-    for first_word, items in groups.items():
-        max_sum_for_group = max(
-            item[1]['Polski'] + item[1]['Zagraniczny']
-            for item in items
-        )
-        # Sortujemy wpisy wewnątrz grupy malejąco po sumie
-        items_sorted = sorted(
-            items,
-            key=lambda x: (x[1]['Polski'] + x[1]['Zagraniczny']),
-            reverse=True
-        )
-        # Dodajemy krotkę (first_word, max_sum_for_group, items_sorted)
-        grouped_list.append((first_word, max_sum_for_group, items_sorted))
-
-    # 4) Sortujemy całe grupy malejąco po max_sum_for_group
-    grouped_list.sort(key=lambda g: g[1], reverse=True)
-
-    # 5) Sklejamy z powrotem w jedną listę
-    final_sorted = []
-    for _, _, items_sorted in grouped_list:
-        final_sorted.extend(items_sorted)
+    return segment_index.emails(segment, subsegment)
 
-    return final_sorted
-
-
-def get_potential_clients(data):
+def get_email_company_pairs_for_segment(segment_index, segment, subsegment):
     """
-    Pobiera potencjalnych klientów z danych arkusza.
-
-    Kolumny:
-        - AT: Nazwa firmy (45)
-        - AU: Adres email (46)
-        - AV: Grupa (47)
-        - AX: Język (49)
-
-    Zwraca:
-        Słownik z grupami jako kluczami, a listami klientów jako wartościami.
+    Pobiera pary adres e-mail i nazwa firmy dla danego segmentu i podsegmentu
+    (z indeksu zrzutu).
     """
-    potential_clients = {}
-    for idx, row in enumerate(data):
-        print(f"Wiersz {idx} ma długość {len(row)}")
-        if len(row) > 49:
-            group = row[47]  # AV
-            email = row[46]  # AU
-            company = row[45]  # AT
-            language = row[49]  # AX
-            print(f"Wiersz {idx}: group='{group}', email='{email}', company='{company}', language='{language}'")
-            if group and email and company and language:
-                group = group.strip()
-                email = email.strip()
-                company = company.strip()
-                language = language.strip()
-                if group not in potential_clients:
-                    potential_clients[group] = []
-                potential_clients[group].append({
-                    'email': email,
-                    'company': company,
-                    'language': language
-                })
-            else:
-                print(f"Wiersz {idx} pominięty z powodu brakujących danych.")
-        else:
-            print(f"Wiersz {idx} pominięty z powodu niewystarczającej długości.")
-    # Logowanie liczby grup i klientów
-    print(f"Pobrano {len(potential_clients)} grup potencjalnych klientów.")
-    total_clients = sum(len(clients) for clients in potential_clients.values())
-    print(f"Pobrano {total_clients} potencjalnych klientów.")
-    return potential_clients
-
+    return segment_index.pairs(segment, subsegment)
 
 # Funkcja: Wysyłanie pojedynczego e-maila
 def send_email(to_email, subject, body, user, attachments=None):
@@ -679,6 +771,50 @@ def format_phone_number(phone_number):
 # -------------
 # CELERY TASK
 # -------------
+@celery_app.task
+def refresh_sheet_snapshot():
+    """
+    Zadanie Celery (uruchamiane przez beat lub ręcznie): pobiera arkusz
+    z Google, publikuje zrzut w Redisie i buduje jego struktury pochodne.
+    """
+    snapshot = sheet_cache.refresh(force=True)
+    aggregates = get_sheet_aggregates(snapshot)
+    result = {
+        'version': snapshot.version,
+        'rows': len(snapshot.rows),
+        'possibilities': len(aggregates.possibilities),
+        'potential_clients': len(aggregates.potential_clients)
+    }
+    try:
+        email_language_index.publish(snapshot.version, aggregates.email_language)
+    except Exception as e:
+        app.logger.error(f"Błąd publikacji indeksu e-mail -> język: {e}")
+    with app.app_context():
+        try:
+            result['saved_audiences'] = refresh_saved_audiences_once(snapshot)
+        except Exception as e:
+            app.logger.error(f"Błąd odświeżania zapisanych grup odbiorców: {e}")
+        # Listy panelu bocznego gotowe w Redisie, zanim ktokolwiek otworzy stronę
+        try:
+            get_sidebar_lists_html(snapshot)
+        except Exception as e:
+            app.logger.error(f"Błąd renderowania list panelu bocznego: {e}")
+    return result
+
+
+if SHEET_BEAT_REFRESH:
+    celery_app.conf.beat_schedule = {
+        'refresh-sheet-snapshot': {
+            'task': 'app.refresh_sheet_snapshot',
+            'schedule': SHEET_REFRESH_INTERVAL,
+        },
+    }
+# Odświeżanie arkusza ma własną kolejkę, żeby nie czekało za masową wysyłką e-maili
+celery_app.conf.task_routes = {
+    'app.refresh_sheet_snapshot': {'queue': 'sheets'},
+}
+
+
 @celery_app.task(bind=True)
 def send_bulk_emails(self, emails, subject, body, user_id, attachments_data=None):
     """
@@ -763,20 +899,6 @@ def test_email():
     return redirect(url_for('index'))
 
 
-def get_email_subsegment_mapping(data):
-    """
-    Zwraca słownik mapujący adresy e-mail do podsegmentów ('Polski' lub 'Zagraniczny').
-    """
-    email_subsegment = {}
-    for row in data:
-        if len(row) > 23:
-            email = row[17].strip() if len(row) > 17 else ""
-            subsegment = row[23] if len(row) > 23 else ""
-            if email and subsegment:
-                email_subsegment[email] = subsegment
-    return email_subsegment
-
-
 @app.route('/send_message', methods=['POST'])
 def send_message():
     """
@@ -861,8 +983,18 @@ def send_message_ajax():
     subject = request.form.get('subject')
     message = request.form.get('message')
     recipients = request.form.get('recipients', '')
+    selection_json = request.form.get('selection')
     language = request.form.get('language', '').strip()
 
+    # Zapisana grupa odbiorców: gotowy, zmaterializowany zbiór adresów i jej język
+    saved_audience = None
+    audience_id = request.form.get('audience_id', '').strip()
+    if audience_id:
+        saved_audience = SavedAudience.query.filter_by(id=audience_id, user_id=user_id).first() if audience_id.isdigit() else None
+        if saved_audience is None:
+            return jsonify({'success': False, 'message': 'Nie znaleziono grupy odbiorców.'}), 404
+        language = saved_audience.language
+
     # Walidacja
     if not subject or not message:
         return jsonify({
@@ -876,7 +1008,18 @@ def send_message_ajax():
             'message': 'Nie wybrano języka (Polski / Zagraniczny).'
         }), 400
 
-    # 3. Rozbicie recipients na unikalny zestaw e-maili (set) -> unikamy duplikatów
+    # 3. Odbiorcy: deskryptor zaznaczenia rozwijany po stronie serwera
+    #    albo (dla starszych klientów) lista adresów w polu recipients
+    selection = None
+    if selection_json:
+        try:
+            selection = json.loads(selection_json)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Nieprawidłowe zaznaczenie odbiorców.'}), 400
+        if not is_valid_selection(selection):
+            return jsonify({'success': False, 'message': 'Nieprawidłowe zaznaczenie odbiorców.'}), 400
+
+    # Rozbicie recipients na unikalny zestaw e-maili (set) -> unikamy duplikatów
     valid_emails = set()
     raw_recipients = recipients.replace(';', ',')  # Zamień średniki na przecinki, jeśli użytkownik je wprowadził
     for email in raw_recipients.split(','):
@@ -884,8 +1027,16 @@ def send_message_ajax():
         if clean:
             valid_emails.add(clean)
 
+    # Zapisana grupa wyklucza zaznaczenie – inaczej zaznaczone adresy byłyby
+    # po cichu pominięte
+    if saved_audience is not None and (valid_emails or (selection is not None and not is_empty_selection(selection))):
+        return jsonify({
+            'success': False,
+            'message': 'Wybrano zapisaną grupę odbiorców i jednocześnie zaznaczono adresy – wybierz jedno z nich.'
+        }), 400
+
     # Jeśli mimo wszystko nie mamy żadnych adresów
-    if not valid_emails:
+    if saved_audience is None and selection is None and not valid_emails:
         return jsonify({
             'success': False,
             'message': 'Proszę wybrać przynajmniej jeden adres e-mail.'
@@ -921,29 +1072,25 @@ def send_message_ajax():
                 'message': f'Nieprawidłowy typ pliku: {file.filename}'
             }), 400
 
-    # 5. (Przykład) – pobranie arkusza Google i mapowanie e-mail -> język
-    data = get_data_from_sheet()
-    email_language_map = {}
-
-    for row_index, row in enumerate(data):
-        # Segmenty / możliwości: row[17] = e-mail, row[23] = subsegment
-        if len(row) > 23 and row[17] and row[23]:
-            em = row[17].strip()
-            subseg = row[23].strip()
-            email_language_map[em] = subseg
-
-        # Potencjalni klienci: row[46] = e-mail, row[49] = język
-        if len(row) > 49 and row[46] and row[49]:
-            em = row[46].strip()
-            lng = row[49].strip()
-            email_language_map[em] = lng
-
-    # 6. Filtrowanie e-maili pod kątem wybranego języka
-    filtered_emails = set()
-    for e in valid_emails:
-        mail_lang = email_language_map.get(e, "")
-        if mail_lang == language:
-            filtered_emails.add(e)
+    if saved_audience is not None:
+        # 5-6. Zbiór zapisanej grupy jest już policzony – bez rozwijania zaznaczenia
+        filtered_emails = saved_audience.recipient_set()
+    elif selection is not None:
+        # 5-6. Unikalni odbiorcy w wybranym języku wprost z indeksu odbiorców
+        filtered_emails = resolve_recipients(selection, language)
+        if valid_emails:
+            email_language_map = get_email_languages(valid_emails)
+            filtered_emails.update(e for e in valid_emails if email_language_map.get(e, "") == language)
+    else:
+        # 5. Mapowanie e-mail -> język tylko dla wybranych adresów (bez pobierania arkusza)
+        email_language_map = get_email_languages(valid_emails)
+
+        # 6. Filtrowanie e-maili pod kątem wybranego języka
+        filtered_emails = set()
+        for e in valid_emails:
+            mail_lang = email_language_map.get(e, "")
+            if mail_lang == language:
+                filtered_emails.add(e)
 
     if not filtered_emails:
         return jsonify({
@@ -966,13 +1113,6 @@ def send_message_ajax():
             user_id,
             attachment_data  # <-- tu kluczowa zmiana (listę załączników z base64)
         )
-
-        return jsonify({
-            'success': True,
-            'message': f'Rozpoczęto wysyłanie wiadomości (język: {language}).',
-            'task_id': task.id
-        }), 200
-
     except Exception as e:
         app.logger.error(f'Błąd: {e}')
         return jsonify({
@@ -980,6 +1120,27 @@ def send_message_ajax():
             'message': 'Błąd podczas wysyłania.'
         }), 500
 
+    # 8. Wysyłka jest już w kolejce – błąd zapisu informacji o niej w grupie
+    #    odbiorców nie może być zgłoszony jako nieudana wysyłka
+    message_text = f'Rozpoczęto wysyłanie wiadomości (język: {language}).'
+    audience_data = None
+    if saved_audience is not None:
+        try:
+            saved_audience.mark_sent(datetime.utcnow())
+            db.session.commit()
+            audience_data = saved_audience_to_dict(saved_audience)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Błąd zapisu wysyłki do grupy odbiorców {saved_audience.id}: {e}")
+            message_text += ' Nie udało się zapisać informacji o wysyłce w grupie odbiorców.'
+
+    return jsonify({
+        'success': True,
+        'message': message_text,
+        'task_id': task.id,
+        'audience': audience_data
+    }), 200
+
 
 
 # Funkcja zatrzymująca proces wysyłania (opcjonalna)
@@ -1152,6 +1313,174 @@ def delete_all_notes_ajax():
         return jsonify({'success': False, 'message': 'Błąd podczas usuwania notatek.'}), 500
 
 
+@app.route('/sheet_cache_stats')
+def sheet_cache_stats():
+    """
+    Statystyki cache arkusza (trafienia, chybienia, wiek i wersja zrzutu).
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Nie jesteś zalogowany.'}), 401
+    return jsonify(sheet_cache.stats())
+
+
+@app.route('/audience/count', methods=['POST'])
+def audience_count():
+    """
+    Liczba unikalnych odbiorców dla bieżącego zaznaczenia (segmenty,
+    możliwości, grupy potencjalnych klientów, pojedyncze adresy), łącznie
+    i w podziale na języki – liczona na bitmapach indeksu odbiorców.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Nie jesteś zalogowany.'}), 401
+
+    selection = request.get_json(silent=True) or {}
+    if not is_valid_selection(selection):
+        return jsonify({'success': False, 'message': 'Nieprawidłowe zaznaczenie odbiorców.'}), 400
+    snapshot = get_sheet_snapshot()
+    audience = get_audience_index(snapshot)
+    bits, unknown = audience.resolve(selection)
+    counts = audience.count(bits, unknown, get_unknown_languages(unknown))
+    language = (selection.get('language') or '').strip()
+    return jsonify({
+        'success': True,
+        'version': snapshot.version,
+        'total': counts['total'],
+        'by_language': counts['by_language'],
+        'matching': counts['by_language'].get(language, 0) if language else None
+    })
+
+
+@app.route('/audience/members', methods=['GET'])
+def audience_members():
+    """
+    Strona adresów jednej listy z panelu bocznego, pobierana dopiero po jej
+    rozwinięciu: ?type=segments|subitems|groups&id=<nazwa>&offset=0&limit=200.
+    Strona główna zawiera tylko nazwy list i liczniki.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Nie jesteś zalogowany.'}), 401
+
+    kind = request.args.get('type', '')
+    key = request.args.get('id', '')
+    if kind not in ('segments', 'subitems', 'groups'):
+        return jsonify({'success': False, 'message': 'Nieznany typ listy.'}), 400
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', AUDIENCE_PAGE_SIZE, type=int), 1), AUDIENCE_PAGE_MAX)
+
+    snapshot = get_sheet_snapshot()
+
+    def build():
+        total, members = get_sheet_aggregates(snapshot).members(kind, key, offset, limit)
+        next_offset = offset + len(members)
+        return jsonify({
+            'success': True,
+            'version': snapshot.version,
+            'total': total,
+            'items': [
+                {'email': email, 'company': company, 'detail': detail}
+                for email, company, detail in members
+            ],
+            'next_offset': next_offset if next_offset < total else None
+        })
+
+    # Treść zależy tylko od adresu URL i wersji zrzutu
+    return conditional_response(f"members-{snapshot.version}-{AUDIENCE_PAGE_SIZE}", build)
+
+
+@app.route('/audiences', methods=['GET'])
+def list_saved_audiences():
+    """
+    Zapisane grupy odbiorców zalogowanego użytkownika.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Nie jesteś zalogowany.'}), 401
+    audiences = SavedAudience.query.filter_by(user_id=session['user_id']).order_by(SavedAudience.name).all()
+    # ETag z treści – powtórne pobranie bez zmian kończy się 304 bez przesyłania listy
+    response = jsonify({'success': True, 'audiences': [saved_audience_to_dict(a) for a in audiences]})
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+@app.route('/audiences', methods=['POST'])
+def create_saved_audience():
+    """
+    Zapisuje (lub nadpisuje po nazwie) grupę odbiorców z bieżącego
+    zaznaczenia i od razu materializuje jej zbiór adresów.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Nie jesteś zalogowany.'}), 401
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Nieprawidłowe dane grupy odbiorców.'}), 400
+    name = data.get('name') or ''
+    language = data.get('language') or ''
+    selection = data.get('selection')
+    if not isinstance(name, str) or not isinstance(language, str):
+        return jsonify({'success': False, 'message': 'Nieprawidłowe dane grupy odbiorców.'}), 400
+    name, language = name.strip(), language.strip()
+    if not name or len(name) > 150:
+        return jsonify({'success': False, 'message': 'Podaj nazwę grupy (maks. 150 znaków).'}), 400
+    if not language:
+        return jsonify({'success': False, 'message': 'Nie wybrano języka (Polski / Zagraniczny).'}), 400
+    if not is_valid_selection(selection):
+        return jsonify({'success': False, 'message': 'Nieprawidłowe zaznaczenie odbiorców.'}), 400
+
+    try:
+        snapshot = get_sheet_snapshot()
+        audience = SavedAudience.query.filter_by(user_id=session['user_id'], name=name).first()
+        now = datetime.utcnow()
+        if audience is None:
+            audience = SavedAudience(user_id=session['user_id'], name=name, created_at=now)
+            db.session.add(audience)
+        audience.selection = json.dumps(selection, ensure_ascii=False)
+        audience.language = language
+        audience.updated_at = now
+        # Zmiana definicji – przeliczamy zbiór niezależnie od wersji zrzutu
+        audience.set_recipients(
+            resolve_recipients(selection, language, snapshot), snapshot.version, snapshot.fetched_at
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Błąd podczas zapisywania grupy odbiorców: {e}")
+        return jsonify({'success': False, 'message': 'Nie udało się zapisać grupy odbiorców.'}), 500
+
+    return jsonify({
+        'success': True,
+        'message': f'Zapisano grupę "{name}" ({audience.recipient_count} odbiorców).',
+        'audience': saved_audience_to_dict(audience)
+    })
+
+
+@app.route('/audiences/<int:audience_id>', methods=['DELETE'])
+def delete_saved_audience(audience_id):
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Nie jesteś zalogowany.'}), 401
+    audience = SavedAudience.query.filter_by(id=audience_id, user_id=session['user_id']).first()
+    if audience is None:
+        return jsonify({'success': False, 'message': 'Nie znaleziono grupy odbiorców.'}), 404
+    db.session.delete(audience)
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'Usunięto grupę odbiorców.'})
+
+
+@app.route('/refresh_sheet', methods=['POST'])
+def refresh_sheet():
+    """
+    Ręczne odświeżenie arkusza ("odśwież teraz") po pilnych zmianach w danych.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Nie jesteś zalogowany.'}), 401
+    try:
+        task = refresh_sheet_snapshot.delay()
+        return jsonify({'success': True, 'message': 'Zlecono odświeżenie danych arkusza.', 'task_id': task.id}), 202
+    except Exception as e:
+        app.logger.error(f"Błąd podczas zlecania odświeżenia arkusza: {e}")
+        return jsonify({'success': False, 'message': 'Nie udało się zlecić odświeżenia.'}), 500
+
+
 # Dodanie funkcji list_routes
 @app.route('/routes')
 def list_routes():
@@ -1165,123 +1494,6 @@ def list_routes():
 
 
 # Trasa "Zapomniałeś hasła" - zmieniona logika
-forgot_password_template = '''
-<!DOCTYPE html>
-<html lang="pl">
-<head>
-    <meta charset="UTF-8">
-    <title>Odzyskiwanie hasła - Ranges</title>
-    <link rel="icon" type="image/vnd.microsoft.icon" href="{{ url_for('static', filename='favicon.ico') }}">
-    <style>
-        body {
-            font-family: 'Quantico', sans-serif;
-            background-color: #f2f2f2;
-            color: #333;
-            padding: 20px;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-            position: relative;
-        }
-        .container {
-            background-color: #ffffff;
-            padding: 30px;
-            border-radius: 10px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-            width: 100%;
-            max-width: 500px;
-            position: relative;
-        }
-        h2 {
-            text-align: center;
-            margin-bottom: 20px;
-        }
-        input, button {
-            margin: 10px 0;
-            padding: 10px;
-            border: none;
-            border-radius: 5px;
-            transition: 0.3s ease;
-            font-size: 16px;
-            width: 100%;
-            box-sizing: border-box;
-        }
-        input:focus {
-            outline: none;
-            box-shadow: 0 0 5px #1f8ef1;
-        }
-        button {
-            background-color: #1f8ef1;
-            color: white;
-            cursor: pointer;
-            transition: background-color 0.3s, transform 0.2s;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-            border: 1px solid #1f8ef1;
-        }
-        button:hover {
-            background-color: #0a6db9;
-            transform: scale(1.05);
-        }
-        .flash-message {
-            background-color: #f8d7da;
-            color: #721c24;
-            padding: 10px;
-            border-radius: 5px;
-            margin: 10px 0;
-            text-align: center;
-        }
-        .flash-message.success {
-            background-color: #d4edda;
-            color: #155724;
-        }
-        .flash-message.error {
-            background-color: #f8d7da;
-            color: #721c24;
-        }
-        a {
-            color: #1f8ef1;
-            text-decoration: none;
-        }
-        a:hover {
-            text-decoration: underline;
-        }
-        .footer {
-            color: #888888;
-            text-align: center;
-            margin-top: 20px;
-            font-size: 14px;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h2>Odzyskiwanie hasła</h2>
-        {% with messages = get_flashed_messages(with_categories=true) %}
-            {% if messages %}
-                {% for category, message in messages %}
-                    <div class="flash-message {{ category }}">
-                        {{ message }}
-                    </div>
-                {% endfor %}
-            {% endif %}
-        {% endwith %}
-        <form method="post">
-            <label>Nazwa użytkownika:</label>
-            <input type="text" name="username" required>
-            <label>Klucz licencyjny:</label>
-            <input type="text" name="license_key" required>
-            <button type="submit">Weryfikuj</button>
-        </form>
-        <p><a href="{{ url_for('login') }}">Powrót do logowania</a></p>
-        <div class="footer">
-            &copy; DigitDrago
-        </div>
-    </div>
-</body>
-</html>
-'''
-
 @app.route('/forgot_password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
@@ -1306,124 +1518,8 @@ def forgot_password():
             flash('Niepoprawny użytkownik lub klucz licencyjny.', 'error')
             return redirect(url_for('forgot_password'))
 
-    return render_template_string(forgot_password_template)
-
-
-# Szablon resetowania hasła
-reset_password_template = '''
-<!DOCTYPE html>
-<html lang="pl">
-<head>
-    <meta charset="UTF-8">
-    <title>Resetowanie hasła - Ranges</title>
-    <link rel="icon" type="image/vnd.microsoft.icon" href="{{ url_for('static', filename='favicon.ico') }}">
-    <style>
-        body {
-            font-family: 'Quantico', sans-serif;
-            background-color: #f2f2f2;
-            color: #333;
-            padding: 20px;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-            position: relative;
-        }
-        .container {
-            background-color: #ffffff;
-            padding: 30px;
-            border-radius: 10px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-            width: 100%;
-            max-width: 500px;
-            position: relative;
-        }
-        h2 {
-            text-align: center;
-            margin-bottom: 20px;
-        }
-        input, button {
-            margin: 10px 0;
-            padding: 10px;
-            border: none;
-            border-radius: 5px;
-            transition: 0.3s ease;
-            font-size: 16px;
-            width: 100%;
-            box-sizing: border-box;
-        }
-        input:focus {
-            outline: none;
-            box-shadow: 0 0 5px #1f8ef1;
-        }
-        button {
-            background-color: #1f8ef1;
-            color: white;
-            cursor: pointer;
-            transition: background-color 0.3s, transform 0.2s;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-            border: 1px solid #1f8ef1;
-        }
-        button:hover {
-            background-color: #0a6db9;
-            transform: scale(1.05);
-        }
-        .flash-message {
-            background-color: #f8d7da;
-            color: #721c24;
-            padding: 10px;
-            border-radius: 5px;
-            margin: 10px 0;
-            text-align: center;
-        }
-        .flash-message.success {
-            background-color: #d4edda;
-            color: #155724;
-        }
-        .flash-message.error {
-            background-color: #f8d7da;
-            color: #721c24;
-        }
-        a {
-            color: #1f8ef1;
-            text-decoration: none;
-        }
-        a:hover {
-            text-decoration: underline;
-        }
-        .footer {
-            color: #888888;
-            text-align: center;
-            margin-top: 20px;
-            font-size: 14px;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h2>Resetowanie hasła</h2>
-        {% with messages = get_flashed_messages(with_categories=true) %}
-            {% if messages %}
-                {% for category, message in messages %}
-                    <div class="flash-message {{ category }}">
-                        {{ message }}
-                    </div>
-                {% endfor %}
-            {% endif %}
-        {% endwith %}
-        <form method="post">
-            <label>Nowe hasło:</label>
-            <input type="password" name="new_password" required>
-            <button type="submit">Zresetuj hasło</button>
-        </form>
-        <p><a href="{{ url_for('login') }}">Powrót do logowania</a></p>
-        <div class="footer">
-            &copy; DigitDrago
-        </div>
-    </div>
-</body>
-</html>
-'''
+    return render_template('forgot_password.html')
+
 
 @app.route('/reset_password', methods=['GET', 'POST'])
 def reset_password():
@@ -1445,7 +1541,7 @@ def reset_password():
             flash('Wystąpił błąd. Spróbuj ponownie.', 'error')
             return redirect(url_for('reset_password'))
 
-    return render_template_string(reset_password_template)
+    return render_template('reset_password.html')
 
 
 
@@ -1564,183 +1660,7 @@ def register():
             flash('Wystąpił błąd podczas rejestracji. Spróbuj ponownie.', 'error')
             return redirect(url_for('register'))
 
-    # Szablon rejestracji (pozostaje bez zmian)
-    register_template = r'''
-    <!DOCTYPE html>
-    <html lang="pl">
-    <head>
-        <meta charset="UTF-8">
-        <title>Rejestracja - Ranges</title>
-        <link rel="icon" type="image/vnd.microsoft.icon" href="{{ url_for('static', filename='favicon.ico') }}">
-        <link href="https://fonts.googleapis.com/css2?family=Quantico&display=swap" rel="stylesheet">
-        <style>
-            /* Stylizacja formularza rejestracji */
-            body {
-                font-family: 'Quantico', sans-serif;
-                background-color: #f2f2f2;
-                color: #333;
-                padding: 20px;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                height: 100vh;
-                position: relative;
-            }
-            .container {
-                background-color: #ffffff;
-                padding: 30px;
-                padding-top: 100px;
-                border-radius: 10px;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-                width: 100%;
-                max-width: 500px;
-                position: relative;
-            }
-            .header {
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                margin-bottom: 20px;
-            }
-            .header .app-name {
-                font-size: 24px;
-                font-weight: bold;
-                color: #FFD700; /* Złoty kolor neonowy */
-                text-shadow: 0 0 10px #FFD700, 0 0 20px #FFD700, 0 0 30px #FFD700;
-                text-decoration: none;
-            }
-            h2 {
-                text-align: center;
-                margin-bottom: 20px;
-                margin-top: 40px;
-            }
-            input, textarea, select, button {
-                margin: 10px 0;
-                padding: 10px;
-                border: none;
-                border-radius: 5px;
-                transition: 0.3s ease;
-                font-size: 16px;
-                width: 100%;
-                box-sizing: border-box;
-            }
-            input:focus, textarea:focus, select:focus {
-                outline: none;
-                box-shadow: 0 0 5px #1f8ef1;
-            }
-            button {
-                background-color: #1f8ef1;
-                color: white;
-                cursor: pointer;
-                transition: background-color 0.3s, transform 0.2s;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-                border: 1px solid #1f8ef1;
-            }
-            button:hover {
-                background-color: #0a6db9;
-                transform: scale(1.05);
-                box-shadow: 0 8px 16px rgba(0, 0, 0, 0.3);
-            }
-            button:active {
-                animation: buttonBlink 0.2s;
-                box-shadow: 0 2px 4px rgba(0, 0, 0, 0.2);
-            }
-            @keyframes buttonBlink {
-                0% { background-color: #0a6db9; }
-                50% { background-color: #39FF14; }
-                100% { background-color: #0a6db9; }
-            }
-            .flash-message {
-                background-color: #f8d7da;
-                color: #721c24;
-                padding: 10px;
-                border-radius: 5px;
-                margin: 10px 0;
-                text-align: center;
-            }
-            .flash-message.success {
-                background-color: #d4edda;
-                color: #155724;
-            }
-            .flash-message.error {
-                background-color: #f8d7da;
-                color: #721c24;
-            }
-            .flash-message.warning {
-                background-color: #fff3cd;
-                color: #856404;
-            }
-            a {
-                color: #1f8ef1;
-                text-decoration: none;
-            }
-            a:hover {
-                text-decoration: underline;
-            }
-            /* Zmodyfikowana stopka */
-            .footer {
-                color: #888888;
-                text-align: center;
-                margin-top: 20px;
-                font-size: 14px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <a href="{{ url_for('index') }}" class="app-name">Ranges</a>
-            </div>
-            <h2>Rejestracja</h2>
-            {% with messages = get_flashed_messages(with_categories=true) %}
-                {% if messages %}
-                    {% for category, message in messages %}
-                        <div class="flash-message {{ category }}">
-                            {{ message }}
-                        </div>
-                    {% endfor %}
-                {% endif %}
-            {% endwith %}
-            <form method="post">
-                <label>Imię:</label>
-                <input type="text" name="first_name" required>
-
-                <label>Nazwisko:</label>
-                <input type="text" name="last_name" required>
-
-                <label>Stanowisko:</label>
-                <input type="text" name="position" required>
-
-                <label>Nazwa użytkownika:</label>
-                <input type="text" name="username" required>
-
-                <label>Adres e-mail:</label>
-                <input type="email" name="email_address" required>
-
-                <label>Hasło SMTP:</label>
-                <input type="password" name="email_password" required>
-
-                <label>Hasło Aplikacyjne:</label>
-                <input type="password" name="app_password" required>
-
-                <label>Numer telefonu:</label>
-                <input type="text" name="phone_number" required pattern="^\+?\d{9,15}$" title="Wprowadź prawidłowy numer telefonu">
-
-                <label>Klucz licencyjny:</label>
-                <input type="text" name="license_key" required>
-
-                <button type="submit">Zarejestruj się</button>
-            </form>
-            <p style="text-align: center;">Masz już konto? <a href="{{ url_for('login') }}">Zaloguj się</a></p>
-            <!-- Zmodyfikowana stopka -->
-            <div class="footer">
-                &copy; DigitDrago
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    return render_template_string(register_template)
+    return render_template('register.html')
 
 
 # Trasa logowania
@@ -1774,135 +1694,7 @@ def login():
         else:
             flash('Błędna nazwa użytkownika lub hasło aplikacyjne.', 'error')
 
-    # Zmodyfikowany szablon logowania z dodanym linkiem "Zapomniałeś hasła?"
-    login_template = '''
-    <!DOCTYPE html>
-    <html lang="pl">
-    <head>
-        <meta charset="UTF-8">
-        <title>Logowanie - Ranges</title>
-        <link rel="icon" type="image/vnd.microsoft.icon" href="{{ url_for('static', filename='favicon.ico') }}">
-        <!-- Dodaj swoje style CSS tutaj -->
-        <style>
-            /* Przykładowe style CSS */
-            body {
-                font-family: 'Quantico', sans-serif;
-                background-color: #f2f2f2;
-                color: #333;
-                padding: 20px;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                height: 100vh;
-                position: relative;
-            }
-            .container {
-                background-color: #ffffff;
-                padding: 30px;
-                border-radius: 10px;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-                width: 100%;
-                max-width: 400px;
-                position: relative;
-            }
-            h2 {
-                text-align: center;
-                margin-bottom: 20px;
-            }
-            input, textarea, select, button {
-                margin: 10px 0;
-                padding: 10px;
-                border: none;
-                border-radius: 5px;
-                transition: 0.3s ease;
-                font-size: 16px;
-                width: 100%;
-                box-sizing: border-box;
-            }
-            input:focus, textarea:focus, select:focus {
-                outline: none;
-                box-shadow: 0 0 5px #1f8ef1;
-            }
-            button {
-                background-color: #1f8ef1;
-                color: white;
-                cursor: pointer;
-                transition: background-color 0.3s, transform 0.2s;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-                border: 1px solid #1f8ef1;
-            }
-            button:hover {
-                background-color: #0a6db9;
-                transform: scale(1.05);
-                box-shadow: 0 8px 16px rgba(0, 0, 0, 0.3);
-            }
-            .flash-message {
-                background-color: #f8d7da;
-                color: #721c24;
-                padding: 10px;
-                border-radius: 5px;
-                margin: 10px 0;
-                text-align: center;
-            }
-            .flash-message.success {
-                background-color: #d4edda;
-                color: #155724;
-            }
-            .flash-message.error {
-                background-color: #f8d7da;
-                color: #721c24;
-            }
-            .flash-message.warning {
-                background-color: #fff3cd;
-                color: #856404;
-            }
-            a {
-                color: #1f8ef1;
-                text-decoration: none;
-            }
-            a:hover {
-                text-decoration: underline;
-            }
-            .footer {
-                color: #888888;
-                text-align: center;
-                margin-top: 20px;
-                font-size: 14px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h2>Logowanie</h2>
-            {% with messages = get_flashed_messages(with_categories=true) %}
-                {% if messages %}
-                    {% for category, message in messages %}
-                        <div class="flash-message {{ category }}">
-                            {{ message }}
-                        </div>
-                    {% endfor %}
-                {% endif %}
-            {% endwith %}
-            <form method="post">
-                <label>Nazwa użytkownika:</label>
-                <input type="text" name="username" required>
-
-                <label>Hasło Aplikacyjne:</label>
-                <input type="password" name="app_password" required>
-
-                <button type="submit">Zaloguj</button>
-            </form>
-            <p>Nie masz konta? <a href="{{ url_for('register') }}">Zarejestruj się</a></p>
-            <!-- Dodany link do odzyskiwania hasła -->
-            <p><a href="{{ url_for('forgot_password') }}">Zapomniałeś hasła?</a></p>
-            <div class="footer">
-                &copy; DigitDrago
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    return render_template_string(login_template)
+    return render_template('login.html')
 
 
 
@@ -1957,170 +1749,7 @@ def settings():
         flash('Dane zostały zaktualizowane.', 'success')
         return redirect(url_for('settings'))
 
-    # Szablon ustawień konta
-    settings_template = r'''
-    <!DOCTYPE html>
-    <html lang="pl">
-    <head>
-        <meta charset="UTF-8">
-        <title>Ustawienia konta - Ranges</title>
-        <link rel="icon" type="image/vnd.microsoft.icon" href="{{ url_for('static', filename='favicon.ico') }}">
-        <link href="https://fonts.googleapis.com/css2?family=Quantico&display=swap" rel="stylesheet">
-        <style>
-            /* Stylizacja ustawień konta */
-            body {
-                font-family: 'Quantico', sans-serif;
-                background-color: #f2f2f2;
-                color: #333;
-                padding: 20px;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                min-height: 100vh;
-                position: relative;
-            }
-            .container {
-                background-color: #ffffff;
-                padding: 30px;
-                border-radius: 10px;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-                width: 100%;
-                max-width: 600px;
-                position: relative;
-            }
-            h2 {
-                text-align: center;
-                margin-bottom: 20px;
-            }
-            input, textarea, select, button {
-                margin: 10px 0;
-                padding: 10px;
-                border: none;
-                border-radius: 5px;
-                transition: 0.3s ease;
-                font-size: 16px;
-                width: 100%;
-                box-sizing: border-box;
-            }
-            input:focus, textarea:focus, select:focus {
-                outline: none;
-                box-shadow: 0 0 5px #1f8ef1;
-            }
-            button {
-                background-color: #1f8ef1;
-                color: white;
-                cursor: pointer;
-                transition: background-color 0.3s, transform 0.2s;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-                border: 1px solid #1f8ef1;
-            }
-            button:hover {
-                background-color: #0a6db9;
-                transform: scale(1.05);
-                box-shadow: 0 8px 16px rgba(0, 0, 0, 0.3);
-            }
-            button:active {
-                animation: buttonBlink 0.2s;
-                box-shadow: 0 2px 4px rgba(0, 0, 0, 0.2);
-            }
-            @keyframes buttonBlink {
-                0% { background-color: #0a6db9; }
-                50% { background-color: #39FF14; }
-                100% { background-color: #0a6db9; }
-            }
-            .flash-message {
-                background-color: #f8d7da;
-                color: #721c24;
-                padding: 10px;
-                border-radius: 5px;
-                margin: 10px 0;
-                text-align: center;
-            }
-            .flash-message.success {
-                background-color: #d4edda;
-                color: #155724;
-            }
-            .flash-message.error {
-                background-color: #f8d7da;
-                color: #721c24;
-            }
-            .flash-message.warning {
-                background-color: #fff3cd;
-                color: #856404;
-            }
-            a {
-                color: #1f8ef1;
-                text-decoration: none;
-            }
-            a:hover {
-                text-decoration: underline;
-            }
-            .user-info {
-                position: absolute;
-                top: 20px;
-                right: 20px;
-            }
-            /* Zmodyfikowana stopka */
-            .footer {
-                color: #888888;
-                text-align: center;
-                margin-top: 20px;
-                font-size: 14px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h2>Ustawienia konta</h2>
-            {% with messages = get_flashed_messages(with_categories=true) %}
-                {% if messages %}
-                    {% for category, message in messages %}
-                        <div class="flash-message {{ category }}">
-                            {{ message }}
-                        </div>
-                    {% endfor %}
-                {% endif %}
-            {% endwith %}
-            <form method="post">
-                <label>Imię:</label>
-                <input type="text" name="first_name" value="{{ user.first_name }}" required>
-
-                <label>Nazwisko:</label>
-                <input type="text" name="last_name" value="{{ user.last_name }}" required>
-
-                <label>Stanowisko:</label>
-                <input type="text" name="position" value="{{ user.position }}" required>
-
-                <label>Nazwa użytkownika:</label>
-                <input type="text" name="username" value="{{ user.username }}" readonly>
-
-                <label>Adres e-mail:</label>
-                <input type="email" name="email_address" value="{{ user.email_address }}" readonly>
-
-                <label>Numer telefonu:</label>
-                <input type="text" name="phone_number" value="{{ user.phone_number }}" required pattern="\+?\d{9,15}" title="Wprowadź prawidłowy numer telefonu">
-
-                <label>Hasło SMTP (pozostaw puste, jeśli nie chcesz zmieniać):</label>
-                <input type="password" name="email_password">
-
-                <label>Hasło Aplikacyjne (pozostaw puste, jeśli nie chcesz zmieniać):</label>
-                <input type="password" name="app_password">
-
-                <button type="submit">Zapisz zmiany</button>
-            </form>
-            <form method="post" action="{{ url_for('delete_account') }}" onsubmit="return confirm('Czy na pewno chcesz usunąć swoje konto? Ta operacja jest nieodwracalna.');">
-                <button type="submit" style="background-color: #ff4d4d; margin-top: 20px;">Usuń konto</button>
-            </form>
-            <p style="text-align: center; margin-top: 20px;"><a href="{{ url_for('index') }}">Powrót do panelu głównego</a></p>
-            <!-- Zmodyfikowana stopka -->
-            <div class="footer">
-                &copy; DigitDrago
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    return render_template_string(settings_template, user=user)
+    return render_template('settings.html', user=user)
 
 
 # Trasa usuwania konta
@@ -2178,12 +1807,45 @@ def delete_all_notes():
     flash('Wszystkie notatki zostały usunięte.', 'success')
     return redirect(url_for('index'))
 
-from flask import render_template_string
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def notes_version(notes):
+    """
+    Wersja notatek widocznych w panelu. Notatki nie mają znaczników czasu,
+    a zmienia je wiele ścieżek (także zmiana imienia/koloru autora), więc
+    wersją jest skrót wszystkiego, co panel z nich pokazuje.
+    """
+    digest = hashlib.sha1()
+    for note in notes:
+        author = note.user
+        digest.update(repr((
+            note.id, note.content,
+            author.first_name, author.last_name, author.color,
+        )).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def index_page_etag(user, snapshot, notes, saved_audiences):
+    """
+    ETag strony głównej: wersja zrzutu arkusza + wersja notatek, uzupełnione
+    o wszystko inne, co trafia do strony (szablony, użytkownik, jego grupy
+    odbiorców, limit załączników).
+    """
+    digest = hashlib.sha1()
+    digest.update(repr((
+        snapshot.version,
+        notes_version(notes),
+        template_source_version('panel.html', SIDEBAR_LISTS_TEMPLATE),
+        user.id, user.username, user.first_name, user.last_name, user.color,
+        [(a.id, a.name, a.language, a.recipient_count, a.new_since_send) for a in saved_audiences],
+        app.config['MAX_ATTACHMENTS'],
+    )).encode('utf-8'))
+    return f"panel-{digest.hexdigest()[:24]}"
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if 'user_id' not in session:
@@ -2196,2022 +1858,64 @@ def index():
         flash('Użytkownik nie istnieje.', 'error')
         return redirect(url_for('login'))
 
-    # 1. Pobranie danych z Google Sheets
-    data = get_data_from_sheet()
-
-    # 2. Pobranie słowników segmentów i możliwości
-    segments_dict = get_unique_segments_with_counts(data)
-    possibilities_dict = get_unique_possibilities_with_counts(data)
-
-    # 3. Posortowane segmenty wg sumy (Polski+Zagraniczny) - bez zmian
-    sorted_segments = sorted(
-        segments_dict.items(),
-        key=lambda item: (item[1]['Polski'] + item[1]['Zagraniczny']),
-        reverse=True
-    )
+    # 1-4. Segmenty, możliwości i potencjalni klienci z bieżącego zrzutu –
+    #      gotowy HTML list, renderowany raz na wersję danych. Szablon woła tę
+    #      funkcję dopiero w trakcie strumieniowania, więc nagłówek, style,
+    #      skrypty i formularz są już wtedy u przeglądarki
+    snapshot = None
+    if sheet_cache.peek() is not None:
+        try:
+            snapshot = get_sheet_snapshot()
+        except Exception as e:
+            app.logger.warning(f"Zrzut arkusza niedostępny przed renderowaniem panelu: {e}")
 
-    # 4. Sortowanie możliwości wg pierwszego słowa i sumy (Polski+Zagraniczny)
-    sorted_possibilities = sort_possibilities_by_first_word_and_sum(possibilities_dict)
+    def sidebar_lists():
+        try:
+            return get_sidebar_lists_html(snapshot or get_sheet_snapshot())
+        except Exception as e:
+            app.logger.error(f"Błąd przygotowania list panelu bocznego: {e}")
+            return '<p class="list-loader">Nie udało się wczytać danych arkusza. Odśwież stronę.</p>'
 
     # 5. Notatki
     notes = Note.query.order_by(Note.id.desc()).all()
 
-    # 6. Potencjalni klienci
-    potential_clients = get_potential_clients(data)
-
-    # Poniżej pełny szablon z poprawkami w sekcji "Możliwości" i funkcją JS do wyświetlania subitemów w ramce
-    index_template = '''
-    <!DOCTYPE html>
-    <html lang="pl">
-    <head>
-        <meta charset="UTF-8">
-        <title>Ranges - Panel Główny</title>
-        <link rel="icon" href="{{ url_for('static', filename='favicon.ico') }}" type="image/x-icon">
-        <link href="https://fonts.googleapis.com/css2?family=Quantico&display=swap" rel="stylesheet">
-        <style>
-            /* Resetowanie stylów domyślnych */
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            html, body {
-                height: 100%;
-            }
-            body {
-                display: flex;
-                flex-direction: column;
-                min-height: 100vh;
-                font-family: 'Quantico', sans-serif;
-                background-color: #f5f5f5;
-                color: #333333;
-                overflow-x: hidden;
-            }
-            /* Header */
-            .top-header {
-                position: fixed;
-                top: 0;
-                left: 0;
-                right: 0;
-                height: 60px;
-                background-color: #2c3e50;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                z-index: 1001;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                padding: 0 20px;
-            }
-            .segment-label:hover {
-                text-decoration: underline;
-            }
-            .prefix-item,
-            .subitem-item {
-                display: flex;
-                align-items: center;
-                margin-bottom: 8px;
-            }
-            .prefix-item input[type="checkbox"],
-            .subitem-item input[type="checkbox"] {
-                margin-right: 10px;
-                transform: scale(1.2);
-                cursor: pointer;
-            }
-            .segment-count,
-            .subitem-count,
-            .company-count {
-                margin-left: auto;
-                text-align: right;
-            }
-            .segment-count .group-label,
-            .segment-count .count-number,
-            .subitem-count .group-label,
-            .subitem-count .count-number,
-            .company-count .group-label,
-            .company-count .count-number {
-                color: #FFD700 !important; /* złoty */
-            }
-            .count-number {
-                color: #FFD700;
-                margin-left: 5px;
-            }
-            .header-left {
-                display: flex;
-                align-items: center;
-            }
-            .sidebar-toggle-btn {
-                background: none;
-                border: none;
-                cursor: pointer;
-                padding: 5px;
-                font-size: 24px;
-                color: #FFD700;
-                display: flex;
-                align-items: center;
-                margin-top: -2px;
-                transition: color 0.3s ease;
-            }
-            .sidebar-toggle-btn:hover {
-                color: #FFC107;
-            }
-            .header-left .header-title {
-                font-size: 24px;
-                font-weight: bold;
-                color: #ffffff;
-                margin-left: 10px;
-            }
-            .top-header .user-info {
-                display: flex;
-                align-items: center;
-                gap: 15px;
-                font-size: 16px;
-                color: #cccccc;
-            }
-            .top-header .user-info a {
-                color: #FFD700;
-                text-decoration: none;
-                transition: color 0.3s ease;
-            }
-            .top-header .user-info a:hover {
-                color: #FFC107;
-            }
-            /* Wrapper na zawartość */
-            .content-wrapper {
-                display: flex;
-                flex: 1;
-                width: 100%;
-                margin-top: 60px;
-                padding-bottom: 60px;
-                position: relative;
-                z-index: 1;
-            }
-            /* Sidebar */
-            .sidebar {
-                position: fixed;
-                top: 60px;
-                bottom: 0;
-                left: -700px;
-                width: 700px;
-                background-color: rgba(44, 62, 80, 0.95);
-                box-shadow: 2px 0 5px rgba(0,0,0,0.1);
-                padding: 20px;
-                box-sizing: border-box;
-                overflow-y: auto;
-                transition: left 0.3s ease;
-                z-index: 1000;
-                display: flex;
-                flex-direction: column;
-            }
-            .sidebar.active {
-                left: 0;
-            }
-            /* Main Content */
-            .main-content {
-                flex: 1;
-                padding: 20px;
-                box-sizing: border-box;
-                background-color: #f5f5f5;
-                display: flex;
-                flex-direction: column;
-                overflow-y: auto;
-                margin-left: 0;
-                transition: margin-left 0.3s ease;
-                position: relative;
-                z-index: 1;
-            }
-            .main-content.sidebar-active {
-                margin-left: 700px;
-            }
-            .form-container {
-                display: flex;
-                flex-direction: column;
-                flex: 1;
-            }
-            h1 {
-                color: #333333;
-                text-align: center;
-                margin-bottom: 20px;
-                font-size: 36px;
-            }
-            /* Flash Messages */
-            .flash-message {
-                background-color: #e9ecef;
-                color: #495057;
-                padding: 10px;
-                border-radius: 5px;
-                margin-bottom: 20px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                text-align: center;
-                display: none;
-            }
-            .flash-message.show {
-                display: block;
-            }
-            .flash-message.error {
-                background-color: #f8d7da;
-                color: #721c24;
-            }
-            .flash-message.success {
-                background-color: #d4edda;
-                color: #155724;
-            }
-            .flash-message.warning {
-                background-color: #fff3cd;
-                color: #856404;
-            }
-            /* Formularze i elementy */
-            label {
-                display: block;
-                margin-top: 10px;
-                font-weight: bold;
-                color: #333333;
-            }
-            input[type="text"], textarea, select, input[type="file"] {
-                width: 100%;
-                padding: 10px;
-                margin-top: 5px;
-                border: 1px solid #cccccc;
-                border-radius: 5px;
-                box-sizing: border-box;
-                font-size: 16px;
-                background-color: #fafafa;
-                color: #333333;
-                transition: border-color 0.3s;
-            }
-            input[type="text"]:focus, textarea:focus, select:focus, input[type="file"]:focus {
-                outline: none;
-                border-color: #007BFF;
-                box-shadow: 0 0 5px rgba(0,123,255,0.5);
-            }
-            button {
-                background-color: #0056b3;
-                color: #ffffff;
-                padding: 10px 20px;
-                border: none;
-                border-radius: 5px;
-                cursor: pointer;
-                font-size: 16px;
-                margin-top: 20px;
-                transition: background-color 0.3s, transform 0.2s;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.2);
-                display: flex;
-                align-items: center;
-            }
-            button:hover {
-                background-color: #004085;
-                transform: scale(1.05);
-            }
-            button:active {
-                transform: scale(0.95);
-            }
-            .yellow-btn {
-                background-color: #DAA520;
-                color: #ffffff;
-                padding: 8px 12px;
-                border: none;
-                border-radius: 5px;
-                cursor: pointer;
-                font-size: 14px;
-                margin: 10px 0;
-                transition: background-color 0.3s, transform 0.2s;
-                width: 100%;
-            }
-            .yellow-btn:hover {
-                background-color: #B8860B;
-                transform: scale(1.05);
-            }
-            .yellow-btn:active {
-                transform: scale(0.95);
-            }
-            .delete-btn {
-                background-color: #6c757d;
-                color: #ffffff;
-                padding: 5px 10px;
-                border: none;
-                border-radius: 5px;
-                cursor: pointer;
-                transition: background-color 0.3s, transform 0.2s;
-                font-size: 14px;
-            }
-            .delete-btn:hover {
-                background-color: #5a6268;
-                transform: scale(1.05);
-            }
-            .delete-btn:active {
-                transform: scale(0.95);
-            }
-            .edit-btn {
-                background-color: #17a2b8;
-                color: #ffffff;
-                padding: 5px 10px;
-                border: none;
-                border-radius: 5px;
-                cursor: pointer;
-                transition: background-color 0.3s, transform 0.2s;
-                font-size: 14px;
-            }
-            .edit-btn:hover {
-                background-color: #138496;
-                transform: scale(1.05);
-            }
-            .edit-btn:active {
-                transform: scale(0.95);
-            }
-            .note-section {
-                background-color: #ffffff;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                margin-top: 30px;
-                flex: 0 0 auto;
-                max-height: calc(100vh - 160px);
-                overflow-y: auto;
-                position: relative;
-                padding-bottom: 80px;
-            }
-            .note {
-                background-color: #f8f9fa;
-                margin: 10px 0;
-                padding: 15px;
-                border-radius: 5px;
-                display: flex;
-                flex-direction: column;
-                justify-content: space-between;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-                position: relative;
-            }
-            .note-content {
-                margin-bottom: 10px;
-                white-space: pre-wrap;
-                flex: 1;
-            }
-            .note-footer {
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                margin-top: 10px;
-            }
-            .user-name {
-                padding: 5px 10px;
-                border-radius: 5px;
-                color: #333333;
-                font-weight: bold;
-                background-color: #e2e6ea;
-                display: inline-block;
-                cursor: pointer;
-                transition: background-color 0.3s;
-            }
-            .user-name:hover {
-                background-color: #c8d6e5;
-            }
-            .note-actions {
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            }
-            .transfer-note-btn {
-                background-color: #000000;
-                color: #ffffff;
-                padding: 5px 10px;
-                border: none;
-                border-radius: 5px;
-                cursor: pointer;
-                transition: background-color 0.3s, transform 0.2s;
-            }
-            .transfer-note-btn:hover {
-                background-color: #333333;
-                transform: scale(1.05);
-            }
-            .transfer-note-btn:active {
-                transform: scale(0.95);
-            }
-            .delete-all-notes-form button {
-                background-color: #6c757d;
-                color: #ffffff;
-                padding: 5px 10px;
-                border: none;
-                border-radius: 5px;
-                cursor: pointer;
-                transition: background-color 0.3s, transform 0.2s;
-            }
-            .delete-all-notes-form button:hover {
-                background-color: #5a6268;
-                transform: scale(1.05);
-            }
-            .delete-all-notes-form button:active {
-                transform: scale(0.95);
-            }
-            .segment-list, .possibility-list, .potential-clients-list {
-                list-style: none;
-                padding-left: 0;
-                margin: 0;
-            }
-            .segment-item,
-            .prefix-item,
-            .subitem-item,
-            .potential-client-group,
-            .email-item,
-            .company-item,
-            .client-item {
-                display: flex;
-                align-items: center;
-                margin-bottom: 8px;
-            }
-            .segment-item input[type="checkbox"],
-            .prefix-item input[type="checkbox"],
-            .subitem-item input[type="checkbox"],
-            .potential-client-group input[type="checkbox"],
-            .email-item input[type="checkbox"],
-            .company-item input[type="checkbox"],
-            .client-item input[type="checkbox"] {
-                margin-right: 10px;
-                transform: scale(1.2);
-                cursor: pointer;
-            }
-            .segment-label,
-            .prefix-label,
-            .potential-client-group-label {
-                font-size: 15px;
-                font-weight: bold;
-                color: #ffffff;
-                text-shadow: 0 0 2px rgba(255,255,255,0.6);
-                border-bottom: 1px solid rgba(255,255,255,0.2);
-                padding-bottom: 5px;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                cursor: pointer;
-                flex: 1;
-                user-select: none;
-            }
-            .segment-label:hover,
-            .prefix-label:hover,
-            .potential-client-group-label:hover {
-                text-decoration: underline;
-            }
-            .subitem-label {
-                font-size: 13px;
-                font-weight: normal;
-                color: #ffffff;
-                border-bottom: 1px solid rgba(255,255,255,0.2);
-                padding-bottom: 5px;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                cursor: pointer;
-                flex: 1;
-                user-select: none;
-            }
-            .subitem-label:hover {
-                text-decoration: underline;
-            }
-            .company-count,
-            .subitem-count {
-                margin-left: auto;
-                text-align: right;
-            }
-            .email-item, .company-item, .client-item {
-                display: flex;
-                align-items: center;
-                margin-bottom: 5px;
-            }
-            .email-item input[type="checkbox"],
-            .company-item input[type="checkbox"],
-            .client-item input[type="checkbox"] {
-                margin-right: 10px;
-                transform: scale(1.1);
-                cursor: pointer;
-            }
-            .email-item label,
-            .company-item label,
-            .client-item label {
-                cursor: pointer;
-                color: #ffffff;
-                font-size: 14px;
-                user-select: none;
-            }
-            .clients-list,
-            .email-list,
-            .company-list {
-                display: none;
-                list-style: none;
-                padding-left: 20px;
-                margin-top: 5px;
-                max-height: 300px;
-                overflow-y: auto;
-            }
-            .clients-list.show,
-            .email-list.show,
-            .company-list.show {
-                display: block;
-            }
-            .subitem-list {
-                display: none;
-            }
-            .subitem-list.show {
-                display: block;
-            }
-            .toggle-buttons-container {
-                display: flex;
-                gap: 10px;
-                margin-bottom: 20px;
-            }
-            .toggle-segments-btn,
-            .toggle-possibilities-btn,
-            .toggle-potential-clients-btn {
-                background: none;
-                border: 1px solid #cccccc;
-                border-radius: 8px;
-                padding: 6px 10px;
-                cursor: pointer;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                transition: transform 0.3s, background-color 0.3s;
-                background-color: #f2f2f2;
-            }
-            .toggle-segments-btn:hover,
-            .toggle-possibilities-btn:hover,
-            .toggle-potential-clients-btn:hover {
-                background-color: #e8e8e8;
-                box-shadow: 0 0 4px rgba(0,0,0,0.2);
-                transform: scale(1.05);
-            }
-            .toggle-segments-btn:active,
-            .toggle-possibilities-btn:active,
-            .toggle-potential-clients-btn:active {
-                background-color: #dddddd;
-                box-shadow: none;
-                transform: scale(0.98);
-            }
-            .toggle-segments-btn img,
-            .toggle-possibilities-btn img,
-            .toggle-potential-clients-btn img {
-                width: 32px;
-                height: 32px;
-                transition: transform 0.3s;
-            }
-            .toggle-segments-btn img.rotate,
-            .toggle-possibilities-btn img.rotate,
-            .toggle-potential-clients-btn img.rotate {
-                transform: rotate(180deg);
-            }
-            .segments-container,
-            .possibilities-container,
-            .potential-clients-container {
-                display: none;
-                margin-top: 10px;
-            }
-            .segments-container.show,
-            .possibilities-container.show,
-            .potential-clients-container.show {
-                display: block;
-            }
-            #selected-segments,
-            #selected-possibilities,
-            #selected-potential-clients,
-            #selected-users {
-                margin-left: 10px;
-                font-size: 12px;
-                color: #333333;
-                max-width: 100%;
-                display: flex;
-                flex-wrap: wrap;
-                gap: 5px;
-            }
-            .selected-item {
-                background-color: #2c3e50;
-                color: #ffffff;
-                padding: 5px 10px;
-                border-radius: 15px;
-                display: flex;
-                align-items: center;
-                font-size: 12px;
-                white-space: nowrap;
-                overflow: hidden;
-                text-overflow: ellipsis;
-                border: 1px solid #FFD700;
-            }
-            .selected-item .remove-item {
-                margin-left: 5px;
-                cursor: pointer;
-                font-weight: bold;
-                color: #ffffff;
-            }
-            .selected-item:hover {
-                background-color: #34495e;
-            }
-            .modal {
-                display: none;
-                position: fixed;
-                z-index: 1002;
-                left: 0;
-                top: 0;
-                width: 100%;
-                height: 100%;
-                overflow: auto;
-                background-color: rgba(0,0,0,0.5);
-            }
-            .modal-content {
-                background-color: #fefefe;
-                margin: 10% auto;
-                padding: 20px;
-                border: 1px solid #888;
-                width: 80%;
-                max-width: 500px;
-                border-radius: 10px;
-                box-shadow: 0 5px 15px rgba(0,0,0,0.3);
-                position: relative;
-            }
-            .close-modal {
-                color: #aaa;
-                float: right;
-                font-size: 28px;
-                font-weight: bold;
-                position: absolute;
-                top: 10px;
-                right: 20px;
-                cursor: pointer;
-            }
-            .close-modal:hover,
-            .close-modal:focus {
-                color: black;
-                text-decoration: none;
-                cursor: pointer;
-            }
-            .modal-form input[type="text"] {
-                width: 100%;
-                padding: 10px;
-                margin-top: 10px;
-                border: 1px solid #cccccc;
-                border-radius: 5px;
-                box-sizing: border-box;
-                font-size: 16px;
-                background-color: #fafafa;
-                color: #333333;
-                transition: border-color 0.3s;
-            }
-            .modal-form input[type="text"]:focus {
-                outline: none;
-                border-color: #007BFF;
-                box-shadow: 0 0 5px rgba(0,123,255,0.5);
-            }
-            .modal-form button {
-                background-color: #28a745;
-                color: #ffffff;
-                padding: 10px 20px;
-                border: none;
-                border-radius: 5px;
-                cursor: pointer;
-                font-size: 16px;
-                margin-top: 20px;
-                transition: background-color 0.3s, transform 0.2s;
-                width: 100%;
-            }
-            .modal-form button:hover {
-                background-color: #218838;
-                transform: scale(1.05);
-            }
-            .modal-form button:active {
-                transform: scale(0.95);
-            }
-            .dropzone {
-                border: 2px dashed #cccccc;
-                border-radius: 5px;
-                padding: 20px;
-                text-align: center;
-                color: #999999;
-                cursor: pointer;
-                transition: background-color 0.3s, border-color 0.3s;
-            }
-            .dropzone.dragover {
-                background-color: #e9ecef;
-                border-color: #007BFF;
-                color: #333333;
-            }
-            .attachments-preview {
-                display: flex;
-                flex-wrap: wrap;
-                gap: 10px;
-                margin-top: 10px;
-            }
-            .attachment-item {
-                background-color: #f1f1f1;
-                padding: 5px 10px;
-                border-radius: 5px;
-                display: flex;
-                align-items: center;
-                gap: 5px;
-            }
-            .attachment-item span {
-                font-size: 14px;
-            }
-            .attachment-item button {
-                background: none;
-                border: none;
-                color: #dc3545;
-                font-size: 16px;
-                cursor: pointer;
-                padding: 0;
-            }
-            .attachments-count {
-                margin-top: 5px;
-                font-size: 14px;
-                color: #555555;
-            }
-            .progress-container {
-                width: 100%;
-                background-color: #f3f3f3;
-                border-radius: 5px;
-                margin-top: 10px;
-                display: none;
-            }
-            .progress-bar {
-                width: 0%;
-                height: 20px;
-                background-color: #28a745;
-                border-radius: 5px;
-                text-align: center;
-                color: white;
-                line-height: 20px;
-                transition: width 0.4s ease;
-            }
-            .spinner {
-                border: 4px solid #f3f3f3;
-                border-top: 4px solid #007BFF;
-                border-radius: 50%;
-                width: 24px;
-                height: 24px;
-                animation: spin 1s linear infinite;
-                display: none;
-                margin-left: 10px;
-            }
-            @keyframes spin {
-                0% { transform: rotate(0deg); }
-                100% { transform: rotate(360deg); }
-            }
-            .footer {
-                background-color: transparent;
-                color: #aaaaaa;
-                text-align: center;
-                padding: 10px;
-                font-size: 12px;
-                margin-top: auto;
-            }
-            @media (max-width: 768px) {
-                .content-wrapper {
-                    flex-direction: column;
-                }
-                .sidebar {
-                    width: 100%;
-                    height: auto;
-                    left: -100%;
-                    bottom: 0;
-                }
-                .main-content.sidebar-active {
-                    margin-left: 0;
-                }
-                .main-content {
-                    padding-top: 70px;
-                }
-                .note-section {
-                    margin: 20px 10px;
-                }
-                .top-header {
-                    justify-content: space-between;
-                }
-                #selected-segments,
-                #selected-possibilities,
-                #selected-potential-clients,
-                #selected-users {
-                    position: static;
-                    margin-top: 10px;
-                }
-            }
-        </style>
-        <!-- CKEditor -->
-        <script src="https://cdn.ckeditor.com/ckeditor5/39.0.1/classic/ckeditor.js"></script>
-        <script>
-            // ------------------
-            // WSPÓLNE FUNKCJE JS
-            // ------------------
-            function showFlashMessage(category, message) {
-                const flashMessage = document.querySelector('.flash-message.' + category);
-                if (flashMessage) {
-                    flashMessage.textContent = message;
-                    flashMessage.classList.add('show');
-                    setTimeout(() => {
-                        flashMessage.classList.remove('show');
-                    }, 5000);
-                }
-            }
-
-            function showSpinner(spinnerId) {
-                const spinner = document.getElementById(spinnerId);
-                if (spinner) {
-                    spinner.style.display = 'inline-block';
-                }
-            }
-            function hideSpinner(spinnerId) {
-                const spinner = document.getElementById(spinnerId);
-                if (spinner) {
-                    spinner.style.display = 'none';
-                }
-            }
-
-            function escapeHtml(text) {
-                var map = {
-                    '&': '&amp;',
-                    '<': '&lt;',
-                    '>': '&gt;',
-                    '"': '&quot;',
-                    "'": '&#039;'
-                };
-                return text.replace(/[&<>"']/g, function(m) { return map[m]; });
-            }
-
-            // ------------------
-            // OBSŁUGA NOTATEK
-            // ------------------
-            function updateNotesList(notes) {
-                const notesList = document.querySelector('.note-section ul');
-                notesList.innerHTML = '';
-
-                notes.forEach(note => {
-                    const li = document.createElement('li');
-                    li.className = 'note';
-                    li.setAttribute('data-note-id', note.id);
-                    li.innerHTML = `
-                        <div class="note-content">${escapeHtml(note.content)}</div>
-                        <div class="note-footer">
-                            <div class="note-actions">
-                                <button type="button" class="transfer-note-btn" data-note-content="${escapeHtml(note.content)}">Transfer</button>
-                                <button type="button" class="edit-btn" data-note-id="${note.id}" data-note-content="${escapeHtml(note.content)}">Edytuj</button>
-                                <form class="delete-note-form" data-note-id="${note.id}">
-                                    <button type="submit" class="delete-btn">Usuń</button>
-                                    <div class="spinner" id="note-spinner-${note.id}" style="display: none;"></div>
-                                </form>
-                            </div>
-                            <span class="user-name" style="background-color: ${note.user.color};" data-email="${escapeHtml(note.user.email)}">
-                                ${escapeHtml(note.user.first_name)} ${escapeHtml(note.user.last_name)}
-                            </span>
-                        </div>
-                    `;
-                    notesList.appendChild(li);
-                });
-                attachUserNameClickListeners();
-            }
-
-            function transferToMessageField(content) {
-                if (window.editor) {
-                    window.editor.setData(content);
-                } else {
-                    document.getElementById('message').value = content;
-                }
-            }
-
-            // ------------------
-            // OBSŁUGA ZAZNACZEŃ
-            // ------------------
-            function updateSelectedItems() {
-                // 1) SEGMENTY
-                const selectedSegments = Array.from(document.querySelectorAll('.segment-item input[type="checkbox"]:checked'))
-                    .map(cb => cb.value);
-                const selectedSegmentsDiv = document.getElementById('selected-segments');
-                selectedSegmentsDiv.innerHTML = '';
-
-                selectedSegments.forEach(segment => {
-                    const segmentSpan = document.createElement('span');
-                    segmentSpan.className = 'selected-item';
-                    segmentSpan.textContent = segment;
-                    const removeSpan = document.createElement('span');
-                    removeSpan.className = 'remove-item';
-                    removeSpan.textContent = '×';
-                    removeSpan.setAttribute('data-item', segment);
-                    removeSpan.addEventListener('click', function() {
-                        const itemToRemove = this.getAttribute('data-item');
-                        const checkbox = Array.from(document.querySelectorAll('.segment-item input[type="checkbox"]'))
-                            .find(cb => cb.value === itemToRemove);
-                        if (checkbox) {
-                            checkbox.checked = false;
-                            const segmentIndex = checkbox.id.split('-')[1];
-                            const emailList = document.getElementById(`emails-${segmentIndex}`);
-                            if (emailList) {
-                                const emailCheckboxes = emailList.querySelectorAll('input[type="checkbox"]');
-                                emailCheckboxes.forEach(emailCb => {
-                                    emailCb.checked = false;
-                                });
-                            }
-                        }
-                        this.parentElement.remove();
-                        updateSelectedItems();
-                        updateSelectAllButtons();
-                    });
-                    segmentSpan.appendChild(removeSpan);
-                    selectedSegmentsDiv.appendChild(segmentSpan);
-                });
-
-                // 2) POTENCJALNI KLIENCI
-                const selectedPotentialClients = Array.from(
-                    document.querySelectorAll('.potential-clients-list .client-item input[type="checkbox"]:checked')
-                ).map(cb => {
-                    const label = document.querySelector(`label[for="${cb.id}"]`);
-                    if (label) {
-                        const text = label.textContent;
-                        const companyName = text.split(' (')[0];
-                        return { companyName };
-                    }
-                    return { companyName: cb.value };
-                });
-                const selectedPotentialClientsDiv = document.getElementById('selected-potential-clients');
-                selectedPotentialClientsDiv.innerHTML = '';
-                selectedPotentialClients.forEach(client => {
-                    const clientSpan = document.createElement('span');
-                    clientSpan.className = 'selected-item';
-                    clientSpan.textContent = client.companyName;
-                    const removeSpan = document.createElement('span');
-                    removeSpan.className = 'remove-item';
-                    removeSpan.textContent = '×';
-                    removeSpan.setAttribute('data-company', client.companyName);
-                    removeSpan.addEventListener('click', function() {
-                        const companyToRemove = this.getAttribute('data-company');
-                        const checkbox = Array.from(document.querySelectorAll('.potential-clients-list .client-item input[type="checkbox"]'))
-                            .find(cb => {
-                                const label = document.querySelector(`label[for="${cb.id}"]`);
-                                return label && label.textContent.split(' (')[0] === companyToRemove;
-                            });
-                        if (checkbox) {
-                            checkbox.checked = false;
-                            const groupIndex = checkbox.id.split('-')[1];
-                            const groupCheckbox = document.getElementById(`potential-group-${groupIndex}`);
-                            const siblingCheckboxes = document.querySelectorAll(`#clients-${groupIndex} .client-item input[type="checkbox"]`);
-                            const allUnchecked = Array.from(siblingCheckboxes).every(cb => !cb.checked);
-                            if (allUnchecked && groupCheckbox) {
-                                groupCheckbox.checked = false;
-                            }
-                        }
-                        this.parentElement.remove();
-                        updateSelectedItems();
-                    });
-                    clientSpan.appendChild(removeSpan);
-                    selectedPotentialClientsDiv.appendChild(clientSpan);
-                });
-
-                // 3) MOŻLIWOŚCI – PREFIXY (pierwszy poziom)
-                const selectedPossibilityPrefixes = Array.from(
-                    document.querySelectorAll('.prefix-item input[type="checkbox"]:checked')
-                ).map(cb => cb.value);
-
-                const selectedPossibilitiesDiv = document.getElementById('selected-possibilities');
-                selectedPossibilitiesDiv.innerHTML = '';
-
-                selectedPossibilityPrefixes.forEach(prefix => {
-                    const prefixSpan = document.createElement('span');
-                    prefixSpan.className = 'selected-item';
-                    prefixSpan.textContent = prefix;
-
-                    const removeSpan = document.createElement('span');
-                    removeSpan.className = 'remove-item';
-                    removeSpan.textContent = '×';
-                    removeSpan.setAttribute('data-prefix', prefix);
-                    removeSpan.addEventListener('click', function() {
-                        const toRemove = this.getAttribute('data-prefix');
-                        const prefixCheckbox = Array.from(document.querySelectorAll('.prefix-item input[type="checkbox"]'))
-                            .find(cb => cb.value === toRemove);
-                        if (prefixCheckbox) {
-                            prefixCheckbox.checked = false;
-                            // Odznacz subitems + firmy
-                            const prefixIndex = prefixCheckbox.id.split('-')[1];
-                            const subitemList = document.getElementById(`subitems-${prefixIndex}`);
-                            if (subitemList) {
-                                const subitemCheckboxes = subitemList.querySelectorAll('.subitem-item input[type="checkbox"]');
-                                subitemCheckboxes.forEach(subCB => {
-                                    subCB.checked = false;
-                                    const parts = subCB.id.split('-');
-                                    const subIdx = parts[2];
-                                    const companyList = document.getElementById(`companies-${prefixIndex}-${subIdx}`);
-                                    if (companyList) {
-                                        const companyCBs = companyList.querySelectorAll('.company-item input[type="checkbox"]');
-                                        companyCBs.forEach(c => c.checked = false);
-                                    }
-                                });
-                            }
-                        }
-                        this.parentElement.remove();
-                        updateSelectedItems();
-                    });
-                    prefixSpan.appendChild(removeSpan);
-                    selectedPossibilitiesDiv.appendChild(prefixSpan);
-                });
-
-                // 4) MOŻLIWOŚCI – SUBITEMY (drugi poziom)
-                const selectedSubitems = Array.from(
-                    document.querySelectorAll('.subitem-item input[type="checkbox"]:checked')
-                );
-                selectedSubitems.forEach(subCB => {
-                    const subitemValue = subCB.value;  // np. "FCL Road [[[ West Europe Premium ]]]"
-                    
-                    // Tworzymy "badge" do wyświetlenia
-                    const subitemSpan = document.createElement('span');
-                    subitemSpan.className = 'selected-item';
-                    subitemSpan.textContent = subitemValue;
-
-                    const removeSpan = document.createElement('span');
-                    removeSpan.className = 'remove-item';
-                    removeSpan.textContent = '×';
-
-                    // Konieczne do odznaczenia w drzewku
-                    removeSpan.setAttribute('data-subitem-value', subitemValue);
-                    removeSpan.addEventListener('click', function() {
-                        const subitemToRemove = this.getAttribute('data-subitem-value');
-                        // Znajdź checkbox subitemu i go odznacz
-                        const subitemCheckbox = Array.from(document.querySelectorAll('.subitem-item input[type="checkbox"]'))
-                            .find(cb => cb.value === subitemToRemove);
-                        if (subitemCheckbox) {
-                            subitemCheckbox.checked = false;
-                            // Odznacz w razie czego firmy w trzecim poziomie
-                            const parts = subitemCheckbox.id.split('-'); // ['subitem', prefixIndex, subIndex]
-                            const prefixIndex = parts[1];
-                            const subIndex = parts[2];
-                            const companyList = document.getElementById(`companies-${prefixIndex}-${subIndex}`);
-                            if (companyList) {
-                                const companyCBs = companyList.querySelectorAll('.company-item input[type="checkbox"]');
-                                companyCBs.forEach(c => c.checked = false);
-                            }
-                        }
-                        this.parentElement.remove();
-                        updateSelectedItems();
-                    });
-
-                    subitemSpan.appendChild(removeSpan);
-                    selectedPossibilitiesDiv.appendChild(subitemSpan);
-                });
-
-                // Wybrani użytkownicy (z notatek)
-                const selectedUsersDiv = document.getElementById('selected-users');
-                selectedUsersDiv.innerHTML = '';
-
-                updateSelectAllButtons();
-            }
-
-            // ---------------------
-            // SEKCJA SEGMENTÓW
-            // ---------------------
-            function handleSegmentChange(segmentCheckbox) {
-                const segmentIndex = segmentCheckbox.id.split('-')[1];
-                const emailList = document.getElementById(`emails-${segmentIndex}`);
-                if (emailList) {
-                    const emailCheckboxes = emailList.querySelectorAll('input[type="checkbox"]');
-                    emailCheckboxes.forEach(function(emailCheckbox) {
-                        emailCheckbox.checked = segmentCheckbox.checked;
-                    });
-                }
-                updateSelectedItems();
-            }
-            function toggleAllSegmentsExpandCollapse(button) {
-                var emailLists = document.querySelectorAll('.email-list');
-                var allExpanded = Array.from(emailLists).every(list => list.classList.contains('show'));
-                emailLists.forEach(list => {
-                    if (allExpanded) {
-                        list.classList.remove('show');
-                    } else {
-                        list.classList.add('show');
-                    }
-                });
-                button.textContent = allExpanded ? 'Rozwiń wszystkie segmenty' : 'Zwiń wszystkie segmenty';
-            }
-            function toggleSelectAllSegments(button) {
-                var segmentCheckboxes = document.querySelectorAll('.segment-item input[type="checkbox"]');
-                var allChecked = Array.from(segmentCheckboxes).every(cb => cb.checked);
-                segmentCheckboxes.forEach(function(checkbox) {
-                    checkbox.checked = !allChecked;
-                    handleSegmentChange(checkbox);
-                });
-                button.textContent = !allChecked ? 'Odznacz wszystkie segmenty' : 'Zaznacz wszystkie segmenty';
-                updateSelectedItems();
-            }
-            function toggleEmailsList(segmentIndex) {
-                var emailList = document.getElementById(`emails-${segmentIndex}`);
-                if (emailList) {
-                    emailList.classList.toggle('show');
-                }
-            }
-            function toggleSelectAllEmailsInSegment(emailListId) {
-                var emailList = document.getElementById(emailListId);
-                var emailCheckboxes = emailList.querySelectorAll('input[type="checkbox"]');
-                var toggleBtn = emailList.querySelector('.select-deselect-emails-btn');
-                var allChecked = Array.from(emailCheckboxes).every(cb => cb.checked);
-                emailCheckboxes.forEach(function(checkbox) {
-                    checkbox.checked = !allChecked;
-                });
-                toggleBtn.textContent = !allChecked ? 'Odznacz Wszystkie' : 'Zaznacz Wszystkie';
-                updateSelectedItems();
-            }
-
-            // --------------------------
-            // SEKCJA POTENCJALNYCH KLIENTÓW
-            // --------------------------
-            function handlePotentialClientGroupChange(groupCheckbox) {
-                var groupIndex = groupCheckbox.id.split('-')[2];
-                var clientsList = document.getElementById(`clients-${groupIndex}`);
-                if (clientsList) {
-                    var clientCheckboxes = clientsList.querySelectorAll('input[type="checkbox"]');
-                    clientCheckboxes.forEach(function(clientCheckbox) {
-                        clientCheckbox.checked = groupCheckbox.checked;
-                    });
-                }
-                updateSelectedItems();
-            }
-            function toggleAllPotentialClientsExpandCollapse(button) {
-                var clientLists = document.querySelectorAll('.clients-list');
-                var allExpanded = Array.from(clientLists).every(list => list.classList.contains('show'));
-                clientLists.forEach(list => {
-                    if (allExpanded) {
-                        list.classList.remove('show');
-                    } else {
-                        list.classList.add('show');
-                    }
-                });
-                button.textContent = allExpanded ? 'Rozwiń wszystkich potencjalnych klientów' : 'Zwiń wszystkich potencjalnych klientów';
-            }
-            function toggleSelectAllPotentialClients(button) {
-                var groupCheckboxes = document.querySelectorAll('.potential-client-group input[type="checkbox"]');
-                var clientCheckboxes = document.querySelectorAll('.potential-clients-list .client-item input[type="checkbox"]');
-                var allChecked = Array.from(groupCheckboxes).every(cb => cb.checked) && Array.from(clientCheckboxes).every(cb => cb.checked);
-                groupCheckboxes.forEach(function(groupCheckbox) {
-                    groupCheckbox.checked = !allChecked;
-                });
-                clientCheckboxes.forEach(function(clientCheckbox) {
-                    clientCheckbox.checked = !allChecked;
-                });
-                button.textContent = !allChecked ? 'Odznacz wszystkich klientów' : 'Zaznacz wszystkich klientów';
-                updateSelectedItems();
-            }
-            function toggleClientsList(groupIndex) {
-                var clientsList = document.getElementById(`clients-${groupIndex}`);
-                if (clientsList) {
-                    clientsList.classList.toggle('show');
-                }
-            }
-
-            // --------------------------
-            //  SEKCJA MOŻLIWOŚCI (prefix -> subitems -> companies)
-            // --------------------------
-            function handlePrefixChange(prefixCheckbox) {
-                const prefixIndex = prefixCheckbox.id.split('-')[1];
-                const subitemList = document.getElementById(`subitems-${prefixIndex}`);
-                if (!subitemList) return;
-                const subitemCheckboxes = subitemList.querySelectorAll('.subitem-item input[type="checkbox"]');
-                subitemCheckboxes.forEach((cb) => {
-                    cb.checked = prefixCheckbox.checked;
-                    const parts = cb.id.split('-');
-                    const subIndex = parts[2];
-                    const companyList = document.getElementById(`companies-${prefixIndex}-${subIndex}`);
-                    if (companyList) {
-                        const companyCheckboxes = companyList.querySelectorAll('.company-item input[type="checkbox"]');
-                        companyCheckboxes.forEach((cc) => {
-                            cc.checked = prefixCheckbox.checked;
-                        });
-                    }
-                });
-                updateSelectedItems();
-            }
-            function handleSubitemChange(subitemCheckbox) {
-                const parts = subitemCheckbox.id.split('-');
-                const prefixIndex = parts[1];
-                const subIndex = parts[2];
-                const companyList = document.getElementById(`companies-${prefixIndex}-${subIndex}`);
-                if (companyList) {
-                    const companyCheckboxes = companyList.querySelectorAll('.company-item input[type="checkbox"]');
-                    companyCheckboxes.forEach((cc) => {
-                        cc.checked = subitemCheckbox.checked;
-                    });
-                }
-                const prefixCheckbox = document.getElementById(`prefix-${prefixIndex}`);
-                if (prefixCheckbox && subitemCheckbox.checked) {
-                    const subitemList = document.getElementById(`subitems-${prefixIndex}`);
-                    const siblings = subitemList.querySelectorAll('.subitem-item input[type="checkbox"]');
-                    const allChecked = Array.from(siblings).every(cb => cb.checked);
-                    prefixCheckbox.checked = allChecked;
-                }
-                if (!subitemCheckbox.checked && prefixCheckbox) {
-                    prefixCheckbox.checked = false;
-                }
-                updateSelectedItems();
-            }
-            function toggleAllPossibilitiesExpandCollapse(button) {
-                const allSubitemLists = document.querySelectorAll('.subitem-list');
-                const allCompanyLists = document.querySelectorAll('.company-list');
-                const allExpanded = Array.from(allSubitemLists).every(list => list.classList.contains('show'))
-                    && Array.from(allCompanyLists).every(list => list.classList.contains('show'));
-                allSubitemLists.forEach(list => {
-                    if (allExpanded) {
-                        list.classList.remove('show');
-                    } else {
-                        list.classList.add('show');
-                    }
-                });
-                allCompanyLists.forEach(list => {
-                    if (allExpanded) {
-                        list.classList.remove('show');
-                    } else {
-                        list.classList.add('show');
-                    }
-                });
-                button.textContent = allExpanded ? 'Rozwiń wszystkie możliwości' : 'Zwiń wszystkie możliwości';
-            }
-            function toggleSelectAllPossibilities(button) {
-                const prefixCheckboxes = document.querySelectorAll('.prefix-item input[type="checkbox"]');
-                const allChecked = Array.from(prefixCheckboxes).every(cb => cb.checked);
-                prefixCheckboxes.forEach(cb => {
-                    cb.checked = !allChecked;
-                    handlePrefixChange(cb);
-                });
-                button.textContent = !allChecked ? 'Odznacz wszystkie możliwości' : 'Zaznacz wszystkie możliwości';
-                updateSelectedItems();
-            }
-            function togglePrefixList(prefixIndex) {
-                const subitemList = document.getElementById(`subitems-${prefixIndex}`);
-                if (subitemList) {
-                    subitemList.classList.toggle('show');
-                }
-            }
-            function toggleSubitemList(prefixIndex, subIndex) {
-                const companyList = document.getElementById(`companies-${prefixIndex}-${subIndex}`);
-                if (companyList) {
-                    companyList.classList.toggle('show');
-                }
-            }
-            function toggleSelectAllCompaniesInSubitem(listId) {
-                const companyList = document.getElementById(listId);
-                if (!companyList) return;
-                const companyCheckboxes = companyList.querySelectorAll('.company-item input[type="checkbox"]');
-                const allChecked = Array.from(companyCheckboxes).every(cb => cb.checked);
-                companyCheckboxes.forEach(cb => {
-                    cb.checked = !allChecked;
-                });
-                const toggleBtn = companyList.querySelector('.select-deselect-companies-btn');
-                if (toggleBtn) {
-                    toggleBtn.textContent = !allChecked ? 'Odznacz Wszystkie' : 'Zaznacz Wszystkie';
-                }
-                updateSelectedItems();
-            }
-
-            function validateParentChildSelection() {
-                // Możesz dodać tu dodatkową walidację
-                return true;
-            }
-
-            function toggleSidebar(button) {
-                var sidebar = document.querySelector('.sidebar');
-                sidebar.classList.toggle('active');
-                var mainContent = document.querySelector('.main-content');
-                mainContent.classList.toggle('sidebar-active');
-            }
-
-            function attachUserNameClickListeners() {
-                document.querySelectorAll('.user-name').forEach(function(userNameSpan) {
-                    userNameSpan.style.cursor = 'pointer';
-                    userNameSpan.addEventListener('click', function() {
-                        const userName = this.textContent.trim();
-                        const userEmail = this.getAttribute('data-email');
-                        const alreadySelected = Array.from(document.querySelectorAll('#selected-users .selected-item'))
-                            .some(item => item.getAttribute('data-email') === userEmail);
-
-                        if (!alreadySelected) {
-                            const userSpan = document.createElement('span');
-                            userSpan.className = 'selected-item';
-                            userSpan.setAttribute('data-email', userEmail);
-                            userSpan.textContent = userName;
-
-                            const removeBtn = document.createElement('span');
-                            removeBtn.className = 'remove-item';
-                            removeBtn.textContent = '×';
-                            removeBtn.addEventListener('click', function() {
-                                userSpan.remove();
-                            });
-                            userSpan.appendChild(removeBtn);
-
-                            const hiddenInput = document.createElement('input');
-                            hiddenInput.type = 'hidden';
-                            hiddenInput.name = 'selected_users';
-                            hiddenInput.value = userEmail;
-                            userSpan.appendChild(hiddenInput);
-
-                            document.getElementById('selected-users').appendChild(userSpan);
-                        }
-                    });
-                });
-            }
-
-            function updateSelectAllButtons() {
-                var selectAllSegmentsBtn = document.getElementById('select-all-segments-btn');
-                var segmentCheckboxes = document.querySelectorAll('.segment-item input[type="checkbox"]');
-                var allSegmentsChecked = Array.from(segmentCheckboxes).every(cb => cb.checked);
-                selectAllSegmentsBtn.textContent = allSegmentsChecked ? 'Odznacz wszystkie segmenty' : 'Zaznacz wszystkie segmenty';
-
-                var selectAllPossibilitiesBtn = document.getElementById('select-all-possibilities-btn');
-                var prefixCheckboxes = document.querySelectorAll('.prefix-item input[type="checkbox"]');
-                var allPrefixesChecked = Array.from(prefixCheckboxes).every(cb => cb.checked);
-                selectAllPossibilitiesBtn.textContent = allPrefixesChecked ? 'Odznacz wszystkie możliwości' : 'Zaznacz wszystkie możliwości';
-
-                var selectAllPotentialClientsBtn = document.querySelector('.select-deselect-potential-clients-btn');
-                var groupCheckboxes = document.querySelectorAll('.potential-client-group input[type="checkbox"]');
-                var clientCheckboxes = document.querySelectorAll('.potential-clients-list .client-item input[type="checkbox"]');
-                var allPotentialClientsChecked = Array.from(groupCheckboxes).every(cb => cb.checked) && Array.from(clientCheckboxes).every(cb => cb.checked);
-                selectAllPotentialClientsBtn.textContent = allPotentialClientsChecked ? 'Odznacz wszystkich klientów' : 'Zaznacz wszystkich klientów';
-
-                updateEmailToggleButtons();
-                updateCompanyToggleButtons();
-            }
-            function updateEmailToggleButtons() {
-                var emailLists = document.querySelectorAll('.email-list');
-                emailLists.forEach(function(emailList) {
-                    var toggleBtn = emailList.querySelector('.select-deselect-emails-btn');
-                    if (!toggleBtn) return;
-                    var emailCheckboxes = emailList.querySelectorAll('input[type="checkbox"]');
-                    var allChecked = Array.from(emailCheckboxes).every(cb => cb.checked);
-                    toggleBtn.textContent = allChecked ? 'Odznacz Wszystkie' : 'Zaznacz Wszystkie';
-                });
-            }
-            function updateCompanyToggleButtons() {
-                var companyLists = document.querySelectorAll('.company-list');
-                companyLists.forEach(function(companyList) {
-                    var toggleBtn = companyList.querySelector('.select-deselect-companies-btn');
-                    if (!toggleBtn) return;
-                    var companyCheckboxes = companyList.querySelectorAll('.company-item input[type="checkbox"]');
-                    var allChecked = Array.from(companyCheckboxes).every(cb => cb.checked);
-                    toggleBtn.textContent = allChecked ? 'Odznacz Wszystkie' : 'Zaznacz Wszystkie';
-                });
-            }
-
-            document.addEventListener('DOMContentLoaded', function() {
-                // Inicjalizacja CKEditor
-                ClassicEditor
-                    .create(document.querySelector('#message-editor'), {
-                        toolbar: ['bold', 'italic', 'underline', 'bulletedList', 'numberedList', 'link']
-                    })
-                    .then(editor => {
-                        window.editor = editor;
-                        const form = document.getElementById('main-form');
-                        form.addEventListener('submit', (event) => {
-                            event.preventDefault();
-                            const data = editor.getData();
-                            document.querySelector('#message').value = data;
-
-                            const tempElement = document.createElement('div');
-                            tempElement.innerHTML = data;
-                            const textContent = tempElement.textContent || tempElement.innerText || '';
-                            if (textContent.trim() === '') {
-                                showFlashMessage('error', 'Pole "Wiadomość" nie może być puste.');
-                                editor.editing.view.focus();
-                                return;
-                            }
-                            if (!validateParentChildSelection()) {
-                                return;
-                            }
-                            showSpinner('spinner');
-                            const formData = new FormData(form);
-                            const emailCheckboxes = document.querySelectorAll('input[name="include_emails"]:checked, input[name="include_potential_emails"]:checked');
-                            const emails = Array.from(emailCheckboxes).map(cb => cb.value);
-                            const selectedUserEmails = Array.from(document.querySelectorAll('input[name="selected_users"]'))
-                                .map(input => input.value);
-                            const allRecipients = emails.concat(selectedUserEmails);
-                            formData.set('recipients', allRecipients.join(','));
-                            selectedFiles.forEach((file) => {
-                                formData.append('attachments', file);
-                            });
-                            fetch('{{ url_for("send_message_ajax") }}', {
-                                method: 'POST',
-                                body: formData,
-                                credentials: 'same-origin'
-                            })
-                            .then(response => response.json())
-                            .then(data => {
-                                hideSpinner('spinner');
-                                if (data.success) {
-                                    showFlashMessage('success', data.message);
-                                    document.getElementById('attachments-preview').innerHTML = '';
-                                    document.getElementById('attachments-count').textContent = "Załączników: 0/{{ max_attachments }}";
-                                    const langSelect = document.getElementById('language');
-                                    langSelect.selectedIndex = 0;
-                                    updateSelectedItems();
-                                    selectedFiles = [];
-                                } else {
-                                    showFlashMessage('error', data.message);
-                                }
-                            })
-                            .catch(error => {
-                                console.error('Błąd:', error);
-                                hideSpinner('spinner');
-                                showFlashMessage('error', 'Wystąpił błąd podczas wysyłania wiadomości.');
-                            });
-                        });
-                    })
-                    .catch(error => {
-                        console.error('Błąd inicjalizacji CKEditor:', error);
-                    });
-
-                // Obsługa klikania w segmenty
-                document.querySelectorAll('.segment-label').forEach(function(label) {
-                    label.addEventListener('click', function(event) {
-                        var index = this.getAttribute('data-index');
-                        toggleEmailsList(index);
-                        event.stopPropagation();
-                    });
-                });
-                // Obsługa klikania w prefix
-                document.querySelectorAll('.prefix-label').forEach(function(label) {
-                    label.addEventListener('click', function(event) {
-                        var prefixIndex = this.getAttribute('data-index');
-                        togglePrefixList(prefixIndex);
-                        event.stopPropagation();
-                    });
-                });
-                // Obsługa klikania w subitem
-                document.querySelectorAll('.subitem-label').forEach(function(label) {
-                    label.addEventListener('click', function(event) {
-                        var comboIndex = this.getAttribute('data-index');
-                        var parts = comboIndex.split('-');
-                        toggleSubitemList(parts[0], parts[1]);
-                        event.stopPropagation();
-                    });
-                });
-                // Obsługa klikania w grupy potencjalnych klientów
-                document.querySelectorAll('.potential-client-group-label').forEach(function(label) {
-                    label.addEventListener('click', function(event) {
-                        var index = this.getAttribute('data-index');
-                        toggleClientsList(index);
-                        event.stopPropagation();
-                    });
-                });
-
-                // Obsługa edytowania/transferu notatek
-                document.addEventListener('click', function(event) {
-                    if (event.target && event.target.classList.contains('edit-btn')) {
-                        const noteId = event.target.getAttribute('data-note-id');
-                        const noteContent = event.target.getAttribute('data-note-content');
-                        openEditModal(noteId, noteContent);
-                    } else if (event.target && event.target.classList.contains('transfer-note-btn')) {
-                        const noteContent = event.target.getAttribute('data-note-content');
-                        transferToMessageField(noteContent);
-                        showFlashMessage('success', 'Treść notatki została przeniesiona do pola "Wiadomość".');
-                    }
-                });
-
-                // Obsługa dodawania notatki
-                const addNoteForm = document.getElementById('add-note-form');
-                addNoteForm.addEventListener('submit', function(event) {
-                    event.preventDefault();
-                    const noteInput = this.querySelector('input[name="note"]');
-                    const noteContent = noteInput.value.trim();
-                    if (noteContent === '') {
-                        showFlashMessage('error', 'Nie można dodać pustej notatki.');
-                        return;
-                    }
-                    showSpinner('note-spinner');
-                    fetch('{{ url_for("add_note_ajax") }}', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ note: noteContent }),
-                        credentials: 'same-origin'
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        hideSpinner('note-spinner');
-                        if (data.success) {
-                            showFlashMessage('success', data.message);
-                            updateNotesList(data.notes);
-                            noteInput.value = '';
-                        } else {
-                            showFlashMessage('error', data.message);
-                        }
-                    })
-                    .catch(error => {
-                        console.error('Błąd:', error);
-                        hideSpinner('note-spinner');
-                        showFlashMessage('error', 'Wystąpił błąd podczas dodawania notatki.');
-                    });
-                });
-
-                // Obsługa załączników (dropzone)
-                const attachmentsInput = document.getElementById('attachments');
-                const dropzone = document.getElementById('dropzone');
-                const attachmentsPreview = document.getElementById('attachments-preview');
-                const attachmentsCount = document.getElementById('attachments-count');
-                const maxAttachments = {{ max_attachments }};
-                window.selectedFiles = [];
-
-                dropzone.addEventListener('click', () => {
-                    attachmentsInput.click();
-                });
-                attachmentsInput.addEventListener('change', (e) => {
-                    handleFiles(e.target.files);
-                    e.target.value = '';
-                });
-                function preventDefaults(e) {
-                    e.preventDefault();
-                    e.stopPropagation();
-                }
-                ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
-                    dropzone.addEventListener(eventName, preventDefaults, false);
-                    document.body.addEventListener(eventName, preventDefaults, false);
-                });
-                ['dragenter', 'dragover'].forEach(eventName => {
-                    dropzone.addEventListener(eventName, () => dropzone.classList.add('dragover'), false);
-                });
-                ['dragleave', 'drop'].forEach(eventName => {
-                    dropzone.addEventListener(eventName, () => dropzone.classList.remove('dragover'), false);
-                });
-                dropzone.addEventListener('drop', (e) => {
-                    handleFiles(e.dataTransfer.files);
-                });
-                function handleFiles(files) {
-                    for (let file of files) {
-                        if (selectedFiles.length >= maxAttachments) {
-                            alert("Możesz dodać maksymalnie " + maxAttachments + " załączników.");
-                            break;
-                        }
-                        const isDuplicate = selectedFiles.some(f =>
-                            f.name === file.name &&
-                            f.size === file.size &&
-                            f.lastModified === file.lastModified
-                        );
-                        if (!isDuplicate) {
-                            selectedFiles.push(file);
-                        }
-                    }
-                    updatePreview();
-                }
-                function updatePreview() {
-                    attachmentsPreview.innerHTML = '';
-                    selectedFiles.forEach((file, index) => {
-                        const item = document.createElement('div');
-                        item.classList.add('attachment-item');
-                        const span = document.createElement('span');
-                        span.textContent = file.name;
-                        item.appendChild(span);
-                        const removeButton = document.createElement('button');
-                        removeButton.innerHTML = '&times;';
-                        removeButton.addEventListener('click', () => {
-                            selectedFiles.splice(index, 1);
-                            updatePreview();
-                        });
-                        item.appendChild(removeButton);
-                        attachmentsPreview.appendChild(item);
-                    });
-                    attachmentsCount.textContent = `Załączników: ${selectedFiles.length}/${maxAttachments}`;
-                }
-
-                // Obsługa edycji notatki
-                document.addEventListener('submit', function(event) {
-                    if (event.target && event.target.id === 'edit-note-form') {
-                        event.preventDefault();
-                        const form = event.target;
-                        const noteId = form.getAttribute('data-note-id');
-                        const newContent = document.getElementById('edit-note-input').value.trim();
-                        if (newContent === '') {
-                            showFlashMessage('error', 'Nowa treść notatki nie może być pusta.');
-                            return;
-                        }
-                        editNote(noteId, newContent);
-                    } else if (event.target && event.target.classList.contains('delete-note-form')) {
-                        event.preventDefault();
-                        const noteId = event.target.getAttribute('data-note-id');
-                        const spinnerId = 'note-spinner-' + noteId;
-                        showSpinner(spinnerId);
-                        fetch('{{ url_for("delete_note_ajax") }}', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ note_id: noteId }),
-                            credentials: 'same-origin'
-                        })
-                        .then(response => response.json())
-                        .then(data => {
-                            hideSpinner(spinnerId);
-                            if (data.success) {
-                                showFlashMessage('success', data.message);
-                                updateNotesList(data.notes);
-                                updateSelectedItems();
-                            } else {
-                                showFlashMessage('error', data.message);
-                            }
-                        })
-                        .catch(error => {
-                            console.error('Błąd podczas usuwania notatki:', error);
-                            hideSpinner(spinnerId);
-                            showFlashMessage('error', 'Wystąpił błąd podczas usuwania notatki.');
-                        });
-                    } else if (event.target && event.target.id === 'delete-all-notes-form') {
-                        event.preventDefault();
-                        const spinnerId = 'delete-all-spinner';
-                        showSpinner(spinnerId);
-                        fetch('{{ url_for("delete_all_notes_ajax") }}', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({}),
-                            credentials: 'same-origin'
-                        })
-                        .then(response => response.json())
-                        .then(data => {
-                            hideSpinner(spinnerId);
-                            if (data.success) {
-                                showFlashMessage('success', data.message);
-                                updateNotesList(data.notes);
-                                updateSelectedItems();
-                            } else {
-                                showFlashMessage('error', data.message);
-                            }
-                        })
-                        .catch(error => {
-                            console.error('Błąd podczas usuwania wszystkich notatek:', error);
-                            hideSpinner(spinnerId);
-                            showFlashMessage('error', 'Wystąpił błąd podczas usuwania notatek.');
-                        });
-                    }
-                });
-                attachUserNameClickListeners();
-            });
-
-            // FUNKCJA EDYCJI NOTATKI (AJAX)
-            function openEditModal(noteId, currentContent) {
-                const modal = document.getElementById('editModal');
-                const editForm = document.getElementById('edit-note-form');
-                const editInput = document.getElementById('edit-note-input');
-                const closeModalBtn = document.getElementById('closeEditModal');
-                editInput.value = currentContent;
-                editForm.setAttribute('data-note-id', noteId);
-                modal.style.display = 'block';
-                closeModalBtn.onclick = function() {
-                    closeEditModal();
-                }
-                window.onclick = function(event) {
-                    if (event.target == modal) {
-                        closeEditModal();
-                    }
-                }
-            }
-            function closeEditModal() {
-                const modal = document.getElementById('editModal');
-                modal.style.display = 'none';
-            }
-            function editNote(noteId, newContent) {
-                showSpinner('edit-spinner');
-                fetch('{{ url_for("edit_note_ajax") }}', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        note_id: noteId,
-                        new_content: newContent
-                    }),
-                    credentials: 'same-origin'
-                })
-                .then(response => response.json())
-                .then(data => {
-                    hideSpinner('edit-spinner');
-                    if (data.success) {
-                        showFlashMessage('success', data.message);
-                        const noteSpan = document.querySelector('.note[data-note-id="'+ noteId +'"] .note-content');
-                        if (noteSpan) {
-                            noteSpan.textContent = data.note.content;
-                        }
-                        const editBtn = document.querySelector('.note[data-note-id="'+ noteId +'"] .edit-btn');
-                        if (editBtn) {
-                            editBtn.setAttribute('data-note-content', data.note.content);
-                        }
-                        const transferBtn = document.querySelector('.note[data-note-id="'+ noteId +'"] .transfer-note-btn');
-                        if (transferBtn) {
-                            transferBtn.setAttribute('data-note-content', data.note.content);
-                        }
-                    } else {
-                        showFlashMessage('error', data.message);
-                    }
-                    closeEditModal();
-                })
-                .catch(error => {
-                    console.error('Błąd podczas edytowania notatki:', error);
-                    hideSpinner('edit-spinner');
-                    showFlashMessage('error', 'Wystąpił błąd podczas edytowania notatki.');
-                });
-            }
-            function toggleSegmentsList(button) {
-                const segmentsContainer = document.getElementById('segments-container');
-                segmentsContainer.classList.toggle('show');
-                const img = button.querySelector('img');
-                if (img) {
-                    img.classList.toggle('rotate');
-                }
-            }
-            function togglePossibilitiesList(button) {
-                const possibilitiesContainer = document.getElementById('possibilities-container');
-                possibilitiesContainer.classList.toggle('show');
-                const img = button.querySelector('img');
-                if (img) {
-                    img.classList.toggle('rotate');
-                }
-            }
-            function togglePotentialClientsList(button) {
-                const potentialClientsContainer = document.getElementById('potential-clients-container');
-                potentialClientsContainer.classList.toggle('show');
-                const img = button.querySelector('img');
-                if (img) {
-                    img.classList.toggle('rotate');
-                }
-            }
-        </script>
-    </head>
-    <body>
-        <!-- Nagłówek -->
-        <header class="top-header">
-            <div class="header-left">
-                <button id="sidebar-toggle" class="sidebar-toggle-btn" onclick="toggleSidebar(this)">&#9776;</button>
-                <span class="header-title">Ranges</span>
-            </div>
-            <div class="header-right">
-                <div class="user-info">
-                    <span>Witaj, {{ user.username }}!</span>
-                    <a href="{{ url_for('automation.automation_home') }}">Automation</a> |
-                    <a href="{{ url_for('settings') }}">Ustawienia konta</a> |
-                    <a href="{{ url_for('logout') }}">Wyloguj się</a>
-                </div>
-            </div>
-        </header>
-
-        <!-- Formularz główny -->
-        <form id="main-form" class="main-form" enctype="multipart/form-data">
-            <div class="content-wrapper">
-                <!-- Panel boczny -->
-                <div class="sidebar">
-                    <div class="toggle-buttons-container">
-                        <button type="button" class="toggle-segments-btn" onclick="toggleSegmentsList(this)">
-                            <img src="{{ url_for('static', filename='hammer.png') }}" alt="Toggle Segments">
-                        </button>
-                        <button type="button" class="toggle-possibilities-btn" onclick="togglePossibilitiesList(this)">
-                            <img src="{{ url_for('static', filename='greek_key.png') }}" alt="Toggle Possibilities">
-                        </button>
-                        <button type="button" class="toggle-potential-clients-btn" onclick="togglePotentialClientsList(this)">
-                            <img src="{{ url_for('static', filename='money.png') }}" alt="Toggle Potential Clients">
-                        </button>
-                    </div>
-
-                    <!-- SEGMENTY -->
-                    <div id="segments-container" class="segments-container">
-                        <button type="button" id="select-all-segments-btn" class="yellow-btn" onclick="toggleSelectAllSegments(this)">Zaznacz wszystkie segmenty</button>
-                        <button type="button" class="yellow-btn" onclick="toggleAllSegmentsExpandCollapse(this)">Rozwiń wszystkie segmenty</button>
-                        <ul class="segment-list">
-                            {% for segment, counts in segments %}
-                                {% set segment_index = loop.index %}
-                                <li class="segment-item">
-                                    <input type="checkbox" name="segments" value="{{ segment }}" id="segment-{{ segment_index }}" onchange="handleSegmentChange(this)">
-                                    <span class="segment-label" data-index="{{ segment_index }}">
-                                        {{ highlight_triple_brackets(segment)|safe }}
-                                        <span class="segment-count">
-                                          (
-                                            <span class="group-label">Polski:</span>
-                                            <span class="count-number">{{ counts['Polski'] }}</span>,
-                                            <span class="group-label">Zagraniczny:</span>
-                                            <span class="count-number">{{ counts['Zagraniczny'] }}</span>
-                                          )
-                                        </span>
-                                    </span>
-                                </li>
-                                <ul class="email-list" id="emails-{{ segment_index }}">
-                                    <button type="button" class="yellow-btn select-deselect-emails-btn" onclick="toggleSelectAllEmailsInSegment('emails-{{ segment_index }}')">Zaznacz Wszystkie</button>
-                                    {% set emails_companies_polski = get_email_company_pairs_for_segment(data, segment, "Polski") %}
-                                    {% set emails_companies_zagraniczny = get_email_company_pairs_for_segment(data, segment, "Zagraniczny") %}
-                                    {% for pair in emails_companies_polski %}
-                                        <li class="email-item">
-                                            <input type="checkbox" name="include_emails" value="{{ pair.email }}" id="email-{{ segment_index }}-polski-{{ loop.index }}">
-                                            <label for="email-{{ segment_index }}-polski-{{ loop.index }}">{{ pair.company }} (Polski)</label>
-                                        </li>
-                                    {% endfor %}
-                                    {% for pair in emails_companies_zagraniczny %}
-                                        <li class="email-item">
-                                            <input type="checkbox" name="include_emails" value="{{ pair.email }}" id="email-{{ segment_index }}-zagraniczny-{{ loop.index }}">
-                                            <label for="email-{{ segment_index }}-zagraniczny-{{ loop.index }}">{{ pair.company }} (Zagraniczny)</label>
-                                        </li>
-                                    {% endfor %}
-                                </ul>
-                            {% endfor %}
-                        </ul>
-                    </div>
-
-                    <!-- MOŻLIWOŚCI -->
-                    <div id="possibilities-container" class="possibilities-container">
-                        <button type="button" id="select-all-possibilities-btn" class="yellow-btn" onclick="toggleSelectAllPossibilities(this)">
-                            Zaznacz wszystkie możliwości
-                        </button>
-                        <button type="button" class="yellow-btn" onclick="toggleAllPossibilitiesExpandCollapse(this)">
-                            Rozwiń wszystkie możliwości
-                        </button>
-                        <ul class="possibility-list">
-                            {% for prefix, prefix_data in possibilities %}
-                                {% set prefix_index = loop.index %}
-                                <li class="prefix-item">
-                                    <input
-                                        type="checkbox"
-                                        name="prefix_checkboxes"
-                                        value="{{ prefix }}"
-                                        id="prefix-{{ prefix_index }}"
-                                        onchange="handlePrefixChange(this)"
-                                    >
-                                    <span class="prefix-label" data-index="{{ prefix_index }}">
-                                        {{ highlight_triple_brackets(prefix)|safe }}
-                                        <span class="company-count">
-                                            (Polski: {{ prefix_data['Polski'] }}, Zagraniczny: {{ prefix_data['Zagraniczny'] }})
-                                        </span>
-                                    </span>
-                                </li>
-                                <ul class="subitem-list" id="subitems-{{ prefix_index }}">
-                                    {% for full_str, subdetails in prefix_data['subitems'].items() %}
-                                        {% set sub_index = loop.index %}
-                                        <li class="subitem-item">
-                                            <input
-                                                type="checkbox"
-                                                name="subitems"
-                                                value="{{ full_str }}"
-                                                id="subitem-{{ prefix_index }}-{{ sub_index }}"
-                                                onchange="handleSubitemChange(this)"
-                                            >
-                                            <span class="subitem-label" data-index="{{ prefix_index }}-{{ sub_index }}">
-                                                {{ highlight_triple_brackets(full_str)|safe }}
-                                                <span class="subitem-count">
-                                                    (Polski: {{ subdetails['Polski'] }}, Zagraniczny: {{ subdetails['Zagraniczny'] }})
-                                                </span>
-                                            </span>
-                                        </li>
-                                        <ul class="company-list" id="companies-{{ prefix_index }}-{{ sub_index }}">
-                                            <button
-                                                type="button"
-                                                class="yellow-btn select-deselect-companies-btn"
-                                                onclick="toggleSelectAllCompaniesInSubitem('companies-{{ prefix_index }}-{{ sub_index }}')"
-                                            >
-                                                Zaznacz Wszystkie
-                                            </button>
-                                            {% for entry in subdetails['entries'] %}
-                                                <li class="company-item">
-                                                    <input
-                                                        type="checkbox"
-                                                        name="include_emails"
-                                                        value="{{ entry.email }}"
-                                                        id="company-{{ prefix_index }}-{{ sub_index }}-{{ loop.index }}"
-                                                    >
-                                                    <label for="company-{{ prefix_index }}-{{ sub_index }}-{{ loop.index }}">
-                                                        {{ entry.company }} ({{ entry.subsegment }})
-                                                    </label>
-                                                </li>
-                                            {% endfor %}
-                                        </ul>
-                                    {% endfor %}
-                                </ul>
-                            {% endfor %}
-                        </ul>
-                    </div>
-
-                    <!-- POTENCJALNI KLIENCI -->
-                    <div id="potential-clients-container" class="potential-clients-container">
-                        <button type="button" class="yellow-btn select-deselect-potential-clients-btn" onclick="toggleSelectAllPotentialClients(this)">
-                            Zaznacz wszystkich klientów
-                        </button>
-                        <button type="button" class="yellow-btn" onclick="toggleAllPotentialClientsExpandCollapse(this)">
-                            Rozwiń wszystkich potencjalnych klientów
-                        </button>
-                        <ul class="potential-clients-list">
-                            {% for group, clients in potential_clients.items() %}
-                                {% set group_index = loop.index %}
-                                <li class="potential-client-group">
-                                    <input type="checkbox" name="potential_clients" value="{{ group }}" id="potential-group-{{ group_index }}" onchange="handlePotentialClientGroupChange(this)">
-                                    <span class="potential-client-group-label" data-index="{{ group_index }}">
-                                        {{ highlight_triple_brackets(group)|safe }}
-                                    </span>
-                                </li>
-                                <ul class="clients-list" id="clients-{{ group_index }}">
-                                    {% for client in clients %}
-                                        <li class="client-item">
-                                            <input type="checkbox" name="include_potential_emails" value="{{ client.email }}" id="client-{{ group_index }}-{{ loop.index }}">
-                                            <label for="client-{{ group_index }}-{{ loop.index }}">{{ client.company }} ({{ client.language }})</label>
-                                        </li>
-                                    {% endfor %}
-                                </ul>
-                            {% endfor %}
-                        </ul>
-                    </div>
-                </div>
-
-                <!-- Główna treść strony -->
-                <div class="main-content">
-                    <div class="form-container">
-                        <h1>e-Communicator</h1>
-                        <div class="flash-message success"></div>
-                        <div class="flash-message error"></div>
-                        <div class="flash-message warning"></div>
-
-                        <label for="subject">Temat:</label>
-                        <input type="text" id="subject" name="subject" required>
-
-                        <label for="message-editor">Wiadomość:</label>
-                        <div id="message-editor"></div>
-                        <textarea name="message" id="message" style="display: none;"></textarea>
-
-                        <label for="attachments">Załączniki:</label>
-                        <input type="file" name="attachments" id="attachments" multiple style="display: none;">
-                        <div id="dropzone" class="dropzone">Przeciągnij i upuść pliki tutaj lub kliknij, aby wybrać.</div>
-                        <div id="attachments-preview" class="attachments-preview"></div>
-                        <div id="attachments-count" class="attachments-count">Załączników: 0/{{ max_attachments }}</div>
-
-                        <label for="language">Wybierz język:</label>
-                        <select id="language" name="language" required>
-                            <option value="" disabled selected>Wybierz język</option>
-                            <option value="Polski">Polski</option>
-                            <option value="Zagraniczny">Zagraniczny</option>
-                        </select>
-
-                        <div class="button-container" style="display: flex; align-items: flex-start; flex-wrap: wrap; margin-top: 20px;">
-                            <button type="submit" id="send-button">Wyślij</button>
-                            <div id="selected-segments" style="display: flex; gap: 5px; flex-wrap: wrap;"></div>
-                            <div id="selected-possibilities" style="display: flex; gap: 5px; flex-wrap: wrap;"></div>
-                            <div id="selected-potential-clients" style="display: flex; gap: 5px; flex-wrap: wrap; margin-left: 10px;"></div>
-                            <div id="selected-users" style="display: flex; gap: 5px; flex-wrap: wrap;"></div>
-                            <div class="spinner" id="spinner" style="display: none;"></div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </form>
-
-        <!-- Sekcja notatek -->
-        <div class="note-section">
-            <h3>Notatki</h3>
-            <form id="add-note-form">
-                <input type="text" name="note" placeholder="Dodaj notatkę..." required>
-                <button type="submit">Dodaj notatkę</button>
-                <div class="spinner" id="note-spinner" style="display: none;"></div>
-            </form>
-            <ul>
-                {% for note in notes %}
-                    <li class="note" data-note-id="{{ note.id }}">
-                        <div class="note-content">{{ note.content }}</div>
-                        <div class="note-footer">
-                            <div class="note-actions">
-                                <button type="button" class="transfer-note-btn" data-note-content="{{ note.content|e }}">Transfer</button>
-                                <button type="button" class="edit-btn" data-note-id="{{ note.id }}" data-note-content="{{ note.content|e }}">Edytuj</button>
-                                <form class="delete-note-form" data-note-id="{{ note.id }}">
-                                    <button type="submit" class="delete-btn">Usuń</button>
-                                    <div class="spinner" id="note-spinner-{{ note.id }}" style="display: none;"></div>
-                                </form>
-                            </div>
-                            <span class="user-name" style="background-color: {{ note.user.color }};" data-email="{{ note.user.email }}">
-                                {{ note.user.first_name }} {{ note.user.last_name }}
-                            </span>
-                        </div>
-                    </li>
-                {% endfor %}
-            </ul>
-            {% if notes %}
-                <form class="delete-all-notes-form" id="delete-all-notes-form">
-                    <button type="submit">Usuń wszystkie notatki</button>
-                    <div class="spinner" id="delete-all-spinner" style="display: none;"></div>
-                </form>
-            {% endif %}
-        </div>
-
-        <!-- Modal do edycji notatki -->
-        <div id="editModal" class="modal">
-            <div class="modal-content">
-                <span id="closeEditModal" class="close-modal">&times;</span>
-                <h2>Edytuj Notatkę</h2>
-                <form id="edit-note-form" class="modal-form">
-                    <label for="edit-note-input">Treść Notatki:</label>
-                    <input type="text" id="edit-note-input" name="new_content" required>
-                    <button type="submit">Zapisz Zmiany</button>
-                    <div class="spinner" id="edit-spinner" style="display: none;"></div>
-                </form>
-            </div>
-        </div>
-
-        <!-- Stopka -->
-        <footer class="footer">
-            © DigitDrago
-        </footer>
-    </body>
-    </html>
-    '''
-
-    return render_template_string(
-        index_template,
-        user=user,
-        segments=sorted_segments,
-        notes=notes,
-        possibilities=sorted_possibilities,
-        potential_clients=potential_clients,
-        get_email_company_pairs_for_segment=get_email_company_pairs_for_segment,
-        data=data,
-        max_attachments=app.config['MAX_ATTACHMENTS'],
-        highlight_triple_brackets=highlight_triple_brackets
-    )
+    # Zapisane grupy odbiorców użytkownika
+    saved_audiences = SavedAudience.query.filter_by(user_id=user_id).order_by(SavedAudience.name).all()
+
+    # Strona wysyłana kawałkami w miarę renderowania (stream_template)
+    def build():
+        return stream_template(
+            'panel.html',
+            user=user,
+            sidebar_lists=sidebar_lists,
+            notes=notes,
+            saved_audiences=saved_audiences,
+            max_attachments=app.config['MAX_ATTACHMENTS']
+        )
+
+    if snapshot is None:
+        # Zimny start – dane arkusza pobierane dopiero w trakcie strumieniowania,
+        # wersja nie jest jeszcze znana, więc odpowiedź bez ETagu
+        return build()
+    return conditional_response(index_page_etag(user, snapshot, notes, saved_audiences), build)
 
 
 
+@app.cli.command('precompile-templates')
+def precompile_templates():
+    """
+    Kompiluje wszystkie szablony HTML do cache bajtkodu (JINJA_BYTECODE_CACHE_DIR),
+    np. w kroku budowania – pierwsze żądania nie kompilują już szablonów.
+    """
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateSyntaxError as e:
+            print(f"Pominięto szablon {name}: {e}")
+    print(f"Skompilowano {compiled} szablonów do {JINJA_BYTECODE_CACHE_DIR}.")
+
 
 if __name__ == '__main__':
     from apscheduler.schedulers.background import BackgroundScheduler
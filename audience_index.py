@@ -0,0 +1,275 @@
+# audience_index.py
+# Bitmapowy indeks odbiorców: zliczanie i wyznaczanie odbiorców dla dowolnych
+# kombinacji segmentów, możliwości, grup potencjalnych klientów i języków.
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Listy nazw w deskryptorze zaznaczenia i typy list zaznaczonych częściowo
+SELECTION_LISTS = ('segments', 'prefixes', 'subitems', 'groups', 'emails')
+PARTIAL_TYPES = ('segments', 'prefixes', 'subitems', 'groups')
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+def _to_bits(contact_ids):
+    """
+    Bitmapa z numerów – budowana w bytearray, a nie przez kolejne
+    `bits |= 1 << n` (każde tworzy nową, dużą liczbę).
+    """
+    if not contact_ids:
+        return 0
+    buffer = bytearray((max(contact_ids) >> 3) + 1)
+    for contact_id in contact_ids:
+        buffer[contact_id >> 3] |= 1 << (contact_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _iter_ids(bits):
+    """
+    Numery ustawionych bitów, rosnąco.
+    """
+    data = bits.to_bytes((bits.bit_length() + 7) >> 3, 'little')
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield (byte_index << 3) | (low.bit_length() - 1)
+            byte ^= low
+
+
+def _strings(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def is_valid_selection(selection):
+    """
+    Czy deskryptor zaznaczenia (AudienceIndex.resolve) przesłany przez
+    przeglądarkę ma poprawny kształt: obiekt z listami napisów (segment może
+    być też parą [segment, podsegment]), wpisami "partial" z typem, nazwą
+    i listą wykluczeń oraz opcjonalnym językiem.
+    """
+    if not isinstance(selection, dict):
+        return False
+    for key in SELECTION_LISTS:
+        names = selection.get(key)
+        if names is None:
+            continue
+        if not isinstance(names, list):
+            return False
+        for name in names:
+            if isinstance(name, str):
+                continue
+            if key == 'segments' and _strings(name) and len(name) == 2:
+                continue
+            return False
+
+    partial = selection.get('partial')
+    if partial is not None:
+        if not isinstance(partial, list):
+            return False
+        for part in partial:
+            if not isinstance(part, dict) or part.get('type') not in PARTIAL_TYPES:
+                return False
+            if not isinstance(part.get('id'), str):
+                return False
+            exclude = part.get('exclude')
+            if exclude is not None and not _strings(exclude):
+                return False
+
+    language = selection.get('language')
+    return language is None or isinstance(language, str)
+
+
+def is_empty_selection(selection):
+    """
+    Czy poprawny deskryptor zaznaczenia nie wskazuje żadnych odbiorców.
+    """
+    return not any(selection.get(key) for key in SELECTION_LISTS + ('partial',))
+
+
+def _union(bitsets, keys):
+    bits = 0
+    for key in keys:
+        bits |= bitsets.get(key, 0)
+    return bits
+
+
+class AudienceIndex:
+    """
+    Każdy adres e-mail z agregatów dostaje gęsty numer, a każdy segment,
+    możliwość, grupa potencjalnych klientów i język – bitmapę (Python int)
+    adresów, które do niego należą. Sumy i przecięcia zaznaczeń to operacje
+    | i & na liczbach, a liczność to popcount – bez iterowania po kontaktach.
+
+      segments -> {(segment, podsegment): bity}  (adresy z firmą, jak na liście
+                                                  e-maili segmentu)
+      prefixes -> {prefix: bity}
+      subitems -> {pełna etykieta możliwości: bity}
+      groups   -> {grupa potencjalnych klientów: bity}
+      languages-> {język: bity} (z mapy e-mail -> język)
+    """
+
+    def __init__(self, aggregates, subsegments=("Polski", "Zagraniczny")):
+        self.emails = []
+        self._ids = {}
+        self.segments = {}
+        self.prefixes = {}
+        self.subitems = {}
+        self.groups = {}
+        self.languages = {}
+
+        for segment in aggregates.segments:
+            for subsegment in subsegments:
+                pairs = aggregates.segment_index.pairs(segment, subsegment)
+                if pairs:
+                    self.segments[(segment, subsegment)] = self._bits(pair['email'] for pair in pairs)
+
+        contacts = aggregates.contacts
+        for prefix, prefix_data in aggregates.possibilities.items():
+            prefix_bits = 0
+            for full_str, subitem in prefix_data['subitems'].items():
+                bits = self._bits(record.email for record in contacts.resolve(subitem['entries']))
+                self.subitems[full_str] = self.subitems.get(full_str, 0) | bits
+                prefix_bits |= bits
+            self.prefixes[prefix] = prefix_bits
+
+        for group, clients in aggregates.potential_clients.items():
+            self.groups[group] = self._bits(client['email'] for client in clients)
+
+        # Język tylko dla adresów obecnych w indeksie
+        email_language = aggregates.email_language
+        by_language = {}
+        for contact_id, email in enumerate(self.emails):
+            language = email_language.get(email)
+            if language:
+                by_language.setdefault(language, []).append(contact_id)
+        for language, contact_ids in by_language.items():
+            self.languages[language] = _to_bits(contact_ids)
+
+        logger.info(
+            "Indeks odbiorców: %d adresów, %d segmentów, %d możliwości, %d grup.",
+            len(self.emails), len(self.segments), len(self.subitems), len(self.groups)
+        )
+
+    def _id(self, email):
+        contact_id = self._ids.get(email)
+        if contact_id is None:
+            contact_id = self._ids[email] = len(self.emails)
+            self.emails.append(email)
+        return contact_id
+
+    def _bits(self, emails):
+        return _to_bits([self._id(email) for email in emails if email])
+
+    def select(self, segments=(), prefixes=(), subitems=(), groups=(), emails=(),
+               subsegments=("Polski", "Zagraniczny")):
+        """
+        Suma zaznaczeń jako (bity, adresy spoza indeksu).
+
+        segments -> nazwy segmentów (oba podsegmenty) albo krotki
+                    (segment, podsegment); emails -> pojedyncze adresy
+                    (np. zaznaczone ręcznie lub użytkownicy z notatek).
+        """
+        bits = 0
+        for segment in segments:
+            if isinstance(segment, (tuple, list)):
+                bits |= self.segments.get(tuple(segment), 0)
+            else:
+                for subsegment in subsegments:
+                    bits |= self.segments.get((segment, subsegment), 0)
+        bits |= _union(self.prefixes, prefixes)
+        bits |= _union(self.subitems, subitems)
+        bits |= _union(self.groups, groups)
+
+        unknown = set()
+        known = []
+        for email in emails:
+            contact_id = self._ids.get(email)
+            if contact_id is None:
+                if email:
+                    unknown.add(email)
+            else:
+                known.append(contact_id)
+        return bits | _to_bits(known), unknown
+
+    def resolve(self, selection, subsegments=("Polski", "Zagraniczny")):
+        """
+        Wyznacza odbiorców z deskryptora zaznaczenia przesłanego przez
+        przeglądarkę (zamiast listy wszystkich zaznaczonych adresów):
+
+          {
+            "segments": [nazwa, ...],  "prefixes": [...],
+            "subitems": [pełna etykieta, ...],  "groups": [grupa, ...],
+            "partial": [{"type": "segments" | "subitems" | "groups",
+                         "id": nazwa, "exclude": [email, ...]}, ...],
+            "emails": [email, ...]
+          }
+
+        "partial" to lista zaznaczona prawie w całości: jej bitmapa bez
+        wykluczonych adresów. Zwraca (bity, adresy spoza indeksu).
+        Deskryptor o niepoprawnym kształcie (is_valid_selection) -> ValueError.
+        """
+        if not is_valid_selection(selection):
+            raise ValueError("Nieprawidłowy deskryptor zaznaczenia odbiorców.")
+
+        bits, unknown = self.select(
+            segments=selection.get('segments') or (),
+            prefixes=selection.get('prefixes') or (),
+            subitems=selection.get('subitems') or (),
+            groups=selection.get('groups') or (),
+            emails=[email.strip() for email in selection.get('emails') or ()],
+            subsegments=subsegments
+        )
+
+        for part in selection.get('partial') or ():
+            kind, key = part['type'], part['id']
+            if kind == 'segments':
+                part_bits, _ = self.select(segments=[key], subsegments=subsegments)
+            else:
+                part_bits = getattr(self, kind).get(key, 0)
+            excluded, _ = self.select(emails=[email.strip() for email in part.get('exclude') or ()])
+            bits |= part_bits & ~excluded
+        return bits, unknown
+
+    def count(self, bits, unknown=(), unknown_languages=None):
+        """
+        Liczności (bez duplikatów): wszystkich wybranych adresów i w podziale
+        na języki. Adresy spoza indeksu liczą się do języka z
+        unknown_languages ({email: język} – ta sama mapa, według której
+        filtruje je recipients()), a bez wpisu – tylko do sumy.
+        """
+        by_language = {
+            language: _popcount(bits & language_bits)
+            for language, language_bits in self.languages.items()
+        }
+        unknown_languages = unknown_languages or {}
+        for email in unknown:
+            language = unknown_languages.get(email)
+            if language:
+                by_language[language] = by_language.get(language, 0) + 1
+        return {
+            'total': _popcount(bits) + len(unknown),
+            'by_language': by_language,
+        }
+
+    def recipients(self, bits, language, unknown=(), unknown_languages=None):
+        """
+        Zbiór adresów do wysyłki w danym języku: adresy z bitów oraz adresy
+        spoza indeksu, których język w unknown_languages się zgadza.
+        """
+        recipients = set(self.emails_for(bits, language))
+        unknown_languages = unknown_languages or {}
+        recipients.update(email for email in unknown if unknown_languages.get(email) == language)
+        return recipients
+
+    def emails_for(self, bits, language=None):
+        """
+        Adresy odpowiadające bitom (opcjonalnie tylko w danym języku),
+        w kolejności numerów.
+        """
+        if language is not None:
+            bits &= self.languages.get(language, 0)
+        emails = self.emails
+        return [emails[contact_id] for contact_id in _iter_ids(bits)]
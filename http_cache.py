@@ -0,0 +1,19 @@
+# http_cache.py
+# Warunkowe GET (ETag / If-None-Match) dla stron i endpointów z danymi.
+from flask import current_app, make_response, request
+
+
+def conditional_response(etag, build):
+    """
+    Odpowiedź na warunkowe GET: jeśli przeglądarka ma już wersję `etag`
+    (If-None-Match), zwraca 304 bez wywoływania build() – bez renderowania
+    i przesyłania treści. W przeciwnym razie odpowiedź z build() z ETagiem.
+    Cache-Control: no-cache – przeglądarka potwierdza kopię przy każdym użyciu.
+    """
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
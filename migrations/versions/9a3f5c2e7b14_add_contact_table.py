@@ -0,0 +1,42 @@
+"""Add contact table
+
+Revision ID: 9a3f5c2e7b14
+Revises: 62cd9efeb862
+Create Date: 2026-10-18 10:12:41.518203
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '9a3f5c2e7b14'
+down_revision = '62cd9efeb862'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'contact',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('row_hash', sa.BigInteger(), nullable=False),
+        sa.Column('segment', sa.String(255), nullable=False),
+        sa.Column('subsegment', sa.String(255), nullable=False),
+        sa.Column('email', sa.String(255), nullable=False),
+        sa.Column('company', sa.String(500), nullable=False),
+        sa.Column('possibilities', sa.Text(), nullable=False),
+        sa.Column('client_email', sa.String(255), nullable=False),
+        sa.Column('client_company', sa.String(500), nullable=False),
+        sa.Column('client_group', sa.String(255), nullable=False),
+        sa.Column('client_language', sa.String(50), nullable=False),
+    )
+    op.create_index('ix_contact_segment_subsegment', 'contact', ['segment', 'subsegment'])
+    op.create_index('ix_contact_email', 'contact', ['email'])
+    op.create_index('ix_contact_client_group', 'contact', ['client_group'])
+    op.create_index('ix_contact_row_hash', 'contact', ['row_hash'])
+
+
+def downgrade():
+    op.drop_index('ix_contact_row_hash', table_name='contact')
+    op.drop_index('ix_contact_client_group', table_name='contact')
+    op.drop_index('ix_contact_email', table_name='contact')
+    op.drop_index('ix_contact_segment_subsegment', table_name='contact')
+    op.drop_table('contact')
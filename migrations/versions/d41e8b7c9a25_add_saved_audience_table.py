@@ -0,0 +1,39 @@
+"""Add saved_audience table
+
+Revision ID: d41e8b7c9a25
+Revises: 9a3f5c2e7b14
+Create Date: 2026-10-18 14:37:09.204118
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'd41e8b7c9a25'
+down_revision = '9a3f5c2e7b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'saved_audience',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('name', sa.String(150), nullable=False),
+        sa.Column('selection', sa.Text(), nullable=False),
+        sa.Column('language', sa.String(50), nullable=False),
+        sa.Column('recipients', sa.Text(), nullable=False),
+        sa.Column('recipient_count', sa.Integer(), nullable=False),
+        sa.Column('snapshot_version', sa.String(32), nullable=True),
+        sa.Column('last_sent_recipients', sa.Text(), nullable=False),
+        sa.Column('new_since_send', sa.Integer(), nullable=False),
+        sa.Column('last_sent_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('user_id', 'name', name='uq_saved_audience_user_name'),
+    )
+    op.create_index('ix_saved_audience_user_id', 'saved_audience', ['user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_saved_audience_user_id', table_name='saved_audience')
+    op.drop_table('saved_audience')
@@ -0,0 +1,21 @@
+"""Add saved_audience.snapshot_fetched_at
+
+Revision ID: e5b2a7c41f08
+Revises: d41e8b7c9a25
+Create Date: 2026-10-18 19:12:44.518302
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'e5b2a7c41f08'
+down_revision = 'd41e8b7c9a25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('saved_audience', sa.Column('snapshot_fetched_at', sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('saved_audience', 'snapshot_fetched_at')
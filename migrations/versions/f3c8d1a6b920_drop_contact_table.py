@@ -0,0 +1,42 @@
+"""Drop contact table
+
+Revision ID: f3c8d1a6b920
+Revises: e5b2a7c41f08
+Create Date: 2026-10-18 20:41:07.293815
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'f3c8d1a6b920'
+down_revision = 'e5b2a7c41f08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_contact_row_hash', table_name='contact')
+    op.drop_index('ix_contact_client_group', table_name='contact')
+    op.drop_index('ix_contact_email', table_name='contact')
+    op.drop_index('ix_contact_segment_subsegment', table_name='contact')
+    op.drop_table('contact')
+
+
+def downgrade():
+    op.create_table(
+        'contact',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('row_hash', sa.BigInteger(), nullable=False),
+        sa.Column('segment', sa.String(255), nullable=False),
+        sa.Column('subsegment', sa.String(255), nullable=False),
+        sa.Column('email', sa.String(255), nullable=False),
+        sa.Column('company', sa.String(500), nullable=False),
+        sa.Column('possibilities', sa.Text(), nullable=False),
+        sa.Column('client_email', sa.String(255), nullable=False),
+        sa.Column('client_company', sa.String(500), nullable=False),
+        sa.Column('client_group', sa.String(255), nullable=False),
+        sa.Column('client_language', sa.String(50), nullable=False),
+    )
+    op.create_index('ix_contact_segment_subsegment', 'contact', ['segment', 'subsegment'])
+    op.create_index('ix_contact_email', 'contact', ['email'])
+    op.create_index('ix_contact_client_group', 'contact', ['client_group'])
+    op.create_index('ix_contact_row_hash', 'contact', ['row_hash'])
@@ -94,3 +94,59 @@ class VerificationCode(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     code = db.Column(db.String(6), nullable=False)
     expiration_time = db.Column(db.DateTime, nullable=False)
+
+class SavedAudience(db.Model):
+    """
+    Zapisana grupa odbiorców: definicja zaznaczenia (deskryptor jak przy
+    wysyłce), język i zmaterializowany zbiór adresów, odświeżany po każdej
+    nowej wersji arkusza. last_sent_recipients to zbiór z ostatniej wysyłki,
+    new_since_send – ilu adresów w nim nie było.
+    """
+    __tablename__ = 'saved_audience'
+    __table_args__ = (
+        sa.UniqueConstraint('user_id', 'name', name='uq_saved_audience_user_name'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    name = db.Column(db.String(150), nullable=False)
+    selection = db.Column(db.Text, nullable=False)
+    language = db.Column(db.String(50), nullable=False)
+    recipients = db.Column(db.Text, nullable=False, default='')
+    recipient_count = db.Column(db.Integer, nullable=False, default=0)
+    snapshot_version = db.Column(db.String(32), nullable=True)
+    # Moment pobrania zrzutu, z którego policzono zbiór – starszy zrzut
+    # (np. z pliku przy starcie procesu) nie może go nadpisać
+    snapshot_fetched_at = db.Column(db.Float, nullable=True)
+    last_sent_recipients = db.Column(db.Text, nullable=False, default='')
+    new_since_send = db.Column(db.Integer, nullable=False, default=0)
+    last_sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def recipient_set(self):
+        return set(self.recipients.split('\n')) if self.recipients else set()
+
+    def last_sent_set(self):
+        return set(self.last_sent_recipients.split('\n')) if self.last_sent_recipients else set()
+
+    def set_recipients(self, emails, snapshot_version, snapshot_fetched_at=None):
+        """
+        Zapisuje nowy zbiór odbiorców. Zwraca (dodane, usunięte) względem
+        poprzedniego; przy braku zmian nie modyfikuje kolumn z adresami.
+        """
+        emails = set(emails)
+        previous = self.recipient_set()
+        added, removed = emails - previous, previous - emails
+        if added or removed or self.recipients is None:
+            self.recipients = '\n'.join(sorted(emails))
+            self.recipient_count = len(emails)
+            self.new_since_send = len(emails - self.last_sent_set())
+        self.snapshot_version = snapshot_version
+        self.snapshot_fetched_at = snapshot_fetched_at
+        return added, removed
+
+    def mark_sent(self, sent_at):
+        self.last_sent_recipients = self.recipients
+        self.new_since_send = 0
+        self.last_sent_at = sent_at
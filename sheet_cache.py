@@ -0,0 +1,695 @@
+# sheet_cache.py
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from sheet_columns import BINARY_ALIGNMENT, ColumnarSheet
+
+logger = logging.getLogger(__name__)
+
+
+class SheetSnapshot:
+    """
+    Niezmienny zrzut danych arkusza: wiersze (ColumnarSheet), wersja treści
+    i moment pobrania. Dane są współdzielone między żądaniami – nie wolno ich
+    modyfikować.
+
+    Struktury wyliczane z wierszy (indeksy, agregaty) są zapamiętywane przy
+    zrzucie przez derive(), więc powstają raz na wersję danych.
+    """
+    __slots__ = ('rows', 'version', 'fetched_at', 'previous', '_derived', '_derive_lock')
+
+    def __init__(self, rows, version=None, fetched_at=None):
+        self.rows = rows
+        self.version = version or rows.version()
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        # Poprzednio obowiązujący zrzut (do aktualizacji przyrostowej struktur
+        # pochodnych); zwalniany przez builder, który z niego skorzystał
+        self.previous = None
+        self._derived = {}
+        self._derive_lock = threading.RLock()
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def derive(self, name, builder):
+        """
+        Zwraca strukturę `name` wyliczoną funkcją builder(snapshot).
+        Builder jest wywoływany co najwyżej raz dla danego zrzutu.
+        """
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        with self._derive_lock:
+            if name not in self._derived:
+                self._derived[name] = builder(self)
+            return self._derived[name]
+
+    def peek(self, name):
+        """
+        Zwraca już wyliczoną strukturę `name` albo None (bez jej budowania).
+        """
+        return self._derived.get(name)
+
+
+class SingleFlight:
+    """
+    Łączenie równoczesnych wywołań (single-flight): dla danego klucza
+    wykonuje się tylko jedno wywołanie fn(), a pozostali wołający czekają
+    na jego wynik (lub wyjątek).
+    """
+
+    class _Call:
+        __slots__ = ('event', 'result', 'error', 'waiters')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = self._Call()
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class RedisSnapshotStore:
+    """
+    Wspólny (L2) magazyn zrzutów arkusza w Redisie, z którego korzystają
+    wszystkie procesy gunicorn i worker Celery.
+
+    Klucze:
+      {namespace}:current          -> {"version": ..., "fetched_at": ...}
+      {namespace}:data:{version}   -> ColumnarSheet.to_bytes() skompresowane zlib
+    """
+
+    def __init__(self, client, namespace, data_ttl=24 * 3600, lock_timeout=120):
+        self.client = client
+        self.namespace = namespace
+        self.data_ttl = data_ttl
+        self.lock_timeout = lock_timeout
+
+    def lock(self):
+        """
+        Blokada rozproszona na pobieranie arkusza – tylko jeden proces naraz
+        odpytuje Google. Wygasa sama po lock_timeout sekundach.
+        """
+        return self.client.lock(f"{self.namespace}:lock", timeout=self.lock_timeout)
+
+    def _data_key(self, version):
+        return f"{self.namespace}:data:{version}"
+
+    def current_pointer(self):
+        """
+        Zwraca (version, fetched_at) opublikowanego zrzutu albo None.
+        """
+        raw = self.client.get(f"{self.namespace}:current")
+        if not raw:
+            return None
+        pointer = json.loads(raw)
+        return pointer['version'], pointer['fetched_at']
+
+    def load(self, version, fetched_at):
+        blob = self.client.get(self._data_key(version))
+        if blob is None:
+            return None
+        rows = ColumnarSheet.from_bytes(zlib.decompress(blob))
+        return SheetSnapshot(rows, version=version, fetched_at=fetched_at)
+
+    def publish(self, snapshot):
+        pipe = self.client.pipeline()
+        blob = zlib.compress(snapshot.rows.to_bytes(), 6)
+        pipe.set(self._data_key(snapshot.version), blob, ex=self.data_ttl)
+        pipe.set(
+            f"{self.namespace}:current",
+            json.dumps({'version': snapshot.version, 'fetched_at': snapshot.fetched_at})
+        )
+        pipe.execute()
+
+
+class RedisEmailLanguageIndex:
+    """
+    Indeks e-mail -> język (podsegment) w Redisie, utrzymywany razem ze
+    zrzutem arkusza. Ścieżka wysyłki sprawdza języki odbiorców jednym HMGET,
+    bez pobierania arkusza i budowania agregatów w procesie.
+
+    Klucze (oba z tym samym TTL, przedłużanym przy każdej publikacji):
+      {namespace}:current            -> wersja zrzutu, z której zbudowano indeks
+      {namespace}:data:{version}     -> hash {email: język}
+    """
+
+    # Liczba pól w jednym HSET przy publikacji
+    CHUNK = 5000
+
+    def __init__(self, client, namespace, data_ttl=24 * 3600):
+        self.client = client
+        self.namespace = namespace
+        self.data_ttl = data_ttl
+
+    def _data_key(self, version):
+        return f"{self.namespace}:data:{version}"
+
+    def current_version(self):
+        raw = self.client.get(f"{self.namespace}:current")
+        return raw.decode('utf-8') if isinstance(raw, bytes) else raw
+
+    def publish(self, version, email_language):
+        """
+        Zapisuje indeks dla wersji zrzutu i przełącza na nią wskaźnik. Jeśli
+        ta wersja jest już opublikowana, a jej hash wciąż istnieje, tylko
+        przedłuża TTL – arkusz bez zmian przez dobę nie może wygasić indeksu.
+        """
+        key = self._data_key(version)
+        if self.current_version() == version and self.client.expire(key, self.data_ttl):
+            self.client.expire(f"{self.namespace}:current", self.data_ttl)
+            return
+        items = list(email_language.items())
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        for start in range(0, len(items), self.CHUNK):
+            pipe.hset(key, mapping=dict(items[start:start + self.CHUNK]))
+        pipe.expire(key, self.data_ttl)
+        pipe.set(f"{self.namespace}:current", version, ex=self.data_ttl)
+        pipe.execute()
+
+    def languages(self, emails):
+        """
+        Zwraca {email: język} dla podanych adresów (tylko znalezione) albo
+        None, jeśli indeks nie jest opublikowany lub jego hash już wygasł –
+        wołający korzysta wtedy ze zrzutu.
+        """
+        version = self.current_version()
+        if not version:
+            return None
+        key = self._data_key(version)
+        emails = list(emails)
+        if not emails:
+            return {} if self.client.exists(key) else None
+        pipe = self.client.pipeline()
+        pipe.exists(key)
+        pipe.hmget(key, emails)
+        exists, values = pipe.execute()
+        if not exists:
+            return None
+        return {
+            email: value.decode('utf-8') if isinstance(value, bytes) else value
+            for email, value in zip(emails, values)
+            if value is not None
+        }
+
+
+class RedisFragmentStore:
+    """
+    Wyrenderowane fragmenty HTML, które zależą wyłącznie od zrzutu arkusza
+    (np. listy panelu bocznego), współdzielone przez wszystkie procesy.
+    Wersja w kluczu obejmuje wersję zrzutu i szablonu, więc wpisów nie
+    trzeba unieważniać – stare po prostu wygasają.
+
+    Klucze:
+      {namespace}:{name}:{version} -> HTML skompresowany zlib
+    """
+
+    def __init__(self, client, namespace, data_ttl=24 * 3600):
+        self.client = client
+        self.namespace = namespace
+        self.data_ttl = data_ttl
+
+    def _key(self, name, version):
+        return f"{self.namespace}:{name}:{version}"
+
+    def get(self, name, version):
+        blob = self.client.get(self._key(name, version))
+        if blob is None:
+            return None
+        return zlib.decompress(blob).decode('utf-8')
+
+    def put(self, name, version, html):
+        self.client.set(self._key(name, version), zlib.compress(html.encode('utf-8'), 6), ex=self.data_ttl)
+
+
+class SnapshotFile:
+    """
+    Zrzut arkusza w pliku binarnym, czytany przez mmap tylko do odczytu.
+    Wszystkie procesy na maszynie (workery gunicorn, Celery) mapują ten sam
+    plik, więc tablice kodów i hashe wierszy zajmują w pamięci jedną kopię
+    stron współdzieloną przez system. Plik przeżywa restart procesów
+    i służy do "ciepłego startu" zanim pierwsze pobranie się zakończy.
+
+    Format: MAGIC, długość nagłówka, nagłówek JSON {"version", "fetched_at"}
+    dopełniony do BINARY_ALIGNMENT, a dalej ColumnarSheet.to_bytes() z hashami
+    wierszy. Zapis idzie do pliku tymczasowego podmienianego atomowo
+    (os.replace), więc czytelnicy zawsze widzą kompletny plik, a już
+    zmapowane wersje pozostają ważne.
+    """
+
+    MAGIC = b'SHEETSN1'
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, snapshot):
+        meta = json.dumps({'version': snapshot.version, 'fetched_at': snapshot.fetched_at}).encode('utf-8')
+        meta += b' ' * (-(len(self.MAGIC) + 4 + len(meta)) % BINARY_ALIGNMENT)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self.MAGIC)
+                f.write(struct.pack('<I', len(meta)))
+                f.write(meta)
+                f.write(snapshot.rows.to_bytes(include_row_hashes=True))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def read_meta(self):
+        """
+        Zwraca (version, fetched_at) zrzutu w pliku albo None, jeśli pliku brak.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                head = f.read(len(self.MAGIC) + 4)
+                if len(head) < len(self.MAGIC) + 4 or not head.startswith(self.MAGIC):
+                    return None
+                (meta_len,) = struct.unpack_from('<I', head, len(self.MAGIC))
+                meta = json.loads(f.read(meta_len))
+        except FileNotFoundError:
+            return None
+        return meta['version'], meta['fetched_at']
+
+    def load(self):
+        """
+        Mapuje plik i zwraca SheetSnapshot, którego tablice wskazują wprost
+        na zmapowane strony, albo None, jeśli pliku brak.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+        view = memoryview(mapped)
+        if view[:len(self.MAGIC)] != self.MAGIC:
+            return None
+        (meta_len,) = struct.unpack_from('<I', view, len(self.MAGIC))
+        offset = len(self.MAGIC) + 4
+        meta = json.loads(bytes(view[offset:offset + meta_len]))
+        # Widoki na mapowanie trzymają je przy życiu tak długo jak zrzut
+        rows = ColumnarSheet.from_bytes(view[offset + meta_len:], copy=False)
+        return SheetSnapshot(rows, version=meta['version'], fetched_at=meta['fetched_at'])
+
+
+class SnapshotCache:
+    """
+    Cache zrzutu arkusza w pamięci procesu z TTL i strategią
+    "stale-while-revalidate":
+
+      - świeży zrzut (wiek < ttl) jest zwracany od razu,
+      - przeterminowany zrzut też jest zwracany od razu, a w tle startuje
+        jedno odświeżenie (nigdy kilka naraz),
+      - tylko przy pustym cache żądanie czeka na pobranie danych.
+
+    Pobrania są łączone (single-flight): w procesie trwa najwyżej jedno,
+    a z magazynem L2 – najwyżej jedno we wszystkich procesach (blokada
+    w Redisie). Pozostali wołający czekają na jego wynik.
+
+    loader -> funkcja bez argumentów zwracająca dane arkusza (ColumnarSheet).
+    store  -> opcjonalny magazyn L2 (RedisSnapshotStore). Przed wywołaniem
+              loadera cache sprawdza, czy inny proces nie opublikował już
+              świeżego zrzutu; własne pobrania są publikowane w magazynie.
+    store_max_age -> maksymalny wiek zrzutu z magazynu L2, przy którym nie
+              pobieramy danych sami (domyślnie ttl). Gdy zrzuty publikuje
+              okresowe zadanie, jest to wielokrotność jego interwału, a ttl
+              oznacza jedynie, jak często proces sprawdza magazyn.
+    snapshot_file -> opcjonalny SnapshotFile. Każdy nowy zrzut jest zapisywany
+              do pliku i czytany z niego przez mmap (jedna kopia danych na
+              maszynę); przy pustym cache zrzut z pliku jest zwracany od razu,
+              a odświeżenie startuje w tle.
+    on_new_version -> opcjonalna funkcja on_new_version(snapshot) wywoływana
+              w osobnym wątku za każdym razem, gdy proces zaczyna używać nowej
+              wersji danych (własne pobranie, magazyn L2 lub plik) – np. do
+              przeliczenia struktur trzymanych poza cache.
+    """
+
+    def __init__(self, loader, ttl=300, retry_after=30, name='sheet', store=None, lock_wait=60,
+                 store_max_age=None, snapshot_file=None, on_new_version=None):
+        self.loader = loader
+        self.on_new_version = on_new_version
+        self.store = store
+        self.snapshot_file = snapshot_file
+        self.ttl = ttl
+        self.store_max_age = store_max_age if store_max_age is not None else ttl
+        self.retry_after = retry_after
+        self.name = name
+        self.lock_wait = lock_wait
+
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._refreshing = False
+        self._next_retry = 0.0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.file_hits = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.last_error = None
+
+    def get(self):
+        """
+        Zwraca aktualny SheetSnapshot. Blokuje tylko, gdy cache jest pusty.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                if time.time() - self._checked_at < self.ttl:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                    self._start_background_refresh()
+                return snapshot
+            self.misses += 1
+
+        snapshot = self._warm_start()
+        if snapshot is not None:
+            return snapshot
+        return self.refresh()
+
+    def peek(self):
+        """
+        Zwraca bieżący zrzut albo None – bez pobierania i bez odświeżania.
+        """
+        with self._lock:
+            return self._snapshot
+
+    def refresh(self, force=False):
+        """
+        Synchronicznie pobiera dane i podmienia zrzut w cache.
+        Zwraca nowy SheetSnapshot; wyjątki loadera są przekazywane dalej.
+        Równoczesne wywołania w procesie czekają na jedno wspólne pobranie.
+
+        force=True pomija magazyn L2 i zawsze odpytuje źródło danych.
+        """
+        return self._flight.do((self.name, force), lambda: self._refresh(force))
+
+    def _refresh(self, force=False):
+        if not force:
+            snapshot = self._load_from_store()
+            if snapshot is not None:
+                return snapshot
+
+        lock = self._acquire_store_lock()
+        try:
+            if lock is not None and not force:
+                # W czasie oczekiwania na blokadę inny proces mógł już
+                # opublikować świeży zrzut
+                snapshot = self._load_from_store()
+                if snapshot is not None:
+                    return snapshot
+            return self._fetch()
+        finally:
+            if lock is not None:
+                try:
+                    lock.release()
+                except Exception as e:
+                    logger.warning("Cache '%s': nie udało się zwolnić blokady: %s", self.name, e)
+
+    def _acquire_store_lock(self):
+        """
+        Zwraca zdobytą blokadę z magazynu L2 albo None (brak magazynu, Redis
+        niedostępny lub zbyt długie oczekiwanie – wtedy pobieramy sami).
+        """
+        if self.store is None:
+            return None
+        try:
+            lock = self.store.lock()
+            if lock.acquire(blocking_timeout=self.lock_wait):
+                return lock
+            logger.warning("Cache '%s': nie doczekano się blokady pobierania.", self.name)
+        except Exception as e:
+            logger.warning("Cache '%s': blokada w magazynie L2 niedostępna: %s", self.name, e)
+        return None
+
+    def _fetch(self):
+        started = time.time()
+        try:
+            rows = self.loader()
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self.last_error = str(e)
+                self._next_retry = time.time() + self.retry_after
+            raise
+
+        snapshot = SheetSnapshot(rows, fetched_at=started)
+        with self._lock:
+            previous = self._snapshot
+        if previous is None or previous.version != snapshot.version:
+            snapshot = self._share(snapshot)
+
+        with self._lock:
+            previous = self._snapshot
+            if previous is not None and previous.version == snapshot.version:
+                # Treść bez zmian – zachowujemy zrzut razem z jego strukturami
+                previous.fetched_at = started
+                snapshot = previous
+            else:
+                self._install(snapshot)
+            self._checked_at = time.time()
+            self.refreshes += 1
+            self.last_error = None
+
+        if previous is None or previous.version != snapshot.version:
+            logger.info(
+                "Cache '%s': nowa wersja danych %s (%d wierszy, %.2fs).",
+                self.name, snapshot.version, len(rows), time.time() - started
+            )
+
+        if self.store is not None:
+            try:
+                self.store.publish(snapshot)
+            except Exception as e:
+                logger.warning("Cache '%s': nie udało się opublikować zrzutu: %s", self.name, e)
+        return snapshot
+
+    def _load_from_store(self):
+        """
+        Zwraca świeży zrzut z magazynu L2 (i umieszcza go w L1) albo None,
+        jeśli magazynu brak, jest niedostępny lub jego zrzut jest przeterminowany.
+        """
+        if self.store is None:
+            return None
+        try:
+            pointer = self.store.current_pointer()
+            if pointer is None:
+                return None
+            version, fetched_at = pointer
+            if time.time() - fetched_at >= self.store_max_age:
+                return None
+
+            with self._lock:
+                current = self._snapshot
+            if current is not None and current.version == version:
+                # Ta sama treść – wystarczy przesunąć znacznik czasu
+                current.fetched_at = fetched_at
+                snapshot = current
+            else:
+                snapshot = self._load_from_file(version)
+                if snapshot is None:
+                    snapshot = self.store.load(version, fetched_at)
+                    if snapshot is None:
+                        return None
+                    snapshot = self._share(snapshot)
+                snapshot.fetched_at = fetched_at
+        except Exception as e:
+            logger.warning("Cache '%s': magazyn L2 niedostępny: %s", self.name, e)
+            return None
+
+        with self._lock:
+            if snapshot is not self._snapshot:
+                self._install(snapshot)
+            self._checked_at = time.time()
+            self.store_hits += 1
+        return snapshot
+
+    def _load_from_file(self, version=None):
+        """
+        Zrzut zmapowany z pliku (jeśli jest w nim wersja `version`, a przy
+        version=None – dowolna) albo None.
+        """
+        if self.snapshot_file is None:
+            return None
+        try:
+            meta = self.snapshot_file.read_meta()
+            if meta is None or (version is not None and meta[0] != version):
+                return None
+            snapshot = self.snapshot_file.load()
+        except Exception as e:
+            logger.warning("Cache '%s': nie udało się odczytać pliku zrzutu: %s", self.name, e)
+            return None
+        if snapshot is not None and version is not None and snapshot.version != version:
+            # Inny proces podmienił plik między read_meta() a load()
+            return None
+        if snapshot is not None:
+            with self._lock:
+                self.file_hits += 1
+        return snapshot
+
+    def _share(self, snapshot):
+        """
+        Zapisuje zrzut do pliku i zwraca jego wersję zmapowaną przez mmap
+        (współdzieloną z innymi procesami); bez pliku lub przy błędzie zapisu
+        zwraca zrzut bez zmian.
+        """
+        if self.snapshot_file is None:
+            return snapshot
+        try:
+            self.snapshot_file.write(snapshot)
+            shared = self.snapshot_file.load()
+        except Exception as e:
+            logger.warning("Cache '%s': nie udało się zapisać pliku zrzutu: %s", self.name, e)
+            return snapshot
+        if shared is None or shared.version != snapshot.version:
+            # W międzyczasie inny proces zapisał nowszy zrzut
+            return snapshot
+        shared.fetched_at = snapshot.fetched_at
+        return shared
+
+    def _warm_start(self):
+        """
+        Przy pustym cache instaluje zrzut z pliku (np. po restarcie procesu).
+        Przeterminowany zrzut jest zwracany od razu, a odświeżenie idzie w tle.
+        """
+        snapshot = self._load_from_file()
+        if snapshot is None:
+            return None
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            self._install(snapshot)
+            self._checked_at = snapshot.fetched_at
+            if time.time() - self._checked_at >= self.ttl:
+                self._start_background_refresh()
+        logger.info(
+            "Cache '%s': ciepły start z pliku, wersja %s (wiek %.0fs).",
+            self.name, snapshot.version, snapshot.age
+        )
+        return snapshot
+
+    # Wywoływane wyłącznie pod self._lock
+    def _install(self, snapshot):
+        previous = self._snapshot
+        if previous is not None:
+            previous.previous = None
+            snapshot.previous = previous
+        self._snapshot = snapshot
+        if self.on_new_version is not None and (previous is None or previous.version != snapshot.version):
+            thread = threading.Thread(
+                target=self._notify_new_version,
+                args=(snapshot,),
+                name=f"{self.name}-cache-new-version",
+                daemon=True
+            )
+            thread.start()
+
+    def _notify_new_version(self, snapshot):
+        try:
+            self.on_new_version(snapshot)
+        except Exception as e:
+            logger.error("Cache '%s': obsługa nowej wersji %s nie powiodła się: %s", self.name, snapshot.version, e)
+
+    def invalidate(self):
+        """
+        Oznacza bieżący zrzut jako przeterminowany – kolejne get() zwróci go
+        jeszcze raz, ale uruchomi odświeżenie w tle.
+        """
+        with self._lock:
+            self._checked_at = 0.0
+            self._next_retry = 0.0
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                'name': self.name,
+                'ttl': self.ttl,
+                'version': snapshot.version if snapshot else None,
+                'age': round(snapshot.age, 1) if snapshot else None,
+                'rows': len(snapshot.rows) if snapshot else 0,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'store_hits': self.store_hits,
+                'file_hits': self.file_hits,
+                'refreshes': self.refreshes,
+                'coalesced': self._flight.coalesced,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'refreshing': self._refreshing,
+            }
+
+    # Wywoływane wyłącznie pod self._lock
+    def _start_background_refresh(self):
+        if self._refreshing or time.time() < self._next_retry:
+            return
+        self._refreshing = True
+        thread = threading.Thread(
+            target=self._background_refresh,
+            name=f"{self.name}-cache-refresh",
+            daemon=True
+        )
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error("Cache '%s': odświeżanie w tle nie powiodło się: %s", self.name, e)
+        finally:
+            with self._lock:
+                self._refreshing = False
@@ -0,0 +1,333 @@
+# sheet_columns.py
+# Kolumnowa, zwarta reprezentacja danych arkusza.
+import hashlib
+import json
+import operator
+import struct
+import sys
+from array import array
+
+# Kolumny arkusza (indeksy od zera)
+COL_SEGMENT = 16            # Q
+COL_EMAIL = 17              # R
+COL_COMPANY = 20            # U
+COL_SUBSEGMENT = 23         # X
+COL_POSSIBILITIES = range(25, 34)   # Z..AH
+COL_CLIENT_COMPANY = 45     # AT
+COL_CLIENT_EMAIL = 46       # AU
+COL_CLIENT_GROUP = 47       # AV
+COL_CLIENT_LANGUAGE = 49    # AX
+
+ROW_WIDTH = 50
+
+# Wyrównanie początku tablic w postaci binarnej – pozwala czytać je
+# bezpośrednio z bufora (memoryview.cast), np. z pliku zmapowanego mmap
+BINARY_ALIGNMENT = 8
+
+# Jedyne kolumny, z których korzysta aplikacja – tylko one są przechowywane
+USED_COLUMNS = (
+    COL_SEGMENT, COL_EMAIL, COL_COMPANY, COL_SUBSEGMENT,
+    *COL_POSSIBILITIES,
+    COL_CLIENT_COMPANY, COL_CLIENT_EMAIL, COL_CLIENT_GROUP, COL_CLIENT_LANGUAGE,
+)
+
+
+def column_letter(index):
+    """
+    Zamienia indeks kolumny (od zera) na oznaczenie literowe: 0 -> A, 25 -> Z, 26 -> AA.
+    """
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def projected_ranges(columns=USED_COLUMNS, first_row=2):
+    """
+    Grupuje kolumny w ciągłe zakresy A1 (np. 'Z2:AH') do zapytania batchGet.
+    Zwraca listę krotek (zakres, indeks pierwszej kolumny zakresu).
+    """
+    ranges = []
+    ordered = sorted(set(columns))
+    start = previous = ordered[0] if ordered else None
+    for column in ordered[1:] + [None]:
+        if column is not None and column == previous + 1:
+            previous = column
+            continue
+        ranges.append((f"{column_letter(start)}{first_row}:{column_letter(previous)}", start))
+        start = previous = column
+    return ranges
+
+
+def cell_text(value):
+    """
+    Tekstowa postać komórki pobranej jako UNFORMATTED_VALUE
+    (liczby całkowite bez '.0', wartości logiczne jak w arkuszu).
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _typecode(codes):
+    """
+    Typ elementów tablicy kodów – array.typecode albo memoryview.format.
+    """
+    return getattr(codes, 'typecode', None) or codes.format
+
+
+def _codes_typecode(size):
+    """
+    Najmniejszy typ tablicy mieszczący kody słownika o rozmiarze `size`.
+    """
+    if size <= 0xFF:
+        return 'B'
+    if size <= 0xFFFF:
+        return 'H'
+    return 'I'
+
+
+class SheetRow:
+    """
+    Lekki widok jednego wiersza ColumnarSheet, zachowujący się jak dawna
+    lista 50 komórek: row[i] zwraca tekst komórki ('' dla kolumn, których
+    nie przechowujemy), len(row) == ROW_WIDTH.
+    """
+    __slots__ = ('_sheet', '_index')
+
+    def __init__(self, sheet, index):
+        self._sheet = sheet
+        self._index = index
+
+    def __getitem__(self, column):
+        codes = self._sheet.columns.get(column)
+        if codes is None:
+            return ''
+        return self._sheet.strings[codes[self._index]]
+
+    def __len__(self):
+        return ROW_WIDTH
+
+    def to_list(self):
+        return [self[column] for column in range(ROW_WIDTH)]
+
+
+class ColumnarSheet:
+    """
+    Dane arkusza przechowywane kolumnami zamiast listy list:
+
+      strings  -> słownik (lista) unikalnych, internowanych napisów;
+                  strings[0] == '' (pusta komórka),
+      columns  -> {indeks kolumny: array z kodami do `strings`} – tylko
+                  dla kolumn z USED_COLUMNS,
+      n_rows   -> liczba wierszy.
+
+    Iteracja zwraca widoki SheetRow, więc kod oparty na row[i] działa bez
+    zmian; pętle wydajnościowe powinny korzystać z values()/stripped_values().
+
+    Tablice kodów mogą być też widokami memoryview na cudzy bufor
+    (from_bytes(..., copy=False)) – np. na plik zmapowany w pamięci, którego
+    strony współdzielą wszystkie procesy.
+    """
+    __slots__ = ('strings', 'columns', 'n_rows', '_stripped', '_row_hashes')
+
+    def __init__(self, strings, columns, n_rows):
+        self.strings = strings
+        self.columns = columns
+        self.n_rows = n_rows
+        self._stripped = None
+        self._row_hashes = None
+
+    @classmethod
+    def from_rows(cls, rows, used_columns=USED_COLUMNS, schema=None):
+        """
+        Buduje ColumnarSheet z listy wierszy (list napisów dowolnej długości).
+
+        schema -> opcjonalny SheetSchema (sheet_schema) mapujący kolumny arkusza
+                  na kolumny kanoniczne; bez niego kolumny `used_columns` są
+                  czytane z ich domyślnych pozycji.
+        """
+        if schema is not None:
+            used_columns, source_columns = schema.columns, schema.source_columns
+        else:
+            source_columns = used_columns
+        width = max(source_columns) + 1
+        padding = [''] * width
+        # Dodatkowa ostatnia kolumna: itemgetter zawsze zwraca krotkę
+        # (zip kończy się na `appends`, więc jest pomijana)
+        getter = operator.itemgetter(*source_columns, width - 1)
+
+        strings = ['']
+        lookup = {'': 0}
+        code_arrays = [array('I') for _ in used_columns]
+        appends = [codes.append for codes in code_arrays]
+
+        # itemgetter zamiast row[i] dla każdej komórki; krótsze wiersze
+        # (API obcina puste komórki na końcu) są raz dopełniane
+        for row in rows:
+            if len(row) < width:
+                row = row + padding[len(row):]
+            for append, value in zip(appends, getter(row)):
+                code = lookup.get(value)
+                if code is None:
+                    if value.__class__ is not str:
+                        value = cell_text(value)
+                        code = lookup.get(value)
+                    if code is None:
+                        code = lookup[value] = len(strings)
+                        strings.append(sys.intern(value))
+                append(code)
+
+        typecode = _codes_typecode(len(strings))
+        columns = {column: array(typecode, codes) for column, codes in zip(used_columns, code_arrays)}
+        return cls(strings, columns, len(rows))
+
+    @classmethod
+    def from_columns(cls, column_values, used_columns=USED_COLUMNS):
+        """
+        Buduje ColumnarSheet z danych pobranych kolumnami:
+        {indeks kolumny: [wartości kolejnych wierszy]}. Kolumny mogą mieć różną
+        długość (API obcina puste komórki na końcu) – brakujące to ''.
+        """
+        n_rows = max((len(values) for values in column_values.values()), default=0)
+        strings = ['']
+        lookup = {'': 0}
+        raw_columns = {}
+
+        for column in used_columns:
+            codes = array('I')
+            for value in column_values.get(column, ()):
+                value = cell_text(value)
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(strings)
+                    strings.append(sys.intern(value))
+                codes.append(code)
+            if len(codes) < n_rows:
+                codes.extend([0] * (n_rows - len(codes)))
+            raw_columns[column] = codes
+
+        typecode = _codes_typecode(len(strings))
+        columns = {column: array(typecode, codes) for column, codes in raw_columns.items()}
+        return cls(strings, columns, n_rows)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, index):
+        if not -self.n_rows <= index < self.n_rows:
+            raise IndexError(index)
+        return SheetRow(self, index % self.n_rows)
+
+    def __iter__(self):
+        for index in range(self.n_rows):
+            yield SheetRow(self, index)
+
+    def values(self, column):
+        """
+        Iterator po wartościach kolumny (napisy w oryginalnej postaci).
+        """
+        codes = self.columns.get(column)
+        if codes is None:
+            return iter([''] * self.n_rows)
+        return map(self.strings.__getitem__, codes)
+
+    def stripped_values(self, column):
+        """
+        Jak values(), ale napisy są już po strip() – liczonym raz na unikalną
+        wartość, a nie raz na komórkę.
+        """
+        if self._stripped is None:
+            self._stripped = [sys.intern(value.strip()) for value in self.strings]
+        codes = self.columns.get(column)
+        if codes is None:
+            return iter([''] * self.n_rows)
+        return map(self._stripped.__getitem__, codes)
+
+    def row_hashes(self):
+        """
+        64-bitowy hash treści każdego wiersza (array 'q'), stabilny między
+        procesami: napisy są hashowane blake2b raz na unikalną wartość,
+        a wiersz to hash krotki tych liczb.
+        """
+        if self._row_hashes is None:
+            string_hashes = [
+                int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+                for value in self.strings
+            ]
+            columns = [map(string_hashes.__getitem__, self.columns[column]) for column in sorted(self.columns)]
+            self._row_hashes = array('q', map(hash, zip(*columns)))
+        return self._row_hashes
+
+    def version(self):
+        """
+        Skrót treści (wersja danych) – liczony z bajtów tablic i słownika.
+        """
+        digest = hashlib.sha1()
+        digest.update(b'\0'.join(value.encode('utf-8') for value in self.strings))
+        for column in sorted(self.columns):
+            digest.update(str(column).encode('ascii'))
+            digest.update(self.columns[column].tobytes())
+        return digest.hexdigest()[:16]
+
+    def to_bytes(self, include_row_hashes=False):
+        """
+        Zwarta postać binarna: długość nagłówka JSON, nagłówek
+        (liczba wierszy, typ kodów, kolumny, słownik), opcjonalnie hashe
+        wierszy, a potem surowe tablice kodów. Nagłówek jest dopełniony
+        spacjami do BINARY_ALIGNMENT, więc tablice zaczynają się od
+        wyrównanego przesunięcia.
+        """
+        order = sorted(self.columns)
+        typecode = _typecode(self.columns[order[0]]) if order else 'B'
+        header = json.dumps({
+            'rows': self.n_rows,
+            'typecode': typecode,
+            'columns': order,
+            'strings': self.strings,
+            'row_hashes': include_row_hashes,
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        header += b' ' * (-(4 + len(header)) % BINARY_ALIGNMENT)
+
+        parts = [struct.pack('<I', len(header)), header]
+        if include_row_hashes:
+            parts.append(self.row_hashes().tobytes())
+        parts.extend(self.columns[column].tobytes() for column in order)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob, copy=True):
+        """
+        Odtwarza ColumnarSheet z to_bytes(). Przy copy=False tablice są
+        widokami memoryview na `blob` (bez kopiowania) – blob musi wtedy
+        pozostać niezmieniony przez cały czas życia obiektu.
+        """
+        view = memoryview(blob)
+        (header_len,) = struct.unpack_from('<I', view, 0)
+        header = json.loads(bytes(view[4:4 + header_len]).decode('utf-8'))
+        strings = [sys.intern(value) for value in header['strings']]
+        n_rows = header['rows']
+        offset = 4 + header_len
+
+        def take(typecode):
+            nonlocal offset
+            size = n_rows * array(typecode).itemsize
+            chunk = view[offset:offset + size]
+            offset += size
+            if not copy:
+                return chunk.cast(typecode)
+            codes = array(typecode)
+            codes.frombytes(chunk)
+            return codes
+
+        row_hashes = take('q') if header.get('row_hashes') else None
+        columns = {column: take(header['typecode']) for column in header['columns']}
+        sheet = cls(strings, columns, n_rows)
+        sheet._row_hashes = row_hashes
+        return sheet
@@ -0,0 +1,734 @@
+# sheet_index.py
+# Struktury pochodne budowane jednorazowo dla zrzutu arkusza (SheetSnapshot).
+import copy
+import functools
+import itertools
+import logging
+import re
+import sys
+import threading
+from array import array
+
+from sheet_columns import (
+    COL_SEGMENT, COL_EMAIL, COL_COMPANY, COL_SUBSEGMENT, COL_POSSIBILITIES,
+    COL_CLIENT_COMPANY, COL_CLIENT_EMAIL, COL_CLIENT_GROUP, COL_CLIENT_LANGUAGE,
+)
+
+logger = logging.getLogger(__name__)
+
+SUBSEGMENTS = ("Polski", "Zagraniczny")
+
+# Powyżej tej części zmienionych wierszy pełne przeliczenie jest tańsze
+# niż aktualizacja przyrostowa
+INCREMENTAL_MAX_CHANGE_RATIO = 0.25
+
+# Tabela kontaktów współdzielona przez kolejne wersje przyrostowe zachowuje
+# też kontakty usunięte z arkusza; gdy urośnie tyle razy ponad rozmiar
+# z pełnego przeliczenia, kolejna wersja jest liczona od zera (z nową tabelą)
+CONTACT_TABLE_MAX_GROWTH = 2
+CONTACT_TABLE_MIN_SIZE = 1024
+
+
+# Etykiety z arkusza: "prefix [[[ wyróżniony fragment ]]] reszta"
+_BRACKETS_RE = re.compile(r'^(.*?)\s*\[\[\[(.*)\]\]\](.*)$')
+_HIGHLIGHT_RE = re.compile(r"\[\[\[(.*?)\]\]\]")
+_HIGHLIGHT_REPLACEMENT = r'<span style="color: orange; white-space: nowrap; margin: 0 3px;">\1</span>'
+
+# Liczba etykiet pamiętanych przez parse_label / highlight_label. Etykiety
+# powtarzają się między wierszami i zrzutami, więc koszt parsowania zależy
+# od liczby unikalnych etykiet, a nie od wierszy × kolumn
+LABEL_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=LABEL_CACHE_SIZE)
+def highlight_label(text):
+    """
+    Zamienia fragmenty [[[ ... ]]] na wyróżnione <span> (HTML do |safe).
+    """
+    return _HIGHLIGHT_RE.sub(_HIGHLIGHT_REPLACEMENT, text)
+
+
+@functools.lru_cache(maxsize=LABEL_CACHE_SIZE)
+def parse_label(possibility_str):
+    """
+    Zwraca krotkę (prefix, full_str, html) dla etykiety możliwości:
+      - prefix: tekst przed pierwszym [[[ ... ]]] (bez zbędnych spacji),
+        a gdy nawiasów brak – cała etykieta po strip(),
+      - full_str: oryginalny ciąg,
+      - html: full_str z wyróżnionymi fragmentami (highlight_label).
+    """
+    match = _BRACKETS_RE.match(possibility_str)
+    prefix = match.group(1).strip() if match else possibility_str.strip()
+    return sys.intern(prefix), possibility_str, highlight_label(possibility_str)
+
+
+def extract_prefix(possibility_str):
+    """
+    Rozdziela przekazany ciąg possibility_str na:
+      - prefix: tekst przed pierwszym [[[ ... ]]] (bez zbędnych spacji)
+      - full_str: oryginalny ciąg possibility_str
+
+    Jeśli possibility_str nie zawiera [[[ ... ]]], prefix = possibility_str (całość).
+    """
+    prefix, full_str, _ = parse_label(possibility_str)
+    return prefix, full_str
+
+
+class _NoCopy:
+    """
+    Budowa od zera – wszystkie kontenery należą do budowanej struktury.
+    """
+
+    @staticmethod
+    def item(parent, key):
+        return parent[key]
+
+    @staticmethod
+    def fresh(container):
+        return container
+
+
+class _CopyOnWrite:
+    """
+    Aktualizacja przyrostowa: nowa wersja struktury współdzieli niezmienione
+    kontenery z poprzednią, a każdy modyfikowany kontener jest najpierw
+    kopiowany (raz na aktualizację). Poprzednia wersja, wciąż używana przez
+    trwające żądania, nigdy nie jest zmieniana.
+    """
+
+    def __init__(self):
+        self._owned = set()
+
+    def fresh(self, container):
+        self._owned.add(id(container))
+        return container
+
+    def item(self, parent, key):
+        child = parent[key]
+        if id(child) not in self._owned:
+            child = parent[key] = self.fresh(copy.copy(child))
+        return child
+
+
+_NO_COPY = _NoCopy()
+
+
+def _remove_first(items, value):
+    try:
+        items.remove(value)
+    except ValueError:
+        pass
+
+
+class RowDiff:
+    """
+    Różnica między dwoma zrzutami wyznaczona z hashy wierszy:
+
+      deleted  -> indeksy wierszy starego zrzutu, których nie ma w nowym,
+      inserted -> indeksy wierszy nowego zrzutu, których nie było w starym,
+      changed  -> ile z nich to zmiana wiersza na tej samej pozycji.
+    """
+    __slots__ = ('deleted', 'inserted', 'changed')
+
+    def __init__(self, deleted, inserted):
+        self.deleted = deleted
+        self.inserted = inserted
+        self.changed = len(set(deleted) & set(inserted))
+
+    @property
+    def size(self):
+        return len(self.deleted) + len(self.inserted)
+
+
+def diff_rows(old_hashes, new_hashes):
+    """
+    Porównuje zrzuty jako multizbiory wierszy – przesunięcie wierszy (np. po
+    wstawieniu nowego w środku arkusza) nie jest traktowane jako zmiana.
+    """
+    remaining = {}
+    for row_hash in new_hashes:
+        remaining[row_hash] = remaining.get(row_hash, 0) + 1
+
+    deleted = []
+    for index, row_hash in enumerate(old_hashes):
+        count = remaining.get(row_hash, 0)
+        if count:
+            remaining[row_hash] = count - 1
+        else:
+            deleted.append(index)
+
+    inserted = []
+    for index in range(len(new_hashes) - 1, -1, -1):
+        row_hash = new_hashes[index]
+        count = remaining.get(row_hash, 0)
+        if count:
+            remaining[row_hash] = count - 1
+            inserted.append(index)
+    inserted.reverse()
+    return RowDiff(deleted, inserted)
+
+
+def row_fields(row):
+    """
+    Pola jednego wiersza w kolejności argumentów SheetAggregates._add_row.
+    """
+    return (
+        row[COL_SEGMENT],
+        row[COL_SUBSEGMENT],
+        row[COL_EMAIL],
+        row[COL_EMAIL].strip(),
+        row[COL_COMPANY].strip(),
+        row[COL_CLIENT_EMAIL],
+        row[COL_CLIENT_LANGUAGE],
+        row[COL_CLIENT_GROUP],
+        row[COL_CLIENT_COMPANY],
+        tuple(row[i].strip() for i in COL_POSSIBILITIES),
+    )
+
+
+class ContactRecord:
+    """
+    Kontakt występujący w drzewie możliwości (e-mail, firma, podsegment).
+    Pola są internowane, a każdy rekord istnieje w ContactTable raz –
+    niezależnie od tego, w ilu możliwościach i wierszach się pojawia.
+    """
+    __slots__ = ('email', 'company', 'subsegment')
+
+    def __init__(self, email, company, subsegment):
+        self.email = email
+        self.company = company
+        self.subsegment = subsegment
+
+    def __getitem__(self, key):
+        # Zgodność z dawnymi wpisami-słownikami: entry['email']
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"ContactRecord({self.email!r}, {self.company!r}, {self.subsegment!r})"
+
+
+class ContactTable:
+    """
+    Tabela unikalnych kontaktów; wpisy drzewa możliwości przechowują tylko
+    ich numery (array 'I'). Tabela jedynie rośnie, więc kolejne wersje
+    agregatów (apply_diff) mogą ją współdzielić – numery znane starszej
+    wersji nigdy się nie zmieniają. Każde pełne przeliczenie zaczyna od
+    nowej tabeli, a build_aggregates wymusza je, gdy tabela jest zbyt
+    rozrośnięta (is_bloated).
+
+    id_for() dopisuje pod blokadą; odczyty (find, resolve, []) jej nie
+    potrzebują – rekord trafia do listy, zanim jego numer stanie się widoczny.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._ids = {}
+        self._lock = threading.Lock()
+        # Rozmiar po pełnym przeliczeniu (mark_built)
+        self.built_size = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, contact_id):
+        return self.records[contact_id]
+
+    def id_for(self, email, company, subsegment):
+        """
+        Numer kontaktu (dodaje go do tabeli, jeśli go jeszcze nie ma).
+        """
+        key = (email, company, subsegment)
+        contact_id = self._ids.get(key)
+        if contact_id is not None:
+            return contact_id
+        with self._lock:
+            contact_id = self._ids.get(key)
+            if contact_id is None:
+                contact_id = len(self.records)
+                self.records.append(ContactRecord(sys.intern(email), sys.intern(company), sys.intern(subsegment)))
+                self._ids[key] = contact_id
+        return contact_id
+
+    def mark_built(self):
+        self.built_size = len(self.records)
+
+    def is_bloated(self):
+        """
+        Czy tabela (po aktualizacjach przyrostowych) urosła na tyle ponad
+        rozmiar z pełnego przeliczenia, że trzeba ją zbudować od nowa.
+        """
+        return len(self.records) > CONTACT_TABLE_MAX_GROWTH * max(self.built_size, CONTACT_TABLE_MIN_SIZE)
+
+    def find(self, email, company, subsegment):
+        return self._ids.get((email, company, subsegment))
+
+    def resolve(self, contact_ids):
+        """
+        Rekordy ContactRecord dla listy numerów (np. subitem['entries']).
+        """
+        records = self.records
+        return [records[contact_id] for contact_id in contact_ids]
+
+
+class SegmentIndex:
+    """
+    Indeks segment -> podsegment -> kontakty. Zastępuje skanowanie całego
+    arkusza dla każdego segmentu.
+
+      pairs(segment, subsegment)  -> [{'email': ..., 'company': ...}, ...]
+                                     (tylko wiersze z e-mailem i nazwą firmy)
+      emails(segment, subsegment) -> [email, ...]
+                                     (wszystkie wiersze z e-mailem)
+    """
+
+    def __init__(self):
+        self._pairs = {}
+        self._emails = {}
+
+    def copy(self, cow):
+        index = SegmentIndex()
+        index._pairs = cow.fresh(dict(self._pairs))
+        index._emails = cow.fresh(dict(self._emails))
+        return index
+
+    def add(self, segment, subsegment, email, company, cow=_NO_COPY):
+        key = (segment, subsegment)
+        if key in self._emails:
+            cow.item(self._emails, key).append(email)
+        else:
+            self._emails[key] = cow.fresh([email])
+        if company:
+            pair = {'email': email, 'company': company}
+            if key in self._pairs:
+                cow.item(self._pairs, key).append(pair)
+            else:
+                self._pairs[key] = cow.fresh([pair])
+
+    def remove(self, segment, subsegment, email, company, cow=_NO_COPY):
+        key = (segment, subsegment)
+        if key in self._emails:
+            _remove_first(cow.item(self._emails, key), email)
+        if company and key in self._pairs:
+            _remove_first(cow.item(self._pairs, key), {'email': email, 'company': company})
+
+    def pairs(self, segment, subsegment):
+        return self._pairs.get((segment, subsegment), [])
+
+    def emails(self, segment, subsegment):
+        return self._emails.get((segment, subsegment), [])
+
+
+class SheetAggregates:
+    """
+    Wszystkie widoki pochodne arkusza wyliczane w jednym przebiegu po wierszach:
+
+      segments          -> {segment: {"Polski": n, "Zagraniczny": n}}
+                           (w kolejności ordered_segments)
+      possibilities     -> 2-poziomowe drzewo możliwości:
+                           {
+                             prefix: {
+                               "Polski": n, "Zagraniczny": n,
+                               "subitems": {
+                                 full_string: {
+                                   "Polski": n, "Zagraniczny": n,
+                                   "entries": array('I') numerów w `contacts`
+                                 }, ...
+                               }
+                             }, ...
+                           }
+      contacts          -> ContactTable (numer -> ContactRecord)
+      potential_clients -> {grupa: [{'email', 'company', 'language'}, ...]}
+      email_language    -> {email: podsegment / język}
+      segment_index     -> SegmentIndex
+      ordering          -> SheetOrdering (wyliczane przez build_ordering)
+
+    apply_diff() tworzy agregaty nowego zrzutu z agregatów poprzedniego,
+    przetwarzając tylko wiersze usunięte i dodane. Kolejność elementów
+    dopisanych w ten sposób może się różnić od pełnego przeliczenia (nowe
+    wpisy trafiają na koniec list), liczniki i zawartość są identyczne.
+    """
+
+    def __init__(self, sheet, ordered_segments):
+        self.segments = {segment: {"Polski": 0, "Zagraniczny": 0} for segment in ordered_segments}
+        self.possibilities = {}
+        self.contacts = ContactTable()
+        self.potential_clients = {}
+        self.email_language = {}
+        self.segment_index = SegmentIndex()
+        # Adresy z wierszy usuniętych i dodanych w apply_diff (None przy pełnym
+        # przeliczeniu) – ich język jest potem wyliczany od nowa z nowego zrzutu
+        self._touched_emails = None
+        self._cow = _NO_COPY
+        self.ordering = None
+        # Kolejność poprzednich agregatów i prefiksy zmienione od tamtej
+        # wersji (tylko po apply_diff) – do przyrostowego build_ordering
+        self._ordering_base = None
+        self._changed_prefixes = None
+
+        # Surowe wartości tam, gdzie liczy się dokładne porównanie,
+        # wartości po strip() (liczone raz na unikalny napis) w pozostałych
+        columns = (
+            sheet.values(COL_SEGMENT),
+            sheet.values(COL_SUBSEGMENT),
+            sheet.values(COL_EMAIL),
+            sheet.stripped_values(COL_EMAIL),
+            sheet.stripped_values(COL_COMPANY),
+            sheet.values(COL_CLIENT_EMAIL),
+            sheet.values(COL_CLIENT_LANGUAGE),
+            sheet.values(COL_CLIENT_GROUP),
+            sheet.values(COL_CLIENT_COMPANY),
+            zip(*(sheet.stripped_values(i) for i in COL_POSSIBILITIES)),
+        )
+        for values in zip(*columns):
+            self._add_row(*values)
+        self.contacts.mark_built()
+
+        logger.info(
+            "Agregaty arkusza: %d wierszy, %d prefiksów możliwości, %d grup potencjalnych klientów.",
+            len(sheet), len(self.possibilities), len(self.potential_clients)
+        )
+
+    def apply_diff(self, old_sheet, new_sheet, diff):
+        """
+        Zwraca nowe agregaty dla new_sheet, zbudowane z bieżących (dla
+        old_sheet) przez usunięcie wierszy diff.deleted i dodanie diff.inserted.
+        Bieżące agregaty pozostają bez zmian.
+        """
+        cow = _CopyOnWrite()
+        updated = object.__new__(SheetAggregates)
+        updated.segments = cow.fresh(dict(self.segments))
+        updated.possibilities = cow.fresh(dict(self.possibilities))
+        updated.contacts = self.contacts
+        updated.potential_clients = cow.fresh(dict(self.potential_clients))
+        updated.email_language = cow.fresh(dict(self.email_language))
+        updated._touched_emails = set()
+        updated.segment_index = self.segment_index.copy(cow)
+        updated._cow = cow
+        updated.ordering = None
+        updated._ordering_base = self.ordering
+        updated._changed_prefixes = set()
+
+        for index in diff.deleted:
+            updated._remove_row(*row_fields(old_sheet[index]))
+        for index in diff.inserted:
+            updated._add_row(*row_fields(new_sheet[index]))
+        updated._recompute_email_languages(new_sheet, updated._touched_emails)
+
+        updated._touched_emails = None
+        updated._cow = _NO_COPY
+        return updated
+
+    def _recompute_email_languages(self, sheet, emails):
+        """
+        Język adresów `emails` wyliczony od nowa z `sheet` tak jak przy pełnym
+        przeliczeniu – obowiązuje ostatni wiersz z danym adresem. Czytane są
+        tylko wiersze, w których te adresy występują (wyszukiwane po kodach
+        kolumn, bez przechodzenia po wszystkich wierszach w Pythonie).
+        """
+        if not emails:
+            return
+        wanted = {code for code, value in enumerate(sheet.strings) if value.strip() in emails}
+        indexes = set()
+        for column in (COL_EMAIL, COL_CLIENT_EMAIL):
+            indexes.update(itertools.compress(
+                itertools.count(), map(wanted.__contains__, sheet.columns[column])
+            ))
+
+        languages = {}
+        for index in sorted(indexes):
+            row = sheet[index]
+            raw_email, raw_subsegment = row[COL_EMAIL], row[COL_SUBSEGMENT]
+            if raw_email and raw_subsegment:
+                languages[raw_email.strip()] = raw_subsegment.strip()
+            client_email, language = row[COL_CLIENT_EMAIL], row[COL_CLIENT_LANGUAGE]
+            if client_email and language:
+                languages[client_email.strip()] = language.strip()
+
+        for email in emails:
+            if email in languages:
+                self.email_language[email] = languages[email]
+            else:
+                self.email_language.pop(email, None)
+
+    def members(self, kind, key, offset=0, limit=None):
+        """
+        Jedna strona kontaktów listy ze strony głównej: (liczba wszystkich,
+        [(email, firma, opis), ...]) – w tej samej kolejności, w jakiej
+        lista była dotąd renderowana.
+
+          segments -> segment `key`, najpierw Polski, potem Zagraniczny
+                      (opis: podsegment),
+          subitems -> możliwość o pełnej etykiecie `key` (opis: podsegment),
+          groups   -> grupa potencjalnych klientów `key` (opis: język).
+
+        Nieznana lista lub klucz -> (0, []).
+        """
+        end = None if limit is None else offset + limit
+        if kind == 'segments':
+            parts = [
+                (subsegment, self.segment_index.pairs(key, subsegment))
+                for subsegment in SUBSEGMENTS
+            ]
+            total = sum(len(pairs) for _, pairs in parts)
+            rows = (
+                (pair['email'], pair['company'], subsegment)
+                for subsegment, pairs in parts for pair in pairs
+            )
+            return total, list(itertools.islice(rows, offset, end))
+        if kind == 'subitems':
+            prefix, full_str = extract_prefix(key)
+            subitem = self.possibilities.get(prefix, {}).get('subitems', {}).get(full_str)
+            if subitem is None:
+                return 0, []
+            entries = subitem['entries']
+            return len(entries), [
+                (record.email, record.company, record.subsegment)
+                for record in self.contacts.resolve(entries[offset:end])
+            ]
+        if kind == 'groups':
+            clients = self.potential_clients.get(key, [])
+            return len(clients), [
+                (client['email'], client['company'], client['language'])
+                for client in clients[offset:end]
+            ]
+        return 0, []
+
+    def _add_row(self, segment, raw_subsegment, raw_email, email, company,
+                 client_email, language, group, client_company, possibilities):
+        cow = self._cow
+        subsegment = raw_subsegment.strip()
+
+        # Segmenty: liczniki Polski / Zagraniczny
+        if segment in self.segments and raw_subsegment in SUBSEGMENTS:
+            cow.item(self.segments, segment)[raw_subsegment] += 1
+
+        # Indeks segment -> podsegment -> kontakty
+        if email:
+            self.segment_index.add(segment, raw_subsegment, email, company, cow)
+
+        # Mapa e-mail -> język (segmenty / możliwości)
+        if raw_email and raw_subsegment:
+            self._set_email_language(email, subsegment)
+
+        # Kolumny Z..AH = możliwości
+        for raw_possibility in possibilities:
+            if raw_possibility:
+                self._add_possibility(raw_possibility, email, company, subsegment)
+
+        # Potencjalni klienci (AT..AX)
+        if client_email and language:
+            self._set_email_language(client_email.strip(), language.strip())
+            if group and client_company:
+                client = {
+                    'email': client_email.strip(),
+                    'company': client_company.strip(),
+                    'language': language.strip()
+                }
+                group = group.strip()
+                if group in self.potential_clients:
+                    cow.item(self.potential_clients, group).append(client)
+                else:
+                    self.potential_clients[group] = cow.fresh([client])
+
+    def _remove_row(self, segment, raw_subsegment, raw_email, email, company,
+                    client_email, language, group, client_company, possibilities):
+        cow = self._cow
+        subsegment = raw_subsegment.strip()
+
+        if segment in self.segments and raw_subsegment in SUBSEGMENTS:
+            cow.item(self.segments, segment)[raw_subsegment] -= 1
+
+        if email:
+            self.segment_index.remove(segment, raw_subsegment, email, company, cow)
+
+        if raw_email and raw_subsegment:
+            self._touched_emails.add(email)
+
+        for raw_possibility in possibilities:
+            if raw_possibility:
+                self._remove_possibility(raw_possibility, email, company, subsegment)
+
+        if client_email and language:
+            self._touched_emails.add(client_email.strip())
+            group = group.strip() if group and client_company else None
+            if group in self.potential_clients:
+                clients = cow.item(self.potential_clients, group)
+                _remove_first(clients, {
+                    'email': client_email.strip(),
+                    'company': client_company.strip(),
+                    'language': language.strip()
+                })
+                if not clients:
+                    del self.potential_clients[group]
+
+    def _set_email_language(self, email, language):
+        if self._touched_emails is not None:
+            self._touched_emails.add(email)
+        else:
+            self.email_language[email] = language
+
+    def _add_possibility(self, raw_possibility, email, company, subsegment):
+        cow = self._cow
+        prefix, full_str = extract_prefix(raw_possibility)
+        if self._changed_prefixes is not None:
+            self._changed_prefixes.add(prefix)
+
+        if prefix in self.possibilities:
+            prefix_data = cow.item(self.possibilities, prefix)
+            subitems = cow.item(prefix_data, 'subitems')
+        else:
+            subitems = cow.fresh({})
+            prefix_data = self.possibilities[prefix] = cow.fresh({
+                'Polski': 0,
+                'Zagraniczny': 0,
+                'subitems': subitems
+            })
+        if full_str in subitems:
+            subitem = cow.item(subitems, full_str)
+            entries = cow.item(subitem, 'entries')
+        else:
+            entries = cow.fresh(array('I'))
+            subitem = subitems[full_str] = cow.fresh({
+                'Polski': 0,
+                'Zagraniczny': 0,
+                'entries': entries
+            })
+
+        if subsegment in SUBSEGMENTS:
+            prefix_data[subsegment] += 1
+            subitem[subsegment] += 1
+
+        entries.append(self.contacts.id_for(email, company, subsegment))
+
+    def _remove_possibility(self, raw_possibility, email, company, subsegment):
+        cow = self._cow
+        prefix, full_str = extract_prefix(raw_possibility)
+        if prefix not in self.possibilities:
+            return
+        self._changed_prefixes.add(prefix)
+        prefix_data = cow.item(self.possibilities, prefix)
+        subitems = cow.item(prefix_data, 'subitems')
+        if full_str not in subitems:
+            return
+        subitem = cow.item(subitems, full_str)
+        entries = cow.item(subitem, 'entries')
+
+        if subsegment in SUBSEGMENTS:
+            prefix_data[subsegment] -= 1
+            subitem[subsegment] -= 1
+        contact_id = self.contacts.find(email, company, subsegment)
+        if contact_id is not None:
+            _remove_first(entries, contact_id)
+
+        if not entries:
+            del subitems[full_str]
+        if not subitems:
+            del self.possibilities[prefix]
+
+
+def _first_word(prefix):
+    words = prefix.split()
+    return words[0] if words else ''
+
+
+def _possibility_total(item):
+    data = item[1]
+    return data['Polski'] + data['Zagraniczny']
+
+
+class SheetOrdering:
+    """
+    Kolejność wyświetlania segmentów i możliwości dla jednej wersji agregatów:
+
+      segments      -> [(segment, liczniki), ...] malejąco po sumie
+                       (Polski + Zagraniczny),
+      possibilities -> [(prefix, dane), ...] pogrupowane po pierwszym słowie
+                       prefiksu; grupy malejąco po najwyższej sumie w grupie,
+                       wewnątrz grupy prefiksy malejąco po sumie.
+
+    Z `base` (kolejność poprzednich agregatów) i zbioru zmienionych prefiksów
+    sortowane są od nowa tylko grupy, których dotyczą zmiany; pozostałe
+    grupy są przejmowane bez zmian (ich dane to te same obiekty).
+    """
+
+    def __init__(self, segments, possibilities, base=None, changed_prefixes=None):
+        self.segments = sorted(
+            segments.items(),
+            key=lambda item: item[1]['Polski'] + item[1]['Zagraniczny'],
+            reverse=True
+        )
+
+        if base is None or changed_prefixes is None:
+            groups = {}
+            for prefix, data in possibilities.items():
+                groups.setdefault(_first_word(prefix), []).append((prefix, data))
+            self._groups = {word: sorted(items, key=_possibility_total, reverse=True)
+                            for word, items in groups.items()}
+        else:
+            self._groups = dict(base._groups)
+            changed_words = {}
+            for prefix in changed_prefixes:
+                changed_words.setdefault(_first_word(prefix), []).append(prefix)
+            for word, prefixes in changed_words.items():
+                members = [prefix for prefix, _ in base._groups.get(word, ())]
+                known = set(members)
+                members.extend(prefix for prefix in prefixes if prefix not in known)
+                items = [(prefix, possibilities[prefix]) for prefix in members if prefix in possibilities]
+                if items:
+                    self._groups[word] = sorted(items, key=_possibility_total, reverse=True)
+                else:
+                    self._groups.pop(word, None)
+
+        ordered_groups = sorted(
+            self._groups.values(),
+            key=lambda items: _possibility_total(items[0]),
+            reverse=True
+        )
+        self.possibilities = [item for items in ordered_groups for item in items]
+
+
+def build_ordering(aggregates):
+    """
+    Zwraca (i zapamiętuje w agregatach) SheetOrdering. Po aktualizacji
+    przyrostowej korzysta z kolejności poprzedniej wersji, jeśli była wyliczona.
+    """
+    if aggregates.ordering is None:
+        aggregates.ordering = SheetOrdering(
+            aggregates.segments,
+            aggregates.possibilities,
+            aggregates._ordering_base,
+            aggregates._changed_prefixes
+        )
+        aggregates._ordering_base = None
+        aggregates._changed_prefixes = None
+    return aggregates.ordering
+
+
+def build_aggregates(snapshot, ordered_segments, incremental=True):
+    """
+    Buduje agregaty dla zrzutu. Jeśli poprzedni zrzut ma już wyliczone
+    agregaty, a zmieniło się niewiele wierszy, aktualizuje je przyrostowo
+    na podstawie różnicy hashy wierszy – koszt zależy od liczby zmian,
+    nie od wielkości arkusza.
+    """
+    previous = snapshot.previous
+    snapshot.previous = None
+
+    if incremental and previous is not None:
+        old_aggregates = previous.peek('aggregates')
+        if old_aggregates is not None and old_aggregates.contacts.is_bloated():
+            logger.info(
+                "Tabela kontaktów urosła do %d rekordów (po pełnym przeliczeniu %d) – pełne przeliczenie.",
+                len(old_aggregates.contacts), old_aggregates.contacts.built_size
+            )
+        elif old_aggregates is not None:
+            diff = diff_rows(previous.rows.row_hashes(), snapshot.rows.row_hashes())
+            if diff.size <= len(snapshot.rows) * INCREMENTAL_MAX_CHANGE_RATIO:
+                logger.info(
+                    "Synchronizacja przyrostowa %s -> %s: %d dodanych, %d zmienionych, %d usuniętych wierszy.",
+                    previous.version, snapshot.version,
+                    len(diff.inserted) - diff.changed, diff.changed, len(diff.deleted) - diff.changed
+                )
+                return old_aggregates.apply_diff(previous.rows, snapshot.rows, diff)
+
+    return SheetAggregates(snapshot.rows, ordered_segments)
@@ -0,0 +1,144 @@
+# sheet_schema.py
+# Schemat arkusza: mapowanie pól logicznych na kolumny na podstawie wiersza nagłówka.
+import logging
+
+from sheet_columns import (
+    COL_SEGMENT, COL_EMAIL, COL_COMPANY, COL_SUBSEGMENT, COL_POSSIBILITIES,
+    COL_CLIENT_COMPANY, COL_CLIENT_EMAIL, COL_CLIENT_GROUP, COL_CLIENT_LANGUAGE,
+    column_letter,
+)
+
+logger = logging.getLogger(__name__)
+
+# Pola logiczne i ich kolumny kanoniczne (domyślne położenie w arkuszu).
+# Dane zawsze trafiają do kolumn kanonicznych, więc reszta kodu (COL_*)
+# nie zależy od faktycznej kolejności kolumn w arkuszu.
+FIELDS = (
+    ('segment', (COL_SEGMENT,)),
+    ('email', (COL_EMAIL,)),
+    ('company', (COL_COMPANY,)),
+    ('subsegment', (COL_SUBSEGMENT,)),
+    ('possibilities', tuple(COL_POSSIBILITIES)),
+    ('client_company', (COL_CLIENT_COMPANY,)),
+    ('client_email', (COL_CLIENT_EMAIL,)),
+    ('client_group', (COL_CLIENT_GROUP,)),
+    ('client_language', (COL_CLIENT_LANGUAGE,)),
+)
+
+HEADER_ENV_PREFIX = 'SHEET_HEADER_'
+
+
+def header_names_from_env(environ, prefix=HEADER_ENV_PREFIX):
+    """
+    Nazwy nagłówków pól z konfiguracji, np. SHEET_HEADER_SEGMENT="Segment".
+    Dla 'possibilities' nazwa pasuje do wszystkich nagłówków, które się od
+    niej zaczynają ("Możliwość 1", "Możliwość 2", ...).
+    """
+    names = {}
+    for field, _ in FIELDS:
+        value = environ.get(prefix + field.upper(), '').strip()
+        if value:
+            names[field] = value
+    return names
+
+
+def _normalize(text):
+    return str(text).strip().casefold()
+
+
+class SheetSchema:
+    """
+    Skompilowane mapowanie kolumn: kolumna kanoniczna -> kolumna w arkuszu.
+
+      columns        -> kolumny kanoniczne,
+      source_columns -> odpowiadające im kolumny arkusza (w tej samej kolejności;
+                        ColumnarSheet.from_rows czyta je jednym itemgetterem),
+      width          -> minimalna szerokość wiersza obejmująca wszystkie pola.
+    """
+
+    def __init__(self, mapping):
+        self.mapping = dict(mapping)
+        self.columns = tuple(sorted(self.mapping))
+        self.source_columns = tuple(self.mapping[column] for column in self.columns)
+        self.width = max(self.source_columns, default=-1) + 1
+
+    @classmethod
+    def default(cls):
+        return cls({column: column for _, columns in FIELDS for column in columns})
+
+    @classmethod
+    def from_header(cls, header, header_names=None):
+        """
+        Buduje schemat z wiersza nagłówka. Pola z nazwą w header_names są
+        szukane w nagłówku; pola bez nazwy (albo nieznalezione) zostają
+        w domyślnych kolumnach.
+        """
+        header_names = header_names or {}
+        normalized = [_normalize(cell) for cell in header]
+        mapping = {}
+        for field, canonical in FIELDS:
+            name = header_names.get(field)
+            found = []
+            if name:
+                wanted = _normalize(name)
+                if len(canonical) > 1:
+                    found = [i for i, cell in enumerate(normalized) if cell.startswith(wanted)]
+                else:
+                    found = [i for i, cell in enumerate(normalized) if cell == wanted][:1]
+                if not found:
+                    logger.warning(
+                        "Schemat arkusza: brak nagłówka '%s' (pole %s), używam kolumn domyślnych.",
+                        name, field
+                    )
+            if found:
+                # Nadmiarowe kolumny pomijamy, brakujące zostają puste (-1)
+                found = found[:len(canonical)] + [-1] * (len(canonical) - len(found))
+                mapping.update(zip(canonical, found))
+            else:
+                mapping.update(zip(canonical, canonical))
+        return cls({column: source for column, source in mapping.items() if source >= 0})
+
+    def __eq__(self, other):
+        return isinstance(other, SheetSchema) and self.mapping == other.mapping
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.mapping.items())))
+
+    def describe(self):
+        """
+        Czytelny opis mapowania, np. {'Q': 'Q', 'R': 'S', ...} (do logów).
+        """
+        return {column_letter(column): column_letter(source) for column, source in sorted(self.mapping.items())}
+
+    def remap_columns(self, column_values):
+        """
+        {kolumna arkusza: wartości} -> {kolumna kanoniczna: wartości}.
+        """
+        return {column: column_values.get(source, ()) for column, source in self.mapping.items()}
+
+
+DEFAULT_SCHEMA = SheetSchema.default()
+
+
+class SchemaTracker:
+    """
+    Schemat używany przy kolejnych pobraniach arkusza. update() porównuje
+    nowy nagłówek z bieżącym schematem – zmiana oznacza przestawione kolumny
+    (przy pobieraniu projekcją trzeba wtedy pobrać dane jeszcze raz).
+    """
+
+    def __init__(self, header_names=None):
+        self.header_names = header_names or {}
+        self.schema = DEFAULT_SCHEMA
+
+    @property
+    def uses_header(self):
+        return bool(self.header_names)
+
+    def update(self, header):
+        schema = SheetSchema.from_header(header, self.header_names)
+        if schema == self.schema:
+            return False
+        logger.info("Schemat arkusza: nowe mapowanie kolumn %s.", schema.describe())
+        self.schema = schema
+        return True
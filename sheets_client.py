@@ -0,0 +1,89 @@
+# sheets_client.py
+import contextlib
+import os
+import threading
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+
+
+class SheetsClientFactory:
+    """
+    Wspólna dla procesu fabryka klienta Google Sheets API.
+
+      - poświadczenia konta serwisowego są tworzone raz (odświeżanie tokenu
+        dzieje się automatycznie przy wygaśnięciu),
+      - dokument discovery pochodzi z biblioteki (static_discovery), bez
+        pobierania go z sieci,
+      - klienci z trwałym (keep-alive) połączeniem httplib2 są trzymani we
+        wspólnej puli chronionej blokadą i wypożyczani na czas jednego
+        użycia – httplib2.Http nie jest bezpieczny wątkowo, ale nie jest
+        też związany z wątkiem, więc każde odświeżanie (nawet w nowym
+        wątku) korzysta z już zbudowanego klienta.
+
+    Po fork() (np. workery gunicorn) pula jest tworzona od nowa, żeby procesy
+    nie dzieliły gniazd.
+    """
+
+    def __init__(self, credentials_info, scopes, timeout=60, pool_size=4):
+        self.credentials_info = credentials_info
+        self.scopes = scopes
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+        self.builds = 0
+
+    def credentials(self):
+        with self._lock:
+            if self._credentials is None:
+                self._credentials = service_account.Credentials.from_service_account_info(
+                    self.credentials_info, scopes=self.scopes
+                )
+            return self._credentials
+
+    def _build(self):
+        http = google_auth_httplib2.AuthorizedHttp(
+            self.credentials(),
+            http=httplib2.Http(timeout=self.timeout)
+        )
+        service = build('sheets', 'v4', http=http, static_discovery=True, cache_discovery=False)
+        with self._lock:
+            self.builds += 1
+        return service
+
+    def _checkout(self):
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return self._build()
+
+    def _checkin(self, service):
+        with self._lock:
+            if os.getpid() == self._pid and len(self._idle) < self.pool_size:
+                self._idle.append(service)
+
+    @contextlib.contextmanager
+    def service(self):
+        """
+        Wypożycza klienta z puli (albo buduje nowego, gdy wszystkie są zajęte)
+        i oddaje go po wyjściu z bloku with.
+        """
+        service = self._checkout()
+        try:
+            yield service
+        finally:
+            self._checkin(service)
+
+    @contextlib.contextmanager
+    def spreadsheets(self):
+        with self.service() as service:
+            yield service.spreadsheets()
@@ -0,0 +1,6 @@
+# conftest.py
+# Moduły aplikacji leżą w katalogu głównym repozytorium.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
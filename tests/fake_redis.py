@@ -0,0 +1,98 @@
+# fake_redis.py
+# Minimalny klient Redis w pamięci – tylko polecenia używane przez sheet_cache.
+
+
+class FakePipeline:
+
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._calls.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        calls, self._calls = self._calls, []
+        return [method(*args, **kwargs) for method, args, kwargs in calls]
+
+
+class FakeLock:
+
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        if self._name in self._client.locks:
+            return False
+        self._client.locks.add(self._name)
+        return True
+
+    def release(self):
+        self._client.locks.discard(self._name)
+
+
+class FakeRedis:
+    """
+    Wartości trzymane są jako bytes, jak w redis-py bez decode_responses.
+    TTL nie upływa sam – test wygasza klucz przez expire_now().
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+        self.locks = set()
+
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = self._encode(value)
+        self.ttl.pop(key, None)
+        if ex is not None:
+            self.ttl[key] = ex
+        return True
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += self.data.pop(key, None) is not None
+            self.ttl.pop(key, None)
+        return removed
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def expire(self, key, seconds):
+        if key not in self.data:
+            return False
+        self.ttl[key] = seconds
+        return True
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update(
+            {self._encode(field): self._encode(value) for field, value in mapping.items()}
+        )
+        return len(mapping)
+
+    def hmget(self, key, fields):
+        values = self.data.get(key, {})
+        return [values.get(self._encode(field)) for field in fields]
+
+    def lock(self, name, timeout=None):
+        return FakeLock(self, name)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def expire_now(self, key):
+        self.delete(key)
@@ -0,0 +1,129 @@
+# test_audience_index.py
+import pytest
+
+from audience_index import AudienceIndex, is_empty_selection, is_valid_selection
+from sheet_columns import (
+    ROW_WIDTH, COL_SEGMENT, COL_EMAIL, COL_COMPANY, COL_SUBSEGMENT, COL_POSSIBILITIES,
+    COL_CLIENT_COMPANY, COL_CLIENT_EMAIL, COL_CLIENT_GROUP, COL_CLIENT_LANGUAGE,
+    ColumnarSheet,
+)
+from sheet_index import SheetAggregates
+
+
+def contact(segment, email, company, subsegment, possibility=''):
+    row = [''] * ROW_WIDTH
+    row[COL_SEGMENT] = segment
+    row[COL_EMAIL] = email
+    row[COL_COMPANY] = company
+    row[COL_SUBSEGMENT] = subsegment
+    row[COL_POSSIBILITIES[0]] = possibility
+    return row
+
+
+def client(email, company, group, language):
+    row = [''] * ROW_WIDTH
+    row[COL_CLIENT_EMAIL] = email
+    row[COL_CLIENT_COMPANY] = company
+    row[COL_CLIENT_GROUP] = group
+    row[COL_CLIENT_LANGUAGE] = language
+    return row
+
+
+@pytest.fixture
+def aggregates():
+    rows = [
+        contact('Meble', 'a@x.pl', 'Alfa', 'Polski', 'Transport [[[PL]]]'),
+        contact('Meble', 'b@x.pl', 'Beta', 'Zagraniczny', 'Transport [[[DE]]]'),
+        contact('Stal', 'c@x.pl', 'Gamma', 'Polski', 'Transport [[[PL]]]'),
+        contact('Stal', 'a@x.pl', 'Alfa', 'Polski'),
+        client('d@x.pl', 'Delta', 'A', 'Zagraniczny'),
+        client('a@x.pl', 'Alfa', 'A', 'Polski'),
+        # Bez firmy: poza indeksem odbiorców, ale z językiem w mapie e-mail -> język
+        contact('Stal', 'e@x.pl', '', 'Zagraniczny'),
+    ]
+    return SheetAggregates(ColumnarSheet.from_rows(rows), ['Meble', 'Stal'])
+
+
+@pytest.fixture
+def audience(aggregates):
+    return AudienceIndex(aggregates)
+
+
+def emails(audience, selection, language=None):
+    bits, unknown = audience.resolve(selection)
+    return set(audience.emails_for(bits, language)), unknown
+
+
+def test_resolve_lists_without_duplicates(audience):
+    assert emails(audience, {'segments': ['Meble', 'Stal']}) == ({'a@x.pl', 'b@x.pl', 'c@x.pl'}, set())
+    assert emails(audience, {'segments': [['Meble', 'Polski']]}) == ({'a@x.pl'}, set())
+    assert emails(audience, {'prefixes': ['Transport']}) == ({'a@x.pl', 'b@x.pl', 'c@x.pl'}, set())
+    assert emails(audience, {'subitems': ['Transport [[[PL]]]']}) == ({'a@x.pl', 'c@x.pl'}, set())
+    assert emails(audience, {'groups': ['A'], 'segments': ['Stal']}) == ({'a@x.pl', 'c@x.pl', 'd@x.pl'}, set())
+
+
+def test_resolve_partial_and_single_addresses(audience):
+    selection = {
+        'partial': [{'type': 'segments', 'id': 'Meble', 'exclude': ['b@x.pl']}],
+        'emails': [' c@x.pl ', 'spoza@x.pl'],
+    }
+    assert emails(audience, selection) == ({'a@x.pl', 'c@x.pl'}, {'spoza@x.pl'})
+
+
+def test_resolve_by_language_and_count(audience):
+    bits, unknown = audience.resolve({'segments': ['Meble'], 'groups': ['A'], 'emails': ['spoza@x.pl']})
+    assert set(audience.emails_for(bits, 'Zagraniczny')) == {'b@x.pl', 'd@x.pl'}
+    counts = audience.count(bits, unknown)
+    assert counts['total'] == 4
+    assert counts['by_language'] == {'Polski': 1, 'Zagraniczny': 2}
+
+
+@pytest.mark.parametrize('selection', [
+    None,
+    [],
+    {'segments': 'Meble'},
+    {'subitems': [['Transport']]},
+    {'groups': [{'A': 1}]},
+    {'segments': [['Meble', 'Polski', 'x']]},
+    {'emails': [1]},
+    {'partial': [{'type': 'groups', 'id': ['A']}]},
+    {'partial': [{'type': 'inne', 'id': 'A'}]},
+    {'partial': [{'type': 'groups', 'id': 'A', 'exclude': 'a@x.pl'}]},
+    {'partial': {}},
+    {'language': 5},
+])
+def test_invalid_selection_is_rejected(audience, selection):
+    assert not is_valid_selection(selection)
+    with pytest.raises(ValueError):
+        audience.resolve(selection)
+
+
+def test_valid_selection_shapes():
+    assert is_valid_selection({})
+    assert is_valid_selection({
+        'segments': ['Meble', ['Stal', 'Polski']], 'subitems': [], 'groups': None,
+        'partial': [{'type': 'subitems', 'id': 'Transport [[[PL]]]'}],
+        'emails': ['a@x.pl'], 'language': 'Polski',
+    })
+
+
+def test_empty_selection():
+    assert is_empty_selection({})
+    assert is_empty_selection({'segments': [], 'partial': [], 'emails': [], 'language': 'Polski'})
+    assert not is_empty_selection({'emails': ['a@x.pl']})
+    assert not is_empty_selection({'partial': [{'type': 'groups', 'id': 'A'}]})
+
+
+def test_count_matches_recipients_for_addresses_outside_the_index(audience, aggregates):
+    selection = {'segments': ['Meble'], 'emails': ['e@x.pl', 'spoza@x.pl']}
+    bits, unknown = audience.resolve(selection)
+    assert unknown == {'e@x.pl', 'spoza@x.pl'}
+    email_language = aggregates.email_language
+    languages = {email: email_language[email] for email in unknown if email in email_language}
+
+    counts = audience.count(bits, unknown, languages)
+    assert counts['total'] == 4
+    for language in ('Polski', 'Zagraniczny'):
+        recipients = audience.recipients(bits, language, unknown, languages)
+        assert counts['by_language'][language] == len(recipients)
+    assert audience.recipients(bits, 'Zagraniczny', unknown, languages) == {'b@x.pl', 'e@x.pl'}
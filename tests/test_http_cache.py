@@ -0,0 +1,45 @@
+# test_http_cache.py
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from http_cache import conditional_response
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    builds = []
+
+    @app.route('/data', methods=['GET', 'POST'])
+    def data():
+        def build():
+            builds.append(1)
+            return flask.jsonify({'rows': 3})
+        return conditional_response('v1', build)
+
+    client = app.test_client()
+    client.builds = builds
+    return client
+
+
+def test_first_request_gets_body_and_etag(client):
+    response = client.get('/data')
+    assert response.status_code == 200
+    assert response.get_json() == {'rows': 3}
+    assert response.headers['ETag'] == '"v1"'
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_matching_etag_gets_304_without_building(client):
+    response = client.get('/data', headers={'If-None-Match': '"v1"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == '"v1"'
+    assert client.builds == []
+
+
+def test_stale_etag_or_post_gets_body(client):
+    assert client.get('/data', headers={'If-None-Match': '"v0"'}).status_code == 200
+    assert client.post('/data', headers={'If-None-Match': '"v1"'}).status_code == 200
+    assert len(client.builds) == 2
@@ -0,0 +1,182 @@
+# test_sheet_cache.py
+import queue
+import threading
+import time
+
+import pytest
+
+from fake_redis import FakeRedis
+from sheet_cache import (
+    RedisEmailLanguageIndex, RedisFragmentStore, RedisSnapshotStore, SheetSnapshot,
+    SingleFlight, SnapshotCache, SnapshotFile,
+)
+from sheet_columns import ROW_WIDTH, COL_EMAIL, ColumnarSheet
+
+
+def test_language_index_roundtrip():
+    index = RedisEmailLanguageIndex(FakeRedis(), 'email_language:test')
+    assert index.languages(['a@x.pl']) is None
+
+    index.publish('v1', {'a@x.pl': 'Polski', 'b@x.pl': 'Zagraniczny'})
+    assert index.languages(['a@x.pl', 'c@x.pl']) == {'a@x.pl': 'Polski'}
+
+
+def test_expired_language_index_is_a_miss_and_republished():
+    client = FakeRedis()
+    index = RedisEmailLanguageIndex(client, 'email_language:test')
+    index.publish('v1', {'a@x.pl': 'Polski'})
+
+    # Arkusz bez zmian dłużej niż TTL – hash wygasł, wskaźnik jeszcze nie
+    client.expire_now('email_language:test:data:v1')
+    assert index.languages(['a@x.pl']) is None
+
+    index.publish('v1', {'a@x.pl': 'Polski'})
+    assert index.languages(['a@x.pl']) == {'a@x.pl': 'Polski'}
+
+
+def test_republishing_same_version_refreshes_ttl():
+    client = FakeRedis()
+    index = RedisEmailLanguageIndex(client, 'email_language:test', data_ttl=100)
+    index.publish('v1', {'a@x.pl': 'Polski'})
+    client.ttl['email_language:test:data:v1'] = 1
+    client.ttl['email_language:test:current'] = 1
+
+    index.publish('v1', {'a@x.pl': 'Polski'})
+    assert client.ttl['email_language:test:data:v1'] == 100
+    assert client.ttl['email_language:test:current'] == 100
+
+
+def snapshot_of(rows):
+    sheet = [[''] * ROW_WIDTH for _ in rows]
+    for row, email in zip(sheet, rows):
+        row[COL_EMAIL] = email
+    return SheetSnapshot(ColumnarSheet.from_rows(sheet), fetched_at=1.0)
+
+
+def test_snapshot_file_roundtrip(tmp_path):
+    snapshot_file = SnapshotFile(str(tmp_path / 'snapshot.bin'))
+    assert snapshot_file.load() is None
+    snapshot = snapshot_of(['a@x.pl', 'b@x.pl'])
+    snapshot_file.write(snapshot)
+
+    assert snapshot_file.read_meta() == (snapshot.version, 1.0)
+    loaded = snapshot_file.load()
+    assert loaded.version == snapshot.version
+    assert list(loaded.rows.values(COL_EMAIL)) == ['a@x.pl', 'b@x.pl']
+    assert list(loaded.rows.row_hashes()) == list(snapshot.rows.row_hashes())
+
+
+def test_file_rewritten_between_meta_and_load_is_rejected(tmp_path):
+    old, new = snapshot_of(['a@x.pl']), snapshot_of(['b@x.pl'])
+    snapshot_file = SnapshotFile(str(tmp_path / 'snapshot.bin'))
+    snapshot_file.write(old)
+
+    read_meta = snapshot_file.read_meta
+
+    def read_meta_then_rewrite():
+        meta = read_meta()
+        snapshot_file.write(new)
+        return meta
+    snapshot_file.read_meta = read_meta_then_rewrite
+
+    cache = SnapshotCache(lambda: None, snapshot_file=snapshot_file)
+    assert cache._load_from_file(old.version) is None
+
+
+def test_new_version_hook_runs_once_per_version():
+    sheets = iter([snapshot_of(['a@x.pl']).rows, snapshot_of(['a@x.pl']).rows, snapshot_of(['b@x.pl']).rows])
+    seen = queue.Queue()
+    cache = SnapshotCache(lambda: next(sheets), on_new_version=lambda snapshot: seen.put(snapshot.version))
+
+    first = cache.refresh()
+    assert cache.refresh() is first
+    second = cache.refresh()
+
+    assert seen.get(timeout=5) == first.version
+    assert seen.get(timeout=5) == second.version
+    with pytest.raises(queue.Empty):
+        seen.get(timeout=0.2)
+
+
+def test_snapshot_store_roundtrip():
+    store = RedisSnapshotStore(FakeRedis(), 'sheet_snapshot:test')
+    assert store.current_pointer() is None
+    snapshot = snapshot_of(['a@x.pl', 'b@x.pl'])
+    store.publish(snapshot)
+
+    assert store.current_pointer() == (snapshot.version, 1.0)
+    loaded = store.load(snapshot.version, 1.0)
+    assert loaded.version == snapshot.version
+    assert list(loaded.rows.values(COL_EMAIL)) == ['a@x.pl', 'b@x.pl']
+    assert store.load('inna', 1.0) is None
+
+
+def test_fragment_store_roundtrip():
+    fragments = RedisFragmentStore(FakeRedis(), 'fragments:test')
+    assert fragments.get('sidebar_lists', 'v1') is None
+    fragments.put('sidebar_lists', 'v1', '<ul>Zażółć</ul>')
+    assert fragments.get('sidebar_lists', 'v1') == '<ul>Zażółć</ul>'
+    assert fragments.get('sidebar_lists', 'v2') is None
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'wynik'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('k', slow))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.coalesced < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['wynik'] * 4
+
+
+def test_stale_snapshot_is_served_while_refreshing_in_background():
+    loads = queue.Queue()
+    sheets = iter([snapshot_of(['a@x.pl']).rows, snapshot_of(['b@x.pl']).rows])
+
+    def loader():
+        loads.put(1)
+        return next(sheets)
+    cache = SnapshotCache(loader, ttl=60)
+    first = cache.get()
+    assert cache.get() is first
+    assert cache.stats()['hits'] == 1
+
+    cache.invalidate()
+    assert cache.get() is first
+    loads.get(timeout=5)
+    loads.get(timeout=5)
+    deadline = time.time() + 5
+    while cache.peek() is first and time.time() < deadline:
+        time.sleep(0.01)
+    assert list(cache.peek().rows.values(COL_EMAIL)) == ['b@x.pl']
+
+
+def test_fresh_snapshot_in_store_is_used_instead_of_loader():
+    client = FakeRedis()
+    published = snapshot_of(['a@x.pl'])
+    published.fetched_at = time.time()
+    RedisSnapshotStore(client, 'sheet_snapshot:test').publish(published)
+
+    def loader():
+        raise AssertionError('loader nie powinien być wołany')
+    cache = SnapshotCache(loader, store=RedisSnapshotStore(client, 'sheet_snapshot:test'))
+    assert cache.get().version == published.version
+    assert cache.stats()['store_hits'] == 1
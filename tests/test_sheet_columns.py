@@ -0,0 +1,72 @@
+# test_sheet_columns.py
+from sheet_columns import (
+    ROW_WIDTH, USED_COLUMNS, COL_SEGMENT, COL_EMAIL, COL_POSSIBILITIES, COL_CLIENT_LANGUAGE,
+    ColumnarSheet, cell_text, column_letter, projected_ranges,
+)
+
+
+def test_column_letter():
+    assert [column_letter(i) for i in (0, 25, 26, 49)] == ['A', 'Z', 'AA', 'AX']
+
+
+def test_projected_ranges_group_adjacent_columns():
+    assert projected_ranges([16, 17, 20, 25, 26, 27]) == [('Q2:R', 16), ('U2:U', 20), ('Z2:AB', 25)]
+
+
+def test_cell_text():
+    assert [cell_text(v) for v in ('a', 3.0, 2.5, True, 7)] == ['a', '3', '2.5', 'TRUE', '7']
+
+
+def test_from_rows_pads_short_rows_and_keeps_used_columns_only():
+    full = [''] * ROW_WIDTH
+    full[COL_SEGMENT] = 'Meble'
+    full[COL_EMAIL] = 'a@x.pl'
+    full[COL_CLIENT_LANGUAGE] = 'Polski'
+    full[0] = 'pomijana'
+    short = ['x'] * (COL_EMAIL + 1)
+    sheet = ColumnarSheet.from_rows([full, short])
+
+    assert len(sheet) == 2
+    assert set(sheet.columns) == set(USED_COLUMNS)
+    assert sheet[0].to_list()[COL_SEGMENT] == 'Meble'
+    assert sheet[0][0] == ''
+    assert sheet[1][COL_EMAIL] == 'x'
+    assert sheet[1][COL_CLIENT_LANGUAGE] == ''
+    assert sheet[-1][COL_SEGMENT] == 'x'
+
+
+def test_from_columns_matches_from_rows():
+    rows = [[''] * ROW_WIDTH for _ in range(3)]
+    rows[0][COL_EMAIL] = 'a@x.pl'
+    rows[2][COL_POSSIBILITIES[0]] = 'Magazyn'
+    rows[1][COL_SEGMENT] = 'Stal'
+    column_values = {
+        COL_EMAIL: ['a@x.pl'],
+        COL_SEGMENT: ['', 'Stal'],
+        COL_POSSIBILITIES[0]: ['', '', 'Magazyn'],
+    }
+    by_rows, by_columns = ColumnarSheet.from_rows(rows), ColumnarSheet.from_columns(column_values)
+    assert [row.to_list() for row in by_rows] == [row.to_list() for row in by_columns]
+    assert list(by_rows.row_hashes()) == list(by_columns.row_hashes())
+
+
+def test_binary_roundtrip_with_and_without_copy():
+    rows = [[''] * ROW_WIDTH for _ in range(4)]
+    for index, row in enumerate(rows):
+        row[COL_EMAIL] = f"k{index % 2}@x.pl"
+        row[COL_SEGMENT] = 'Zażółć'
+    sheet = ColumnarSheet.from_rows(rows)
+    blob = sheet.to_bytes(include_row_hashes=True)
+
+    for copy in (True, False):
+        restored = ColumnarSheet.from_bytes(blob, copy=copy)
+        assert restored.version() == sheet.version()
+        assert [row.to_list() for row in restored] == [row.to_list() for row in sheet]
+        assert list(restored.row_hashes()) == list(sheet.row_hashes())
+
+
+def test_version_depends_on_content():
+    rows = [[''] * ROW_WIDTH]
+    first = ColumnarSheet.from_rows(rows).version()
+    rows[0][COL_EMAIL] = 'a@x.pl'
+    assert ColumnarSheet.from_rows(rows).version() != first
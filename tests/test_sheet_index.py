@@ -0,0 +1,222 @@
+# test_sheet_index.py
+# Aktualizacja przyrostowa agregatów musi dawać to samo co pełne przeliczenie.
+import random
+
+from sheet_cache import SheetSnapshot
+from sheet_columns import (
+    ROW_WIDTH, COL_SEGMENT, COL_EMAIL, COL_COMPANY, COL_SUBSEGMENT, COL_POSSIBILITIES,
+    COL_CLIENT_COMPANY, COL_CLIENT_EMAIL, COL_CLIENT_GROUP, COL_CLIENT_LANGUAGE,
+    ColumnarSheet,
+)
+import sheet_index
+from sheet_index import SheetAggregates, build_aggregates, build_ordering, diff_rows
+
+SEGMENTS = ['Meble', 'Stal', 'Szkło']
+
+
+def random_row(rng):
+    row = [''] * ROW_WIDTH
+    row[COL_SEGMENT] = rng.choice(SEGMENTS + [''])
+    row[COL_EMAIL] = rng.choice(['', f"k{rng.randrange(12)}@x.pl", f" k{rng.randrange(12)}@x.pl "])
+    row[COL_COMPANY] = rng.choice(['', 'Alfa', 'Beta', 'Gamma'])
+    row[COL_SUBSEGMENT] = rng.choice(['Polski', 'Zagraniczny', '', 'Polski '])
+    for column in COL_POSSIBILITIES[:3]:
+        row[column] = rng.choice(['', 'Transport [[[PL]]]', 'Transport [[[DE]]]', 'Magazyn'])
+    if rng.random() < 0.5:
+        row[COL_CLIENT_EMAIL] = f"k{rng.randrange(12)}@x.pl"
+        row[COL_CLIENT_LANGUAGE] = rng.choice(['Polski', 'Zagraniczny'])
+        row[COL_CLIENT_GROUP] = rng.choice(['', 'A', 'B'])
+        row[COL_CLIENT_COMPANY] = rng.choice(['', 'Delta'])
+    return row
+
+
+def mutate(rng, rows):
+    rows = [list(row) for row in rows]
+    for _ in range(rng.randrange(1, 4)):
+        action = rng.random()
+        if action < 0.3 and rows:
+            del rows[rng.randrange(len(rows))]
+        elif action < 0.6:
+            rows.insert(rng.randrange(len(rows) + 1), random_row(rng))
+        elif rows:
+            # Zmiana pojedynczej komórki (np. samej firmy) w istniejącym wierszu
+            row = rng.choice(rows)
+            column = rng.choice([COL_COMPANY, COL_SUBSEGMENT, COL_CLIENT_LANGUAGE, COL_POSSIBILITIES[0]])
+            row[column] = random_row(rng)[column]
+    return rows
+
+
+def normalized(aggregates):
+    """
+    Zawartość agregatów niezależna od kolejności dopisywania elementów.
+    """
+    possibilities = {
+        prefix: (
+            data['Polski'], data['Zagraniczny'],
+            {
+                full_str: (
+                    item['Polski'], item['Zagraniczny'],
+                    sorted(
+                        (r.email, r.company, r.subsegment)
+                        for r in aggregates.contacts.resolve(item['entries'])
+                    ),
+                )
+                for full_str, item in data['subitems'].items()
+            },
+        )
+        for prefix, data in aggregates.possibilities.items()
+    }
+    clients = {
+        group: sorted((c['email'], c['company'], c['language']) for c in items)
+        for group, items in aggregates.potential_clients.items()
+    }
+    index = {
+        (segment, subsegment): (
+            sorted(aggregates.segment_index.emails(segment, subsegment)),
+            sorted((p['email'], p['company']) for p in aggregates.segment_index.pairs(segment, subsegment)),
+        )
+        for segment in SEGMENTS + [''] for subsegment in ('Polski', 'Zagraniczny', '', 'Polski ')
+    }
+    return {
+        'segments': aggregates.segments,
+        'possibilities': possibilities,
+        'potential_clients': clients,
+        'email_language': aggregates.email_language,
+        'segment_index': index,
+    }
+
+
+def test_incremental_matches_full_rebuild():
+    rng = random.Random(1234)
+    rows = [random_row(rng) for _ in range(60)]
+    snapshot = SheetSnapshot(ColumnarSheet.from_rows(rows))
+    snapshot.derive('aggregates', lambda s: build_aggregates(s, SEGMENTS))
+
+    incremental_steps = 0
+    for _ in range(300):
+        rows = mutate(rng, rows)
+        sheet = ColumnarSheet.from_rows(rows)
+        previous, snapshot = snapshot, SheetSnapshot(sheet)
+        snapshot.previous = previous
+        diff = diff_rows(previous.rows.row_hashes(), sheet.row_hashes())
+        incremental_steps += 0 < diff.size
+        aggregates = snapshot.derive('aggregates', lambda s: build_aggregates(s, SEGMENTS))
+        assert normalized(aggregates) == normalized(SheetAggregates(sheet, SEGMENTS))
+    assert incremental_steps > 200
+
+
+def test_edit_of_unrelated_cell_keeps_language_of_last_row():
+    first, last = [''] * ROW_WIDTH, [''] * ROW_WIDTH
+    for row, subsegment in ((first, 'Polski'), (last, 'Zagraniczny')):
+        row[COL_SEGMENT] = 'Meble'
+        row[COL_EMAIL] = 'a@x.pl'
+        row[COL_SUBSEGMENT] = subsegment
+    # Pozostałe wiersze tylko po to, żeby zmiana nie przekroczyła progu pełnego przeliczenia
+    filler = [[''] * ROW_WIDTH for _ in range(20)]
+    old = SheetSnapshot(ColumnarSheet.from_rows([first, last] + filler))
+    aggregates = build_aggregates(old, SEGMENTS)
+    old.derive('aggregates', lambda s: aggregates)
+
+    edited = list(first)
+    edited[COL_COMPANY] = 'Alfa'
+    new = SheetSnapshot(ColumnarSheet.from_rows([edited, last] + filler))
+    new.previous = old
+    updated = build_aggregates(new, SEGMENTS)
+
+    assert updated.email_language == {'a@x.pl': 'Zagraniczny'}
+    assert aggregates.email_language == {'a@x.pl': 'Zagraniczny'}
+
+
+def test_contact_table_is_rebuilt_when_bloated(monkeypatch):
+    monkeypatch.setattr(sheet_index, 'CONTACT_TABLE_MIN_SIZE', 4)
+    rows = [[''] * ROW_WIDTH for _ in range(20)]
+    rows[0][COL_EMAIL] = 'a@x.pl'
+    rows[0][COL_SUBSEGMENT] = 'Polski'
+    rows[0][COL_POSSIBILITIES[0]] = 'Magazyn'
+    snapshot = SheetSnapshot(ColumnarSheet.from_rows(rows))
+    tables = {id(snapshot.derive('aggregates', lambda s: build_aggregates(s, SEGMENTS)).contacts)}
+
+    for step in range(40):
+        # Każda zmiana firmy to nowy kontakt; stary zostaje we współdzielonej tabeli
+        rows[0][COL_COMPANY] = f"Firma {step}"
+        previous, snapshot = snapshot, SheetSnapshot(ColumnarSheet.from_rows(rows))
+        snapshot.previous = previous
+        contacts = snapshot.derive('aggregates', lambda s: build_aggregates(s, SEGMENTS)).contacts
+        tables.add(id(contacts))
+        assert len(contacts) <= sheet_index.CONTACT_TABLE_MAX_GROWTH * 4 + 1
+    assert len(tables) > 1
+
+
+def test_diff_rows_ignores_moved_rows():
+    diff = diff_rows([1, 2, 3, 2], [2, 3, 9, 1])
+    assert diff.deleted == [3]
+    assert diff.inserted == [2]
+    assert diff.changed == 0
+    assert diff.size == 2
+
+
+def test_members_pages_in_list_order():
+    rows = [[''] * ROW_WIDTH for _ in range(5)]
+    for index, row in enumerate(rows):
+        row[COL_SEGMENT] = 'Meble'
+        row[COL_EMAIL] = f"k{index}@x.pl"
+        row[COL_COMPANY] = f"Firma {index}"
+        row[COL_SUBSEGMENT] = 'Zagraniczny' if index == 0 else 'Polski'
+        row[COL_POSSIBILITIES[0]] = 'Transport [[[PL]]]'
+    rows[4][COL_CLIENT_EMAIL] = 'c@x.pl'
+    rows[4][COL_CLIENT_COMPANY] = 'Delta'
+    rows[4][COL_CLIENT_GROUP] = 'A'
+    rows[4][COL_CLIENT_LANGUAGE] = 'Polski'
+    aggregates = SheetAggregates(ColumnarSheet.from_rows(rows), SEGMENTS)
+
+    total, page = aggregates.members('segments', 'Meble', offset=3, limit=5)
+    assert total == 5
+    assert page == [('k4@x.pl', 'Firma 4', 'Polski'), ('k0@x.pl', 'Firma 0', 'Zagraniczny')]
+    total, page = aggregates.members('subitems', 'Transport [[[PL]]]', limit=2)
+    assert (total, page) == (5, [('k0@x.pl', 'Firma 0', 'Zagraniczny'), ('k1@x.pl', 'Firma 1', 'Polski')])
+    assert aggregates.members('groups', 'A') == (1, [('c@x.pl', 'Delta', 'Polski')])
+    assert aggregates.members('groups', 'brak') == (0, [])
+    assert aggregates.members('inne', 'A') == (0, [])
+
+
+def _totals(items):
+    return [(key, data['Polski'] + data['Zagraniczny']) for key, data in items]
+
+
+def _is_display_order(possibilities):
+    """
+    Prefiksy pogrupowane po pierwszym słowie, grupy i prefiksy w grupie
+    malejąco po sumie (przy remisach kolejność może być dowolna).
+    """
+    groups = []
+    for prefix, total in _totals(possibilities):
+        word = prefix.split()[0] if prefix.split() else ''
+        if not groups or groups[-1][0] != word:
+            groups.append((word, []))
+        groups[-1][1].append(total)
+    words = [word for word, _ in groups]
+    heads = [totals[0] for _, totals in groups]
+    return (
+        len(words) == len(set(words))
+        and all(totals == sorted(totals, reverse=True) for _, totals in groups)
+        and heads == sorted(heads, reverse=True)
+    )
+
+
+def test_incremental_ordering_matches_full_ordering():
+    rng = random.Random(99)
+    rows = [random_row(rng) for _ in range(80)]
+    snapshot = SheetSnapshot(ColumnarSheet.from_rows(rows))
+    build_ordering(snapshot.derive('aggregates', lambda s: build_aggregates(s, SEGMENTS)))
+
+    for _ in range(100):
+        rows = mutate(rng, rows)
+        previous, snapshot = snapshot, SheetSnapshot(ColumnarSheet.from_rows(rows))
+        snapshot.previous = previous
+        ordering = build_ordering(snapshot.derive('aggregates', lambda s: build_aggregates(s, SEGMENTS)))
+        full = build_ordering(SheetAggregates(snapshot.rows, SEGMENTS))
+
+        assert sorted(_totals(ordering.segments)) == sorted(_totals(full.segments))
+        assert [t for _, t in _totals(ordering.segments)] == [t for _, t in _totals(full.segments)]
+        assert sorted(_totals(ordering.possibilities)) == sorted(_totals(full.possibilities))
+        assert _is_display_order(ordering.possibilities)
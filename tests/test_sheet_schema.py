@@ -0,0 +1,49 @@
+# test_sheet_schema.py
+from sheet_columns import COL_EMAIL, COL_SEGMENT, COL_POSSIBILITIES, ColumnarSheet
+from sheet_schema import DEFAULT_SCHEMA, SchemaTracker, SheetSchema, header_names_from_env
+
+
+def test_header_names_from_env():
+    environ = {'SHEET_HEADER_EMAIL': ' E-mail ', 'SHEET_HEADER_SEGMENT': '', 'INNE': 'x'}
+    assert header_names_from_env(environ) == {'email': 'E-mail'}
+
+
+def test_from_header_moves_named_fields_and_keeps_the_rest():
+    header = [''] * 60
+    header[3] = 'E-MAIL'
+    header[40], header[41] = 'Możliwość 1', 'Możliwość 2'
+    schema = SheetSchema.from_header(header, {'email': 'e-mail', 'possibilities': 'możliwość'})
+
+    assert schema.mapping[COL_EMAIL] == 3
+    assert schema.mapping[COL_SEGMENT] == COL_SEGMENT
+    assert [schema.mapping.get(c) for c in COL_POSSIBILITIES[:2]] == [40, 41]
+    # Brakujące kolumny możliwości zostają puste
+    assert COL_POSSIBILITIES[2] not in schema.mapping
+
+
+def test_missing_header_falls_back_to_default_columns():
+    assert SheetSchema.from_header(['x'], {'email': 'E-mail'}) == DEFAULT_SCHEMA
+
+
+def test_rows_are_read_through_the_schema():
+    header = [''] * 60
+    header[3] = 'E-mail'
+    schema = SheetSchema.from_header(header, {'email': 'E-mail'})
+    row = [''] * 60
+    row[3] = 'a@x.pl'
+    row[COL_EMAIL] = 'nie ten'
+    sheet = ColumnarSheet.from_rows([row], schema=schema)
+    assert sheet[0][COL_EMAIL] == 'a@x.pl'
+
+    column_values = schema.remap_columns({3: ['a@x.pl']})
+    assert ColumnarSheet.from_columns(column_values)[0][COL_EMAIL] == 'a@x.pl'
+
+
+def test_tracker_reports_layout_changes_only():
+    tracker = SchemaTracker({'email': 'E-mail'})
+    header = [''] * 60
+    header[3] = 'E-mail'
+    assert tracker.uses_header
+    assert tracker.update(header)
+    assert not tracker.update(list(header))
+    assert tracker.schema.mapping[COL_EMAIL] == 3